@@ -0,0 +1,45 @@
+import argparse
+from os.path import join, dirname
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+# The observations of each size are spread over this many seconds, so the last 10 minutes analyzed by the window
+# stages (usage, hurst, quality and analyzer) always hold half of them
+DEFAULT_DURATION = 1200
+DEFAULT_HURST_DATA_PATH = join(dirname(dirname(__file__)), 'tests', 'test_hurst_data.json')
+DEFAULT_HURST_LENGTHS = [512, 1024, 8192]
+
+
+def parse_args(raw_args=None):
+    parser = argparse.ArgumentParser(description='Benchmark suite for the analysis pipeline of the tix-time-processor. '
+                                                 'Every benchmark runs over deterministic synthetic observations of '
+                                                 'each size, and the timings are written as JSON so they can be '
+                                                 'compared between commits.')
+    parser.add_argument('--sizes', '-s', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help='The amounts of observations to benchmark. By default 1000 10000 100000 1000000.')
+    parser.add_argument('--benchmarks', '-b', nargs='+', default=None,
+                        help='The benchmarks to run. By default all of them.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='The amount of times each benchmark is run. By default 3.')
+    parser.add_argument('--congestion', type=float, default=0.1,
+                        help='Fraction of congested observations. By default 0.1.')
+    parser.add_argument('--clock-drift', type=float, default=20.0,
+                        help='Drift between the client and the server clocks, in PPM. By default 20.')
+    parser.add_argument('--gaps', type=int, default=0,
+                        help='Amount of gaps in the observations. By default 0.')
+    parser.add_argument('--observations-per-second', type=float, default=None,
+                        help='Rate of the observations. By default the one that spreads each size over '
+                             '{} seconds.'.format(DEFAULT_DURATION))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic observations generator. By default 0.')
+    parser.add_argument('--hurst-data', action='store', default=DEFAULT_HURST_DATA_PATH, type=str,
+                        help='The path of the JSON sequences the Hurst estimators are run over. By default the ones '
+                             'of the tests. If empty, the Hurst estimators are not benchmarked.')
+    parser.add_argument('--hurst-lengths', nargs='+', type=int, default=DEFAULT_HURST_LENGTHS,
+                        help='The lengths of the sequences the Hurst estimators are run over. '
+                             'By default 512 1024 8192.')
+    parser.add_argument('--output', '-o', action='store', default=None, type=str,
+                        help='The path of the JSON output file. By default the results are printed.')
+    parser.add_argument('--compare', '-c', action='store', default=None, type=str,
+                        help='The path of the JSON output of a previous run to compare the results against.')
+    args = parser.parse_args(raw_args)
+    return args
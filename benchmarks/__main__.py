@@ -0,0 +1,33 @@
+import json
+import logging
+
+from benchmarks import parse_args
+from benchmarks.suite import run_benchmarks, compare_results, load_hurst_sequences, run_hurst_estimators
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logger.debug(args)
+    benchmark_results = run_benchmarks(args.sizes,
+                                       benchmark_names=args.benchmarks,
+                                       repeat=args.repeat,
+                                       congestion=args.congestion,
+                                       clock_drift=args.clock_drift,
+                                       gaps=args.gaps,
+                                       observations_per_second=args.observations_per_second,
+                                       seed=args.seed)
+    if args.hurst_data:
+        benchmark_results['hurst_estimators'] = run_hurst_estimators(load_hurst_sequences(args.hurst_data),
+                                                                     lengths=args.hurst_lengths,
+                                                                     repeat=args.repeat)
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            benchmark_results = compare_results(benchmark_results, json.load(baseline_file))
+    if args.output is None:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
+        logger.info("Benchmark results written to {}".format(args.output))
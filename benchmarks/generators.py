@@ -0,0 +1,51 @@
+import numpy
+
+from processor.reports import ObservationBatch, SerializedObservation
+
+DEFAULT_START_TIMESTAMP = 1500000000
+NANOS_IN_A_SECOND = 10 ** 9
+NANOS_IN_A_MILLI = 10 ** 6
+
+
+def generate_observations(size, congestion=0.1, clock_drift=0.0, gaps=0, seed=0,
+                          observations_per_second=1.0, gap_duration=360,
+                          start_timestamp=DEFAULT_START_TIMESTAMP):
+    """
+    Generates a deterministic ObservationBatch of synthetic short packet observations.
+
+    :param size: amount of observations
+    :param congestion: fraction, between 0 and 1, of the observations delayed by queueing in both directions
+    :param clock_drift: drift of the server clock against the client clock, in parts per million
+    :param gaps: amount of periods without observations
+    :param seed: seed of the random generator, the same seed always yields the same observations
+    :param observations_per_second: rate of the observations outside the gaps
+    :param gap_duration: duration of each gap, in seconds
+    :param start_timestamp: day_timestamp of the first observation
+    :return: ObservationBatch sorted by day_timestamp
+    """
+    random_state = numpy.random.RandomState(seed)
+    elapsed_nanos = numpy.arange(size, dtype=numpy.int64) * int(NANOS_IN_A_SECOND / observations_per_second)
+    if gaps > 0:
+        gaps_positions = numpy.sort(random_state.choice(numpy.arange(1, max(size, 2)), size=gaps))
+        gaps_offsets = numpy.zeros(size, dtype=numpy.int64)
+        for gap_position in gaps_positions:
+            gaps_offsets[gap_position:] += gap_duration * NANOS_IN_A_SECOND
+        elapsed_nanos += gaps_offsets
+    # One way delays: a fixed propagation time plus an exponential jitter, and queueing for the congested ones
+    upstream_delay = 5 * NANOS_IN_A_MILLI + random_state.exponential(0.2 * NANOS_IN_A_MILLI, size)
+    downstream_delay = 5 * NANOS_IN_A_MILLI + random_state.exponential(0.2 * NANOS_IN_A_MILLI, size)
+    congested = random_state.random_sample(size) < congestion
+    upstream_delay[congested] += random_state.exponential(20 * NANOS_IN_A_MILLI, congested.sum())
+    downstream_delay[congested] += random_state.exponential(20 * NANOS_IN_A_MILLI, congested.sum())
+    processing_time = random_state.randint(10 ** 3, 10 ** 5, size)
+    # Offset of the server clock against the client clock
+    phi = 3 * NANOS_IN_A_SECOND + elapsed_nanos * clock_drift * 1e-6
+    records = numpy.empty(size, dtype=SerializedObservation.dtype)
+    records['day_timestamp'] = start_timestamp + elapsed_nanos // NANOS_IN_A_SECOND
+    records['type_identifier'] = b'S'
+    records['packet_size'] = 64
+    records['initial_timestamp'] = elapsed_nanos
+    records['reception_timestamp'] = (elapsed_nanos + upstream_delay + phi).astype(numpy.int64)
+    records['sent_timestamp'] = records['reception_timestamp'] + processing_time
+    records['final_timestamp'] = (records['sent_timestamp'] - phi + downstream_delay).astype(numpy.int64)
+    return ObservationBatch(records)
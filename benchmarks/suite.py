@@ -0,0 +1,236 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy
+
+from benchmarks import DEFAULT_DURATION, DEFAULT_HURST_DATA_PATH, DEFAULT_HURST_LENGTHS
+from benchmarks.generators import generate_observations
+from processor import analysis, hurst, reports
+
+
+class BenchmarkFixture:
+    """
+    Inputs of every stage of the analysis, computed once per size so each benchmark only times its own stage.
+    """
+    def __init__(self, observations):
+        self.observations = observations
+        self.message = reports.serialize_observations(observations)
+        self.analyzer = analysis.Analyzer(observations)
+        self.short_observations = self.analyzer.observations
+        self.meaningful_observations = self.analyzer.meaningful_observations
+        self.clock_fixer = self.analyzer.clock_fixer
+        self.hurst_calculator = self.analyzer.hurst_calculator
+
+
+def benchmark_deserialize_observations(fixture):
+    return lambda: reports.deserialize_observations(fixture.message)
+
+
+def benchmark_fixed_size_bin_histogram(fixture):
+    return lambda: analysis.FixedSizeBinHistogram(fixture.short_observations, analysis.observation_rtt_key_function)
+
+
+def benchmark_fixed_size_bin_array_histogram(fixture):
+    return lambda: analysis.FixedSizeBinArrayHistogram(fixture.short_observations,
+                                                       analysis.observation_rtt_key_function)
+
+
+def benchmark_clock_fixer_phi_function(fixture):
+    day_timestamps = fixture.short_observations.day_timestamp.tolist()
+    phi_function = fixture.clock_fixer.phi_function
+    return lambda: [phi_function(day_timestamp) for day_timestamp in day_timestamps]
+
+
+def benchmark_clock_fixer_phi_values(fixture):
+    return lambda: fixture.clock_fixer.phi_values(fixture.short_observations.day_timestamp)
+
+
+def benchmark_usage_calculator(fixture):
+    return lambda: analysis.UsageCalculator(fixture.meaningful_observations, fixture.clock_fixer)
+
+
+def benchmark_hurst_calculator(fixture):
+    return lambda: analysis.HurstCalculator(fixture.meaningful_observations, fixture.clock_fixer)
+
+
+def benchmark_online_wavelet_hurst(fixture):
+    upstream_times = analysis.upstream_time_function(fixture.short_observations, fixture.clock_fixer.phi_values)
+
+    def slide_window():
+        estimator = hurst.OnlineWaveletHurst()
+        estimator.extend(upstream_times.tolist())
+        if estimator.is_ready:
+            estimator.hurst()
+    return slide_window
+
+
+def benchmark_rolling_rs(fixture):
+    upstream_times = analysis.upstream_time_function(fixture.short_observations, fixture.clock_fixer.phi_values)
+
+    def slide_window():
+        estimator = hurst.RollingRS()
+        for start in range(0, len(upstream_times), 60):
+            estimator.extend(upstream_times[start:start + 60])
+            if estimator.is_ready:
+                estimator.hurst()
+    return slide_window
+
+
+def benchmark_quality_calculator(fixture):
+    return lambda: analysis.QualityCalculator(fixture.meaningful_observations, fixture.hurst_calculator,
+                                              fixture.clock_fixer)
+
+
+def benchmark_quality_calculator_per_minute(fixture):
+    return lambda: analysis.QualityCalculator(fixture.meaningful_observations, fixture.hurst_calculator,
+                                              fixture.clock_fixer, grouped=False)
+
+
+def benchmark_analyzer(fixture):
+    return lambda: analysis.Analyzer(fixture.observations).get_results()
+
+
+BENCHMARKS = OrderedDict([
+    ('deserialize_observations', benchmark_deserialize_observations),
+    ('fixed_size_bin_histogram', benchmark_fixed_size_bin_histogram),
+    ('fixed_size_bin_array_histogram', benchmark_fixed_size_bin_array_histogram),
+    ('clock_fixer_phi_function', benchmark_clock_fixer_phi_function),
+    ('clock_fixer_phi_values', benchmark_clock_fixer_phi_values),
+    ('usage_calculator', benchmark_usage_calculator),
+    ('hurst_calculator', benchmark_hurst_calculator),
+    ('online_wavelet_hurst', benchmark_online_wavelet_hurst),
+    ('rolling_rs', benchmark_rolling_rs),
+    ('quality_calculator', benchmark_quality_calculator),
+    ('quality_calculator_per_minute', benchmark_quality_calculator_per_minute),
+    ('analyzer', benchmark_analyzer),
+])
+
+
+def time_function(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, benchmark_names=None, repeat=3, **generator_params):
+    """
+    Runs the benchmarks over synthetic observations of each size.
+
+    :param sizes: amounts of observations
+    :param benchmark_names: names of the benchmarks to run, all of them if None
+    :param repeat: amount of times each benchmark is timed
+    :param generator_params: extra parameters of generate_observations. Unless observations_per_second is given,
+    each size is spread over DEFAULT_DURATION seconds, so the window analyzed by the window stages grows with it
+    :return: dict with the metadata of the run and one result per benchmark and size
+    """
+    if benchmark_names is None:
+        benchmark_names = list(BENCHMARKS.keys())
+    unknown_benchmarks = set(benchmark_names) - set(BENCHMARKS.keys())
+    if unknown_benchmarks:
+        raise ValueError('Unknown benchmarks: {}'.format(', '.join(sorted(unknown_benchmarks))))
+    results = []
+    for size in sizes:
+        size_generator_params = dict(generator_params)
+        if size_generator_params.get('observations_per_second') is None:
+            size_generator_params['observations_per_second'] = size / DEFAULT_DURATION
+        fixture = BenchmarkFixture(generate_observations(size, **size_generator_params))
+        for benchmark_name in benchmark_names:
+            times = time_function(BENCHMARKS[benchmark_name](fixture), repeat)
+            results.append({
+                'benchmark': benchmark_name,
+                'size': size,
+                'window_size': len(fixture.meaningful_observations),
+                'times': times,
+                'min': min(times),
+                'median': statistics.median(times)
+            })
+    return {
+        'metadata': {
+            'git_commit': get_git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'repeat': repeat,
+            'generator': generator_params
+        },
+        'results': results
+    }
+
+
+def load_hurst_sequences(hurst_data_path=DEFAULT_HURST_DATA_PATH):
+    with open(hurst_data_path) as hurst_data_file:
+        return json.load(hurst_data_file)
+
+
+def run_hurst_estimators(sequences, lengths=DEFAULT_HURST_LENGTHS, repeat=3):
+    """
+    Times every estimator of the Hurst estimators registry over the first values of each sequence, and
+    measures how far its estimations are from the ones of the reference pair, the mean of the wavelet and
+    R/S estimations.
+
+    :param sequences: list of dicts with the 'values' of each sequence, like the ones of test_hurst_data.json
+    :param lengths: amounts of values of the sequences to estimate over
+    :param repeat: amount of times each estimator is timed
+    :return: list with one result per estimator and length. The times are of a single estimation, averaged
+    over the sequences
+    """
+    results = []
+    for length in lengths:
+        series = [sequence['values'][:length] for sequence in sequences]
+        references = [(hurst.wavelet(values) + hurst.rs(values)) / 2 for values in series]
+        for estimator_name, estimator in hurst.ESTIMATORS.items():
+            times = [sequences_time / len(series)
+                     for sequences_time in time_function(lambda: [estimator.function(values) for values in series],
+                                                         repeat)]
+            estimations = [float(estimator.function(values)) for values in series]
+            differences = [abs(estimation - reference) for estimation, reference in zip(estimations, references)]
+            results.append({
+                'estimator': estimator_name,
+                'cost_class': estimator.cost_class,
+                'length': length,
+                'times': times,
+                'min': min(times),
+                'median': statistics.median(times),
+                'estimations': estimations,
+                'references': [float(reference) for reference in references],
+                'mean_absolute_difference': statistics.mean(differences),
+                'max_absolute_difference': max(differences)
+            })
+    return results
+
+
+def compare_results(benchmark_results, baseline_results):
+    """
+    Adds to each result the median of the same benchmark and size in the baseline, and the ratio between them.
+    A ratio greater than 1 means the benchmark got slower than in the baseline.
+    The results of the Hurst estimators are compared by estimator and length.
+    """
+    baseline_medians = {(result['benchmark'], result['size']): result['median']
+                        for result in baseline_results['results']}
+    for result in benchmark_results['results']:
+        baseline_median = baseline_medians.get((result['benchmark'], result['size']))
+        result['baseline_median'] = baseline_median
+        result['ratio'] = result['median'] / baseline_median if baseline_median else None
+    baseline_medians = {(result['estimator'], result['length']): result['median']
+                        for result in baseline_results.get('hurst_estimators', [])}
+    for result in benchmark_results.get('hurst_estimators', []):
+        baseline_median = baseline_medians.get((result['estimator'], result['length']))
+        result['baseline_median'] = baseline_median
+        result['ratio'] = result['median'] / baseline_median if baseline_median else None
+    benchmark_results['metadata']['baseline_git_commit'] = baseline_results['metadata'].get('git_commit')
+    return benchmark_results
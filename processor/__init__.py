@@ -5,6 +5,26 @@ from celery import Celery
 
 REPORTS_BASE_PATH = os.environ.get('TIX_REPORTS_BASE_PATH', '/tmp/reports')
 PROCESSING_PERIOD = int(os.environ.get('TIX_PROCESSING_PERIOD', '5'))
+REPORTS_CACHE = os.environ.get('TIX_REPORTS_CACHE') is not None
+PER_IP_WINDOWS = os.environ.get('TIX_PER_IP_WINDOWS') is not None
+CELERY_PROCESSING_MODE = 'celery'
+LOCAL_BATCH_PROCESSING_MODE = 'local-batch'
+WATCHER_PROCESSING_MODE = 'watcher'
+STREAMING_PROCESSING_MODE = 'streaming'
+PROCESSING_MODE = os.environ.get('TIX_PROCESSING_MODE', CELERY_PROCESSING_MODE)
+LOCAL_BATCH_WORKERS = int(os.environ.get('TIX_LOCAL_BATCH_WORKERS', os.cpu_count() or 1))
+LOCAL_BATCH_POST_THREADS = int(os.environ.get('TIX_LOCAL_BATCH_POST_THREADS', '4'))
+WATCHER_POLL_INTERVAL = float(os.environ.get('TIX_WATCHER_POLL_INTERVAL', '10'))
+STREAMING_STRIDE = int(os.environ.get('TIX_STREAMING_STRIDE', '60'))
+HURST_ESTIMATORS = [estimator.strip() for estimator in os.environ.get('TIX_HURST_ESTIMATORS', 'wavelet,rs').split(',')
+                    if estimator.strip()]
+REPLAY_CONCURRENCY = int(os.environ.get('TIX_REPLAY_CONCURRENCY', '4'))
+REPLAY_RATE = float(os.environ.get('TIX_REPLAY_RATE', '10'))
+METRICS_SINKS = [sink.strip() for sink in os.environ.get('TIX_METRICS_SINKS', '').split(',') if sink.strip()]
+METRICS_STATSD_HOST = os.environ.get('TIX_METRICS_STATSD_HOST', 'localhost')
+METRICS_STATSD_PORT = int(os.environ.get('TIX_METRICS_STATSD_PORT', '8125'))
+METRICS_PROMETHEUS_PATH = os.environ.get('TIX_METRICS_PROMETHEUS_PATH', '/tmp/tix-processor-{pid}.prom')
+PROFILE_DIR = os.environ.get('TIX_PROFILE_DIR') or None
 RABBITMQ_USER = os.environ.get('TIX_RABBITMQ_USER', 'guest')
 RABBITMQ_PASS = os.environ.get('TIX_RABBITMQ_PASS', 'guest')
 RABBITMQ_HOST = os.environ.get('TIX_RABBITMQ_HOST', 'localhost')
@@ -1,11 +1,16 @@
+from bisect import bisect_right
 from datetime import datetime, timedelta, timezone
 import logging
 from functools import partial
-from operator import attrgetter
 
 from math import floor, sqrt, log as log_function
 
+import numpy
+
+from processor import HURST_ESTIMATORS
 from processor import hurst
+from processor import metrics
+from processor.reports import ObservationBatch
 
 
 def observation_rtt_key_function(observation):
@@ -21,7 +26,15 @@ def downstream_time_function(observation, phi_function):
     return observation.final_timestamp - (observation.sent_timestamp + phi_function(observation.day_timestamp))
 
 
+def as_observation_batch(observations):
+    if isinstance(observations, ObservationBatch):
+        return observations
+    return ObservationBatch.from_observations(observations)
+
+
 def divide_observations_into_minutes(observations):
+    if isinstance(observations, ObservationBatch):
+        return divide_observation_batch_into_minutes(observations)
     observations_per_minute = {}
     for observation in observations:
         observation_datetime = datetime.fromtimestamp(observation.day_timestamp, timezone.utc)
@@ -32,20 +45,191 @@ def divide_observations_into_minutes(observations):
     return observations_per_minute
 
 
+def sort_minutes(minutes, is_sorted):
+    if is_sorted:
+        return numpy.arange(len(minutes))
+    return numpy.argsort(minutes, kind='mergesort')
+
+
+def divide_observation_batch_into_minutes(observations):
+    # Day timestamps are UTC seconds since the epoch, so the start of the minute can be computed arithmetically
+    minutes = observations.day_timestamp - observations.day_timestamp % 60
+    order = sort_minutes(minutes, observations.is_sorted)
+    unique_minutes, minutes_starts = numpy.unique(minutes[order], return_index=True)
+    minutes_ends = numpy.append(minutes_starts[1:], len(order))
+    observations_per_minute = {}
+    for minute, start, end in zip(unique_minutes.tolist(), minutes_starts, minutes_ends):
+        observations_per_minute[float(minute)] = observations[order[start:end]]
+    return observations_per_minute
+
+
+def calculate_mid_value(min_value, max_value):
+    return min_value + (max_value - min_value) // 2
+
+
+def calculate_probabilities_mode_and_threshold(bins_counts, bins_min_values, bins_max_values, alpha):
+    """
+    Calculates the probability of every bin of a histogram, its mode and its threshold.
+
+    :param bins_counts: amount of datapoints in each bin
+    :param bins_min_values: min value of each bin
+    :param bins_max_values: max value of each bin
+    :param alpha: weight of the first bin mid value in the threshold
+    :return: tuple with the list of probabilities, the mode and the threshold
+    """
+    total_datapoints = sum(bins_counts)
+    total_width = bins_max_values[-1] - bins_min_values[0]
+    probabilities = [(total_datapoints * total_width) / (count * (max_value - min_value))
+                     for count, min_value, max_value in zip(bins_counts, bins_min_values, bins_max_values)]
+    representative_bins = 2 * int(sqrt(len(bins_counts)))
+    representative_probabilities = probabilities[:representative_bins]
+    mode = max(representative_probabilities)
+    mode_index = representative_probabilities.index(mode)
+    mode_value = calculate_mid_value(bins_min_values[mode_index], bins_max_values[mode_index])
+    if representative_probabilities[0] == mode:
+        threshold = calculate_mid_value(bins_min_values[1], bins_max_values[1])
+    else:
+        threshold = mode_value + alpha * calculate_mid_value(bins_min_values[0], bins_max_values[0])
+    return probabilities, mode_value, threshold
+
+
+def calculate_grouped_modes_and_thresholds(sorted_keys, segments_starts, segments_counts, alpha):
+    """
+    Calculates the mode and threshold of a fixed size bin histogram for every segment of an array at once.
+    They are the same calculate_probabilities_mode_and_threshold gives for the keys of each segment.
+
+    :param sorted_keys: float keys, sorted within each segment
+    :param segments_starts: index of the first key of each segment
+    :param segments_counts: amount of keys in each segment
+    :param alpha: weight of the first bin mid value in the threshold
+    :return: tuple with the array of modes and the array of thresholds
+    """
+    segments = numpy.arange(len(segments_counts))
+    bins_qty = numpy.floor(numpy.sqrt(segments_counts)).astype(numpy.int64)
+    datapoints_per_bin = segments_counts // bins_qty
+    bins_segments = numpy.repeat(segments, bins_qty)
+    first_bins = numpy.cumsum(bins_qty) - bins_qty
+    last_bins = first_bins + bins_qty - 1
+    bins_indexes = numpy.arange(len(bins_segments)) - first_bins[bins_segments]
+    bins_starts = segments_starts[bins_segments] + bins_indexes * datapoints_per_bin[bins_segments]
+    bins_counts = datapoints_per_bin[bins_segments]
+    # If there still some keys left, they belong to the last bin of the segment
+    bins_counts[last_bins] += segments_counts - bins_qty * datapoints_per_bin
+    bins_min_values = sorted_keys[bins_starts]
+    bins_max_values = sorted_keys[bins_starts + bins_counts - 1]
+    bins_widths = bins_max_values - bins_min_values
+    if numpy.any(bins_widths == 0):
+        raise ZeroDivisionError('float division by zero')
+    bins_mid_values = bins_min_values + bins_widths // 2
+    total_widths = bins_max_values[last_bins] - bins_min_values[first_bins]
+    probabilities = (segments_counts[bins_segments] * total_widths[bins_segments]) / (bins_counts * bins_widths)
+    representative_bins = 2 * numpy.floor(numpy.sqrt(bins_qty)).astype(numpy.int64)
+    representative = bins_indexes < representative_bins[bins_segments]
+    modes_probabilities = numpy.maximum.reduceat(numpy.where(representative, probabilities, -numpy.inf), first_bins)
+    # The mode bin is the first representative bin with the highest probability of its segment
+    mode_candidates = numpy.flatnonzero(representative & (probabilities == modes_probabilities[bins_segments]))
+    _, first_candidates = numpy.unique(bins_segments[mode_candidates], return_index=True)
+    modes = bins_mid_values[mode_candidates[first_candidates]]
+    thresholds = numpy.where(probabilities[first_bins] == modes_probabilities,
+                             bins_mid_values[first_bins + 1],
+                             modes + alpha * bins_mid_values[first_bins])
+    return modes, thresholds
+
+
+def calculate_grouped_usages(times, segments_starts, segments_counts, alpha):
+    """
+    Calculates the usage of every segment of an array of upstream or downstream times at once.
+
+    :param times: float times, grouped by segment
+    :param segments_starts: index of the first time of each segment
+    :param segments_counts: amount of times in each segment
+    :param alpha: weight of the first bin mid value in the threshold
+    :return: array with the usage of each segment
+    """
+    segments = numpy.repeat(numpy.arange(len(segments_counts)), segments_counts)
+    sorted_times = times[numpy.lexsort((times, segments))]
+    modes, thresholds = calculate_grouped_modes_and_thresholds(sorted_times, segments_starts, segments_counts, alpha)
+    over_threshold = numpy.add.reduceat(times > thresholds[segments], segments_starts, dtype=numpy.int64)
+    over_mode = numpy.add.reduceat(times > modes[segments], segments_starts, dtype=numpy.int64)
+    if numpy.any(over_mode == 0):
+        raise ZeroDivisionError('division by zero')
+    return over_threshold / over_mode
+
+
+def calculate_minutes_usages(observations, phis, minimum_observations, alpha):
+    """
+    Calculates the upstream and downstream usage of every minute with at least minimum_observations
+    observations in a single vectorized pass. Each usage is the same UsageCalculator gives for the
+    observations of the minute.
+
+    :param observations: ObservationBatch
+    :param phis: phi value of each observation
+    :param minimum_observations: minimum amount of observations of the minutes to calculate
+    :param alpha: weight of the first bin mid value in the histograms thresholds
+    :return: tuple with the array of minutes and the arrays of upstream and downstream usages
+    """
+    minutes = observations.day_timestamp - observations.day_timestamp % 60
+    order = sort_minutes(minutes, observations.is_sorted)
+    unique_minutes, minutes_counts = numpy.unique(minutes[order], return_counts=True)
+    kept_minutes = minutes_counts >= minimum_observations
+    order = order[numpy.repeat(kept_minutes, minutes_counts)]
+    unique_minutes = unique_minutes[kept_minutes]
+    minutes_counts = minutes_counts[kept_minutes]
+    if len(unique_minutes) == 0:
+        return unique_minutes, numpy.empty(0), numpy.empty(0)
+    minutes_starts = numpy.cumsum(minutes_counts) - minutes_counts
+    phis = numpy.asarray(phis)[order]
+    upstream_times = (observations.reception_timestamp[order] + phis) - observations.initial_timestamp[order]
+    downstream_times = observations.final_timestamp[order] - (observations.sent_timestamp[order] + phis)
+    upstream_usages = calculate_grouped_usages(upstream_times, minutes_starts, minutes_counts, alpha)
+    downstream_usages = calculate_grouped_usages(downstream_times, minutes_starts, minutes_counts, alpha)
+    return unique_minutes, upstream_usages, downstream_usages
+
+
+def calculate_congestion(minutes_usages, effective_upstream_hurst, effective_downstream_hurst,
+                         congestion_threshold, hurst_congestion_threshold):
+    """
+    Counts the congested minutes in each direction.
+
+    :param minutes_usages: dict with the (upstream_usage, downstream_usage) tuple of each minute
+    :return: tuple with the amount of upstream and downstream congested minutes
+    """
+    upstream_congestion = 0
+    downstream_congestion = 0
+    for upstream_usage, downstream_usage in minutes_usages.values():
+        if upstream_usage < congestion_threshold \
+                and effective_upstream_hurst > hurst_congestion_threshold:
+            upstream_congestion += 1
+        if downstream_usage < congestion_threshold \
+                and effective_downstream_hurst > hurst_congestion_threshold:
+            downstream_congestion += 1
+    return upstream_congestion, downstream_congestion
+
+
 class Bin:
     def __init__(self, data, characterization_function):
-        self.data = list(data)
+        if isinstance(data, ObservationBatch):
+            self.data = data
+        else:
+            self.data = list(data)
         self.characterization_function = characterization_function
 
     def update(self, new_data):
-        self.data.extend(list(new_data))
+        if isinstance(self.data, ObservationBatch):
+            self.data = ObservationBatch.concatenate([self.data, new_data])
+        else:
+            self.data.extend(list(new_data))
 
     @property
     def max_value(self):
+        if isinstance(self.data, ObservationBatch):
+            return self.characterization_function(self.data).max().item()
         return self.characterization_function(max(self.data, key=self.characterization_function))
 
     @property
     def min_value(self):
+        if isinstance(self.data, ObservationBatch):
+            return self.characterization_function(self.data).min().item()
         return self.characterization_function(min(self.data, key=self.characterization_function))
 
     @property
@@ -54,7 +238,7 @@ class Bin:
 
     @property
     def mid_value(self):
-        return self.min_value + self.width // 2
+        return calculate_mid_value(self.min_value, self.max_value)
 
 
 class FixedSizeBinHistogram:
@@ -63,7 +247,10 @@ class FixedSizeBinHistogram:
     def __init__(self, data, characterization_function, alpha=DEFAULT_ALPHA):
         self.characterization_function = characterization_function
         self.alpha = alpha
-        self.data = sorted(data, key=self.characterization_function)
+        if isinstance(data, ObservationBatch):
+            self.data = data[numpy.argsort(self.characterization_function(data), kind='mergesort')]
+        else:
+            self.data = sorted(data, key=self.characterization_function)
         self.bins = list()
         self._generate_histogram()
         self.bins_probabilities, self.mode, self.threshold = self._generate_probabilities_mode_and_threshold()
@@ -83,25 +270,98 @@ class FixedSizeBinHistogram:
         if threshold < len(self.data):
             self.bins[-1].update(self.data[threshold:])
 
-    def _generate_bins_probabilities(self):
-        total_datapoints = sum([len(bin_.data) for bin_ in self.bins])
-        total_width = self.bins[-1].max_value - self.bins[0].min_value
-        probabilities = [(total_datapoints * total_width) / (len(bin_.data) * bin_.width)
-                         for bin_ in self.bins]
-        return list(probabilities)
-
     def _generate_probabilities_mode_and_threshold(self):
-        probabilities = self._generate_bins_probabilities()
-        representative_bins = 2 * int(sqrt(len(self.bins)))
-        representative_probabilities = probabilities[:representative_bins]
-        mode = max(representative_probabilities)
-        mode_index = representative_probabilities.index(mode)
-        mode_value = self.bins[mode_index].mid_value
-        if representative_probabilities[0] == mode:
-            threshold = self.bins[1].mid_value
-        else:
-            threshold = mode_value + self.alpha * self.bins[0].mid_value
-        return probabilities, mode_value, threshold
+        return calculate_probabilities_mode_and_threshold([len(bin_.data) for bin_ in self.bins],
+                                                          [bin_.min_value for bin_ in self.bins],
+                                                          [bin_.max_value for bin_ in self.bins],
+                                                          self.alpha)
+
+
+class ArrayBin:
+    """
+    Bin of a FixedSizeBinArrayHistogram. Its statistics are read from the histogram arrays, and its data is
+    only selected from the histogram data when it is accessed.
+    """
+    def __init__(self, histogram, index):
+        self.histogram = histogram
+        self.index = index
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.histogram.bin_data(self.index)
+        return self._data
+
+    @property
+    def max_value(self):
+        return self.histogram.bins_max_values[self.index]
+
+    @property
+    def min_value(self):
+        return self.histogram.bins_min_values[self.index]
+
+    @property
+    def width(self):
+        return self.max_value - self.min_value
+
+    @property
+    def mid_value(self):
+        return self.histogram.bins_mid_values[self.index]
+
+
+class FixedSizeBinArrayHistogram:
+    """
+    Same histogram as FixedSizeBinHistogram, for an ObservationBatch and a vectorized characterization function.
+    The key values are computed once and only they get sorted, the observations are not reordered.
+    The count, min, max and mid value of every bin are kept in lists.
+    """
+    DEFAULT_ALPHA = FixedSizeBinHistogram.DEFAULT_ALPHA
+
+    def __init__(self, data, characterization_function, alpha=DEFAULT_ALPHA):
+        self.characterization_function = characterization_function
+        self.alpha = alpha
+        self.data = as_observation_batch(data)
+        self.keys = numpy.asarray(self.characterization_function(self.data))
+        self.sorted_keys = numpy.sort(self.keys, kind='mergesort')
+        self.bins_starts, self.bins_counts = self._generate_histogram()
+        bins_ends = [start + count for start, count in zip(self.bins_starts, self.bins_counts)]
+        self.bins_min_values = self.sorted_keys[self.bins_starts].tolist()
+        self.bins_max_values = self.sorted_keys[numpy.array(bins_ends) - 1].tolist()
+        self.bins_mid_values = [calculate_mid_value(min_value, max_value)
+                                for min_value, max_value in zip(self.bins_min_values, self.bins_max_values)]
+        self.bins = [ArrayBin(self, index) for index in range(len(self.bins_counts))]
+        self.bins_probabilities, self.mode, self.threshold = \
+            calculate_probabilities_mode_and_threshold(self.bins_counts,
+                                                       self.bins_min_values,
+                                                       self.bins_max_values,
+                                                       self.alpha)
+
+    def _generate_histogram(self):
+        bins_qty = int(floor(sqrt(len(self.data))))
+        datapoints_per_bin = len(self.data) // bins_qty
+        bins_starts = [index * datapoints_per_bin for index in range(bins_qty)]
+        bins_counts = [datapoints_per_bin] * bins_qty
+        # If there still some observations left, they belong to the last bin
+        bins_counts[-1] += len(self.data) - bins_qty * datapoints_per_bin
+        return bins_starts, bins_counts
+
+    def bin_data(self, index):
+        """
+        Selects the observations of a bin, in the same order a stable sort by key would leave them.
+
+        :param index: index of the bin
+        :return: ObservationBatch
+        """
+        start = self.bins_starts[index]
+        count = self.bins_counts[index]
+        min_value = self.sorted_keys[start]
+        max_value = self.sorted_keys[start + count - 1]
+        candidates = numpy.flatnonzero((self.keys >= min_value) & (self.keys <= max_value))
+        candidates = candidates[numpy.argsort(self.keys[candidates], kind='mergesort')]
+        # The candidates are sorted as in the whole sorted data, starting at the first key equal to min_value
+        offset = start - numpy.searchsorted(self.sorted_keys, min_value, side='left')
+        return self.data[candidates[offset:offset + count]]
 
 
 class ClockFixer:
@@ -109,20 +369,33 @@ class ClockFixer:
     DOWNSTREAM_SERIALIZATION_TIME = 15 * (10 ** 3)  # 15 micro
 
     def __init__(self, observations, tau):
-        self.observations = sorted(observations,
-                                   key=lambda o: o.day_timestamp)
+        self.observations = as_observation_batch(observations).sorted_by_day_timestamp()
+        self.timestamps = self.observations.day_timestamp.astype(numpy.int64)
+        self.phis = numpy.asarray(self._calculate_observation_phi(self.observations), dtype=numpy.float64)
+        self.slopes, self.intercepts = self._calculate_phi_table()
+        # Plain lists are faster than arrays for the scalar lookups done by phi_function
+        self._timestamps_list = self.timestamps.tolist()
+        self._phis_list = self.phis.tolist()
+        self._slopes_list = self.slopes.tolist()
+        self._intercepts_list = self.intercepts.tolist()
+
+    def _calculate_phi_table(self):
+        # Line between each observation and the next one. Segments between observations with the same
+        # day_timestamp are never used, since _between_obs always picks the last of them.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            slopes = (self.phis[:-1] - self.phis[1:]) / (self.timestamps[:-1] - self.timestamps[1:])
+        intercepts = self.phis[:-1] - self.timestamps[:-1] * slopes
+        return slopes, intercepts
 
     def _between_obs(self, day_timestamp):
         obs = tuple()
-        if day_timestamp < self.observations[0].day_timestamp:
+        if day_timestamp < self._timestamps_list[0]:
             obs = (None, self.observations[0])
-        elif self.observations[-1].day_timestamp <= day_timestamp:
+        elif self._timestamps_list[-1] <= day_timestamp:
             obs = (self.observations[-1], None)
         else:
-            for index in range(len(self.observations) - 1):
-                if self.observations[index].day_timestamp <= day_timestamp < self.observations[index + 1].day_timestamp:
-                    obs = (self.observations[index], self.observations[index + 1])
-                    break
+            index = bisect_right(self._timestamps_list, day_timestamp) - 1
+            obs = (self.observations[index], self.observations[index + 1])
         return obs
 
     def _calculate_observation_phi(self, observation):
@@ -133,18 +406,31 @@ class ClockFixer:
                  (observation.final_timestamp - observation.sent_timestamp)) / 2)
 
     def _base_phi_function(self, x):
-        obs_before, obs_after = self._between_obs(x)
-        phi_before = self._calculate_observation_phi(obs_before)
-        phi_after = self._calculate_observation_phi(obs_after)
-        slope = 0
-        if phi_before is not None and phi_after is not None:
-            slope = (phi_before - phi_after) / (obs_before.day_timestamp - obs_after.day_timestamp)
-        intercept = 0
-        if phi_before is None:
-            intercept = phi_after - obs_after.day_timestamp * slope
-        else:
-            intercept = phi_before - obs_before.day_timestamp * slope
-        return x * slope + intercept
+        if x < self._timestamps_list[0]:
+            return self._phis_list[0]
+        if self._timestamps_list[-1] <= x:
+            return self._phis_list[-1]
+        index = bisect_right(self._timestamps_list, x) - 1
+        return x * self._slopes_list[index] + self._intercepts_list[index]
+
+    def phi_values(self, day_timestamps):
+        """
+        Evaluates the phi function for a whole array of day_timestamps at once.
+
+        :param day_timestamps: array-like of day_timestamps
+        :return: numpy array with the phi value of each day_timestamp
+        """
+        day_timestamps = numpy.asarray(day_timestamps)
+        values = numpy.empty(day_timestamps.shape, dtype=numpy.float64)
+        indexes = numpy.searchsorted(self.timestamps, day_timestamps, side='right') - 1
+        before_first = indexes < 0
+        after_last = indexes >= len(self.timestamps) - 1
+        between = ~(before_first | after_last)
+        between_indexes = indexes[between]
+        values[between] = day_timestamps[between] * self.slopes[between_indexes] + self.intercepts[between_indexes]
+        values[before_first] = self.phis[0]
+        values[after_last] = self.phis[-1]
+        return values
 
     @property
     def phi_function(self):
@@ -153,58 +439,56 @@ class ClockFixer:
 
 class UsageCalculator:
     def __init__(self, observations, clock_fixer):
-        self.observations = observations
+        self.observations = as_observation_batch(observations)
         self.clock_fixer = clock_fixer
         self.upstream_time_key_function = partial(upstream_time_function,
-                                                  phi_function=self.clock_fixer.phi_function)
+                                                  phi_function=self.clock_fixer.phi_values)
         self.downstream_time_key_function = partial(downstream_time_function,
-                                                    phi_function=self.clock_fixer.phi_function)
-        self.upstream_histogram = FixedSizeBinHistogram(observations, self.upstream_time_key_function)
-        self.downstream_histogram = FixedSizeBinHistogram(observations, self.downstream_time_key_function)
+                                                    phi_function=self.clock_fixer.phi_values)
+        self.upstream_histogram = FixedSizeBinArrayHistogram(self.observations, self.upstream_time_key_function)
+        self.downstream_histogram = FixedSizeBinArrayHistogram(self.observations, self.downstream_time_key_function)
         self.upstream_usage, self.downstream_usage = self._calculate_usage()
 
     def _calculate_usage(self):
-        upstream_over_threshold = 0
-        downstream_over_threshold = 0
-        upstream_over_mode = 0
-        downstream_over_mode = 0
-        for observation in self.observations:
-            upstream_time = self.upstream_time_key_function(observation)
-            downstream_time = self.downstream_time_key_function(observation)
-            if upstream_time > self.upstream_histogram.threshold:
-                upstream_over_threshold += 1
-            if downstream_time > self.downstream_histogram.threshold:
-                downstream_over_threshold += 1
-            if upstream_time > self.upstream_histogram.mode:
-                upstream_over_mode += 1
-            if downstream_time > self.downstream_histogram.mode:
-                downstream_over_mode += 1
+        upstream_times = self.upstream_time_key_function(self.observations)
+        downstream_times = self.downstream_time_key_function(self.observations)
+        upstream_over_threshold = numpy.count_nonzero(upstream_times > self.upstream_histogram.threshold)
+        downstream_over_threshold = numpy.count_nonzero(downstream_times > self.downstream_histogram.threshold)
+        upstream_over_mode = numpy.count_nonzero(upstream_times > self.upstream_histogram.mode)
+        downstream_over_mode = numpy.count_nonzero(downstream_times > self.downstream_histogram.mode)
         upstream_usage = upstream_over_threshold / upstream_over_mode
         downstream_usage = downstream_over_threshold / downstream_over_mode
         return upstream_usage, downstream_usage
 
 
 class HurstCalculator:
+    ESTIMATORS_NAMES = hurst.select_estimators(HURST_ESTIMATORS)
+
     @staticmethod
     def calculate_effective_hurst(hurst_values):
-        return (hurst_values['wavelet'] + hurst_values['rs']) / 2
+        return sum(hurst_values.values()) / len(hurst_values)
 
     @staticmethod
-    def hurst_values(data):
-        wavelet_hurst = hurst.wavelet(data)
-        rs_hurst = hurst.rs(data)
-        return {
-            'wavelet': wavelet_hurst,
-            'rs': rs_hurst
-        }
+    def hurst_values(data, estimators_names=ESTIMATORS_NAMES):
+        return {estimator_name: hurst.ESTIMATORS[estimator_name].function(data)
+                for estimator_name in estimators_names}
 
-    def __init__(self, observations, clock_fixer):
-        self.observations = observations
+    @staticmethod
+    def hurst_values_batch(series, estimators_names=ESTIMATORS_NAMES):
+        batch_values = hurst.hurst_batch(series, estimators_names)
+        return [
+            {estimator_name: batch_values[estimator_name][index] for estimator_name in estimators_names}
+            for index in range(len(series))
+        ]
+
+    def __init__(self, observations, clock_fixer, estimators_names=ESTIMATORS_NAMES):
+        self.observations = as_observation_batch(observations)
         self.capped_observations = self._cap_observations()
         self.clock_fixer = clock_fixer
         self.upstream_times, self.downstream_times = self._calculate_times()
-        self.upstream_values = self.hurst_values(self.upstream_times)
-        self.downstream_values = self.hurst_values(self.downstream_times)
+        self.upstream_values, self.downstream_values = self.hurst_values_batch([self.upstream_times,
+                                                                                 self.downstream_times],
+                                                                                estimators_names)
 
     def _calculate_desired_length(self):
         return int(2 ** floor(log_function(len(self.observations), 2)))
@@ -215,53 +499,66 @@ class HurstCalculator:
         return capped_observations
 
     def _calculate_times(self):
-        upstream_times = []
-        downstream_times = []
-        for observation in self.capped_observations:
-            upstream_time = upstream_time_function(observation, self.clock_fixer.phi_function)
-            downstream_time = downstream_time_function(observation, self.clock_fixer.phi_function)
-            upstream_times.append(upstream_time)
-            downstream_times.append(downstream_time)
+        upstream_times = upstream_time_function(self.capped_observations, self.clock_fixer.phi_values)
+        downstream_times = downstream_time_function(self.capped_observations, self.clock_fixer.phi_values)
         return upstream_times, downstream_times
 
 
 class QualityCalculator:
     DEFAULT_CONGESTION_THRESHOLD = 0.5
     DEFAULT_HURST_CONGESTION_THRESHOLD = 0.7
+    MINIMUM_MINUTE_OBSERVATIONS = 30
 
     def __init__(self, observations, hurst_calcultor, clock_fixer,
                  congestion_threshold=DEFAULT_CONGESTION_THRESHOLD,
-                 hurst_congestion_threshold=DEFAULT_HURST_CONGESTION_THRESHOLD):
-        self.observations = observations
+                 hurst_congestion_threshold=DEFAULT_HURST_CONGESTION_THRESHOLD,
+                 grouped=True, alpha=FixedSizeBinHistogram.DEFAULT_ALPHA):
+        self.observations = as_observation_batch(observations)
         self.hurst_calculator = hurst_calcultor
         self.clock_fixer = clock_fixer
+        self.alpha = alpha
         self.congestion_threshold = congestion_threshold
         self.hurst_congestion_threshold = hurst_congestion_threshold
-        self.observations_per_minute = divide_observations_into_minutes(self.observations)
+        self.grouped = grouped
+        self.observations_per_minute = None
+        self.minutes_usages = self._calculate_minutes_usages()
         self.upstream_congestion, self.downstream_congestion = self._calculate_congestion()
         self.upstream_quality = \
-            (len(self.observations_per_minute) - self.upstream_congestion) / len(self.observations_per_minute)
+            (len(self.minutes_usages) - self.upstream_congestion) / len(self.minutes_usages)
         self.downstream_quality = \
-            (len(self.observations_per_minute) - self.downstream_congestion) / len(self.observations_per_minute)
+            (len(self.minutes_usages) - self.downstream_congestion) / len(self.minutes_usages)
 
     def _calculate_congestion(self):
-        upstream_congestion = 0
-        downstream_congestion = 0
-        effective_upstream_hurst = HurstCalculator.calculate_effective_hurst(self.hurst_calculator.upstream_values)
-        effective_downstream_hurst = HurstCalculator.calculate_effective_hurst(self.hurst_calculator.downstream_values)
+        return calculate_congestion(self.minutes_usages,
+                                    HurstCalculator.calculate_effective_hurst(self.hurst_calculator.upstream_values),
+                                    HurstCalculator.calculate_effective_hurst(self.hurst_calculator.downstream_values),
+                                    self.congestion_threshold, self.hurst_congestion_threshold)
+
+    def _calculate_minutes_usages(self):
+        if self.grouped:
+            return self._calculate_grouped_minutes_usages()
+        self.observations_per_minute = divide_observations_into_minutes(self.observations)
         obspm_items = list(self.observations_per_minute.items())
         for minute, m_observations in obspm_items:
-            if len(m_observations) < 30:
+            if len(m_observations) < self.MINIMUM_MINUTE_OBSERVATIONS:
                 self.observations_per_minute.pop(minute, None)
-        for minute, m_observations in self.observations_per_minute.items():
-            minute_usage_calculator = UsageCalculator(m_observations, self.clock_fixer)
-            if minute_usage_calculator.upstream_usage < self.congestion_threshold \
-                    and effective_upstream_hurst > self.hurst_congestion_threshold:
-                upstream_congestion += 1
-            if minute_usage_calculator.downstream_usage < self.congestion_threshold \
-                    and effective_downstream_hurst > self.hurst_congestion_threshold:
-                downstream_congestion += 1
-        return upstream_congestion, downstream_congestion
+        return {minute: self._calculate_minute_usage(m_observations)
+                for minute, m_observations in self.observations_per_minute.items()}
+
+    def _calculate_grouped_minutes_usages(self):
+        minutes_usages = {}
+        phis = self.clock_fixer.phi_values(self.observations.day_timestamp)
+        minutes, upstream_usages, downstream_usages = \
+            calculate_minutes_usages(self.observations, phis, self.MINIMUM_MINUTE_OBSERVATIONS, self.alpha)
+        for minute, upstream_usage, downstream_usage in zip(minutes.tolist(),
+                                                            upstream_usages.tolist(),
+                                                            downstream_usages.tolist()):
+            minutes_usages[float(minute)] = upstream_usage, downstream_usage
+        return minutes_usages
+
+    def _calculate_minute_usage(self, m_observations):
+        minute_usage_calculator = UsageCalculator(m_observations, self.clock_fixer)
+        return minute_usage_calculator.upstream_usage, minute_usage_calculator.downstream_usage
 
 
 class Analyzer:
@@ -272,29 +569,43 @@ class Analyzer:
 
     def __init__(self, observations_set):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.observations = [observation for observation in observations_set if observation.type_identifier == b'S']
-        self.meaningful_observations = self.calculate_meaningful_observations()
-        self.rtt_histogram = FixedSizeBinHistogram(data=self.observations,
-                                                   characterization_function=observation_rtt_key_function)
-        self.clock_fixer = ClockFixer(self.rtt_histogram.bins[0].data, tau=self.rtt_histogram.mode)
-        self.usage_calculator = UsageCalculator(self.meaningful_observations, self.clock_fixer)
-        self.hurst_calculator = HurstCalculator(self.meaningful_observations, self.clock_fixer)
-        self.quality_calculator = QualityCalculator(self.meaningful_observations,
-                                                    self.hurst_calculator,
-                                                    self.clock_fixer)
+        with metrics.timer('meaningful_observations'):
+            observations_set = as_observation_batch(observations_set)
+            self.observations = observations_set[observations_set.type_identifier == b'S']
+            self.meaningful_observations = self.calculate_meaningful_observations()
+        with metrics.timer('rtt_histogram'):
+            self.rtt_histogram = FixedSizeBinArrayHistogram(data=self.observations,
+                                                            characterization_function=observation_rtt_key_function)
+        with metrics.timer('clock_fixer'):
+            self.clock_fixer = ClockFixer(self.rtt_histogram.bins[0].data, tau=self.rtt_histogram.mode)
+        with metrics.timer('usage_calculator'):
+            self.usage_calculator = UsageCalculator(self.meaningful_observations, self.clock_fixer)
+        with metrics.timer('hurst_calculator'):
+            self.hurst_calculator = HurstCalculator(self.meaningful_observations, self.clock_fixer)
+        with metrics.timer('quality_calculator'):
+            self.quality_calculator = QualityCalculator(self.meaningful_observations,
+                                                        self.hurst_calculator,
+                                                        self.clock_fixer)
 
     def calculate_meaningful_observations(self):
-        sorted_observations = sorted(self.observations, key=attrgetter('day_timestamp'))
-        first_observation = sorted_observations[0]
-        last_observation = sorted_observations[-1]
-        observations_delta = timedelta(seconds=(last_observation.day_timestamp - first_observation.day_timestamp))
+        if self.observations.is_sorted:
+            first_day_timestamp = self.observations.day_timestamp[0].item()
+            last_day_timestamp = self.observations.day_timestamp[-1].item()
+        else:
+            first_day_timestamp = self.observations.day_timestamp.min().item()
+            last_day_timestamp = self.observations.day_timestamp.max().item()
+        observations_delta = timedelta(seconds=(last_day_timestamp - first_day_timestamp))
         if observations_delta < self.MEANINGFUL_OBSERVATIONS_DELTA:
             raise ValueError('Meaningful observations time delta is lower than expected. '
                              'Expected {}, got {}'.format(self.MEANINGFUL_OBSERVATIONS_DELTA, observations_delta))
-        meaningful_threshold_timestamp = last_observation.day_timestamp \
-                                         - self.MEANINGFUL_OBSERVATIONS_DELTA.total_seconds()
-        meaningful_observations = [observation for observation in self.observations
-                                   if observation.day_timestamp > meaningful_threshold_timestamp]
+        meaningful_threshold_timestamp = last_day_timestamp - self.MEANINGFUL_OBSERVATIONS_DELTA.total_seconds()
+        if self.observations.is_sorted:
+            meaningful_start = numpy.searchsorted(self.observations.day_timestamp, meaningful_threshold_timestamp,
+                                                  side='right')
+            meaningful_observations = self.observations[meaningful_start:]
+        else:
+            meaningful_observations = \
+                self.observations[self.observations.day_timestamp > meaningful_threshold_timestamp]
         return meaningful_observations
 
     def get_results(self):
@@ -314,3 +625,165 @@ class Analyzer:
         }
         logger.debug(results)
         return results
+
+
+class StreamingAnalyzer:
+    """
+    Analyzes a stream of observations and gives the results of the last window every stride seconds,
+    instead of waiting for a whole new set of reports.
+
+    The state of the previous windows is kept: the observations of the current window, the usage of
+    every complete minute and the online Hurst estimators, which are fed each observation once. The clock
+    fixer is built again for each window, but the usage of a minute and the times fed to the Hurst
+    estimators are fixed with the clock fixer of the window in which they were first seen.
+    """
+    DEFAULT_STRIDE = 60
+    DEFAULT_HURST_WINDOW_SIZE = 1024
+
+    def __init__(self, stride=DEFAULT_STRIDE, window=Analyzer.MEANINGFUL_OBSERVATIONS_DELTA,
+                 hurst_window_size=DEFAULT_HURST_WINDOW_SIZE,
+                 hurst_estimators_names=HurstCalculator.ESTIMATORS_NAMES,
+                 congestion_threshold=QualityCalculator.DEFAULT_CONGESTION_THRESHOLD,
+                 hurst_congestion_threshold=QualityCalculator.DEFAULT_HURST_CONGESTION_THRESHOLD,
+                 alpha=FixedSizeBinHistogram.DEFAULT_ALPHA):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.stride = int(stride)
+        self.window = int(window.total_seconds())
+        if self.stride <= 0 or self.stride > self.window:
+            raise ValueError('The stride must be between 1 and {} seconds, got {}'.format(self.window, stride))
+        self.congestion_threshold = congestion_threshold
+        self.hurst_congestion_threshold = hurst_congestion_threshold
+        self.alpha = alpha
+        self.observations = ObservationBatch(is_sorted=True)
+        # The next window ends right before window_end, the observations before analyzed_until were analyzed
+        self.window_end = None
+        self.analyzed_until = None
+        self.minutes_usages = {}
+        self.hurst_estimators = {
+            direction: {estimator_name: hurst.ESTIMATORS[estimator_name].create_online(hurst_window_size)
+                        for estimator_name in hurst_estimators_names}
+            for direction in ['upstream', 'downstream']
+        }
+        self.late_observations_qty = 0
+        # Timestamp of the last results given, a window without newer observations gives none
+        self.last_results_timestamp = None
+
+    def add_observations(self, observations):
+        """
+        Adds the observations to the stream and analyzes every window they complete. A window is complete
+        once an observation after its end arrives. Observations of windows already analyzed are dropped.
+
+        :param observations: observations of any type, in any order
+        :return: list with the results of each complete window, in order
+        """
+        observations = as_observation_batch(observations)
+        observations = observations[observations.type_identifier == b'S'].sorted_by_day_timestamp()
+        if len(observations) == 0:
+            return []
+        if self.window_end is None:
+            first_day_timestamp = observations.day_timestamp[0].item()
+            self.window_end = (first_day_timestamp // self.stride + 1) * self.stride
+            self.analyzed_until = first_day_timestamp
+        else:
+            late = observations.day_timestamp < self.analyzed_until
+            if numpy.any(late):
+                self.late_observations_qty += int(numpy.count_nonzero(late))
+                observations = observations[~late]
+        self.observations = ObservationBatch.merge_sorted_runs([self.observations, observations])
+        windows_results = []
+        while self.observations.day_timestamp[-1].item() >= self.window_end:
+            results = self._analyze_window(self.window_end)
+            if results is not None:
+                windows_results.append(results)
+            self.analyzed_until = self.window_end
+            self.window_end += self.stride
+        # Only the observations of the next window are kept
+        first_kept = numpy.searchsorted(self.observations.day_timestamp, self.window_end - self.window, side='left')
+        self.observations = self.observations[first_kept:]
+        return windows_results
+
+    def _get_observations_between(self, start, end):
+        day_timestamps = self.observations.day_timestamp
+        return self.observations[numpy.searchsorted(day_timestamps, start, side='left'):
+                                 numpy.searchsorted(day_timestamps, end, side='left')]
+
+    def _update_minutes_usages(self, window_start, window_end, clock_fixer):
+        first_minute = self.analyzed_until - self.analyzed_until % 60
+        last_minute_end = window_end - window_end % 60
+        new_observations = self._get_observations_between(first_minute, last_minute_end)
+        if len(new_observations) > 0:
+            minutes, upstream_usages, downstream_usages = \
+                calculate_minutes_usages(new_observations, clock_fixer.phi_values(new_observations.day_timestamp),
+                                         QualityCalculator.MINIMUM_MINUTE_OBSERVATIONS, self.alpha)
+            for minute, upstream_usage, downstream_usage in zip(minutes.tolist(),
+                                                                upstream_usages.tolist(),
+                                                                downstream_usages.tolist()):
+                self.minutes_usages.setdefault(float(minute), (upstream_usage, downstream_usage))
+        self.minutes_usages = {minute: usage for minute, usage in self.minutes_usages.items()
+                               if minute >= window_start}
+
+    def _update_hurst_estimators(self, window_end, clock_fixer):
+        new_observations = self._get_observations_between(self.analyzed_until, window_end)
+        upstream_times = upstream_time_function(new_observations, clock_fixer.phi_values)
+        downstream_times = downstream_time_function(new_observations, clock_fixer.phi_values)
+        for estimator in self.hurst_estimators['upstream'].values():
+            estimator.extend(upstream_times)
+        for estimator in self.hurst_estimators['downstream'].values():
+            estimator.extend(downstream_times)
+
+    def _get_hurst_values(self, direction):
+        return {estimator_name: estimator.hurst()
+                for estimator_name, estimator in self.hurst_estimators[direction].items()}
+
+    def _analyze_window(self, window_end):
+        logger = self.logger.getChild('_analyze_window')
+        window_start = window_end - self.window
+        observations = self._get_observations_between(window_start, window_end)
+        if len(observations) == 0 or (self.last_results_timestamp is not None and
+                                      observations[-1].day_timestamp <= self.last_results_timestamp):
+            # No observations arrived since the last results, which would be given again with the same timestamp
+            logger.debug('No new observations in the window ending at {}'.format(window_end))
+            return None
+        try:
+            with metrics.timer('rtt_histogram'):
+                rtt_histogram = FixedSizeBinArrayHistogram(data=observations,
+                                                           characterization_function=observation_rtt_key_function)
+            with metrics.timer('clock_fixer'):
+                clock_fixer = ClockFixer(rtt_histogram.bins[0].data, tau=rtt_histogram.mode)
+            with metrics.timer('quality_calculator'):
+                self._update_minutes_usages(window_start, window_end, clock_fixer)
+            with metrics.timer('hurst_calculator'):
+                self._update_hurst_estimators(window_end, clock_fixer)
+            if not all(estimator.is_ready for estimators in self.hurst_estimators.values()
+                       for estimator in estimators.values()) or len(self.minutes_usages) == 0:
+                logger.debug('Not enough observations yet for the window ending at {}'.format(window_end))
+                return None
+            with metrics.timer('usage_calculator'):
+                usage_calculator = UsageCalculator(observations, clock_fixer)
+            upstream_hurst = self._get_hurst_values('upstream')
+            downstream_hurst = self._get_hurst_values('downstream')
+        except (ValueError, IndexError, ZeroDivisionError) as error:
+            logger.warning('Could not analyze the window ending at {}: {}'.format(window_end, error))
+            return None
+        upstream_congestion, downstream_congestion = \
+            calculate_congestion(self.minutes_usages,
+                                 HurstCalculator.calculate_effective_hurst(upstream_hurst),
+                                 HurstCalculator.calculate_effective_hurst(downstream_hurst),
+                                 self.congestion_threshold, self.hurst_congestion_threshold)
+        minutes_qty = len(self.minutes_usages)
+        results = {
+            'timestamp': observations[-1].day_timestamp,
+            'upstream': {
+                'usage': usage_calculator.upstream_usage,
+                'quality': (minutes_qty - upstream_congestion) / minutes_qty,
+                'hurst': upstream_hurst
+            },
+            'downstream': {
+                'usage': usage_calculator.downstream_usage,
+                'quality': (minutes_qty - downstream_congestion) / minutes_qty,
+                'hurst': downstream_hurst
+            }
+        }
+        self.last_results_timestamp = results['timestamp']
+        logger.debug(results)
+        return results
@@ -3,14 +3,24 @@ import os
 
 import requests
 from requests import RequestException
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from requests.packages.urllib3.util.retry import Retry
+
+from processor import metrics
 
 TIX_API_SSL = os.environ.get('TIX_API_SSL') is not None
 TIX_API_HOST = os.environ.get('TIX_API_HOST', 'localhost')
 TIX_API_PORT = os.environ.get('TIX_API_PORT')
 TIX_API_USER = os.environ.get('TIX_API_USER')
 TIX_API_PASS = os.environ.get('TIX_API_PASSWORD')
+TIX_API_POOL_SIZE = int(os.environ.get('TIX_API_POOL_SIZE', '10'))
+TIX_API_TIMEOUT = float(os.environ.get('TIX_API_TIMEOUT', '10'))
+TIX_API_RETRIES = int(os.environ.get('TIX_API_RETRIES', '3'))
+TIX_API_BACKOFF_FACTOR = float(os.environ.get('TIX_API_BACKOFF_FACTOR', '0.5'))
+TIX_API_BULK = os.environ.get('TIX_API_BULK') is not None
 TIX_API_URL_TEMPLATE = '{proto}://{api_host}/api/user/{user_id}/installation/{installation_id}/reports'
+TIX_API_BULK_URL_TEMPLATE = '{proto}://{api_host}/api/user/{user_id}/reports/bulk'
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +33,7 @@ def prepare_results_for_api(results, ip):
         'upQuality': results['upstream']['quality'],
         'downUsage': results['downstream']['usage'],
         'downQuality': results['downstream']['quality'],
+        # Only the wavelet and R/S estimations are posted, they are always run
         'hurstUpRs':  results['upstream']['hurst']['rs'],
         'hurstUpWavelet': results['upstream']['hurst']['wavelet'],
         'hurstDownRs': results['downstream']['hurst']['rs'],
@@ -31,7 +42,7 @@ def prepare_results_for_api(results, ip):
     }
 
 
-def prepare_url(user_id, installation_id, tix_api_ssl=TIX_API_SSL, tix_api_host=TIX_API_HOST, tix_api_port=TIX_API_PORT):
+def prepare_api_host(tix_api_ssl=TIX_API_SSL, tix_api_host=TIX_API_HOST, tix_api_port=TIX_API_PORT):
     if tix_api_ssl:
         proto = 'https'
         default_port = 443
@@ -42,15 +53,93 @@ def prepare_url(user_id, installation_id, tix_api_ssl=TIX_API_SSL, tix_api_host=
         api_port = ':' + tix_api_port
     else:
         api_port = ''
+    return proto, tix_api_host + api_port
+
+
+def prepare_url(user_id, installation_id, tix_api_ssl=TIX_API_SSL, tix_api_host=TIX_API_HOST, tix_api_port=TIX_API_PORT):
+    proto, api_host = prepare_api_host(tix_api_ssl, tix_api_host, tix_api_port)
     url = TIX_API_URL_TEMPLATE.format(
         proto=proto,
-        api_host=tix_api_host + api_port,
+        api_host=api_host,
         user_id=user_id,
         installation_id=installation_id
     )
     return url
 
 
+def prepare_bulk_url(user_id, tix_api_ssl=TIX_API_SSL, tix_api_host=TIX_API_HOST, tix_api_port=TIX_API_PORT):
+    proto, api_host = prepare_api_host(tix_api_ssl, tix_api_host, tix_api_port)
+    url = TIX_API_BULK_URL_TEMPLATE.format(
+        proto=proto,
+        api_host=api_host,
+        user_id=user_id
+    )
+    return url
+
+
+def build_retry(retries, backoff_factor):
+    # Only the connection errors are retried: the request never reached the API, so retrying can't post the
+    # results twice. A read error or a 5XX status code may come after the API stored them, and POST is not
+    # idempotent, so those are left to the failed results replay instead
+    return Retry(total=retries, connect=retries, read=0, redirect=0, backoff_factor=backoff_factor,
+                 raise_on_status=False)
+
+
+class APIClient:
+    """
+    Client to post results to the API.
+    It keeps a requests.Session, so the connections to the API are pooled and kept alive between posts,
+    and retries the posts that fail because of connection errors with an exponential backoff.
+    """
+    def __init__(self, tix_api_user=TIX_API_USER, tix_api_pass=TIX_API_PASS,
+                 pool_size=TIX_API_POOL_SIZE, timeout=TIX_API_TIMEOUT,
+                 retries=TIX_API_RETRIES, backoff_factor=TIX_API_BACKOFF_FACTOR):
+        self.timeout = timeout
+        self.session = requests.Session()
+        if tix_api_user and tix_api_pass:
+            self.session.auth = HTTPBasicAuth(tix_api_user, tix_api_pass)
+        retry = build_retry(retries, backoff_factor)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, url, json_data):
+        log = logger.getChild('APIClient.post')
+        try:
+            with metrics.timer('post_results'):
+                response = self.session.post(url=url, json=json_data, timeout=self.timeout)
+            if response.status_code not in (200, 204):
+                log.error('Error while trying to post to API, got status code {status_code} for url {url}'
+                          .format(status_code=response.status_code,
+                                  url=url))
+                metrics.increment('posts_failed')
+                return False
+        except RequestException as re:
+            log.error('Error while trying to post to API')
+            log.error(re)
+            metrics.increment('posts_failed')
+            return False
+        metrics.increment('posts_succeeded')
+        return True
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+
+
+def get_client(tix_api_user=TIX_API_USER, tix_api_pass=TIX_API_PASS):
+    """
+    Returns the APIClient of the current process for the given credentials.
+    Clients are never shared between processes, since their pooled connections can't be.
+    """
+    client_key = (os.getpid(), tix_api_user, tix_api_pass)
+    if client_key not in _clients:
+        _clients[client_key] = APIClient(tix_api_user, tix_api_pass)
+    return _clients[client_key]
+
+
 def post_results(ip, results, user_id, installation_id, tix_api_user=TIX_API_USER, tix_api_pass=TIX_API_PASS):
     log = logger.getChild('post_results')
     log.info('posting results for user {user_id} installation {installation_id}'.format(user_id=user_id,
@@ -62,17 +151,27 @@ def post_results(ip, results, user_id, installation_id, tix_api_user=TIX_API_USE
     if not tix_api_user or not tix_api_pass:
         log.warn('No user nor password supplied for API Connection')
         return False
-    try:
-        response = requests.post(url=url,
-                                 json=json_data,
-                                 auth=HTTPBasicAuth(tix_api_user, tix_api_pass))
-        if response.status_code not in (200, 204):
-            log.error('Error while trying to post to API, got status code {status_code} for url {url}'
-                      .format(status_code=response.status_code,
-                              url=url))
-            return False
-    except RequestException as re:
-        log.error('Error while trying to post to API')
-        log.error(re)
+    return get_client(tix_api_user, tix_api_pass).post(url, json_data)
+
+
+def post_results_bulk(user_id, installations_results, tix_api_user=TIX_API_USER, tix_api_pass=TIX_API_PASS):
+    """
+    Posts many results of a user in a single request to the bulk endpoint.
+
+    :param user_id:
+    :param installations_results: list of (installation_id, ip, results) tuples
+    :return: True if all the results were posted
+    """
+    log = logger.getChild('post_results_bulk')
+    log.info('posting {qty} results for user {user_id}'.format(qty=len(installations_results), user_id=user_id))
+    json_data = []
+    for installation_id, ip, results in installations_results:
+        result_data = prepare_results_for_api(results, ip)
+        result_data['installationId'] = installation_id
+        json_data.append(result_data)
+    url = prepare_bulk_url(user_id)
+    log.debug('url={url}'.format(url=url))
+    if not tix_api_user or not tix_api_pass:
+        log.warn('No user nor password supplied for API Connection')
         return False
-    return True
+    return get_client(tix_api_user, tix_api_pass).post(url, json_data)
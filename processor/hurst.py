@@ -1,4 +1,5 @@
 import math
+from collections import deque, OrderedDict
 
 import logging
 import numpy
@@ -13,6 +14,12 @@ OVERLAP = 1
 NDIFF = 0
 LAG = 0
 CONNECT_ = 0
+AGGREGATED_VARIANCE_MINIMUM_BLOCKS = 3
+DFA_MINIMUM_BLOCKS = 4
+PERIODOGRAM_CUTOFF = 0.1
+COST_LOW = 'low'
+COST_MEDIUM = 'medium'
+COST_HIGH = 'high'
 
 
 def crs(data, n, nblk, nlag, overlap, output):
@@ -134,15 +141,120 @@ def crs(data, n, nblk, nlag, overlap, output):
                 # print output
 
 
-def rs(data):
+def crs_lags(n, nblk, nlag, overlap):
+    """
+    The lags of crs for a series of length n.
+
+    :return: list of (k, d, nval) tuples, d being the observations used for lag k and nval the amount of blocks
+    """
+    lags = []
+    blksize = int(math.floor(n / nblk))
+    if overlap != 0:
+        increment = math.log10(float(n)) / nlag
+    else:
+        increment = math.log10(float(blksize)) / nlag
+    for k in range(0, nlag):
+        if k == nlag - 1:
+            d = int(math.pow(10.0, float((increment * (k + 1)))))
+        else:
+            d = int(math.ceil(math.pow(10.0, float((increment * (k + 1))))))
+        correction = int(math.ceil(float(d - blksize) / float(blksize)))
+        if correction == nblk:
+            correction -= 1
+        if d > blksize:
+            nval = nblk - correction
+        else:
+            nval = nblk
+        lags.append((k, d, nval))
+    return lags
+
+
+def crs_arrays(data, nblk, nlag, overlap):
+    """
+    Array version of crs.
+    Instead of walking every block with nested loops, the cumulative sums are
+    computed once for the whole series and the r and radj statistics of all the
+    blocks of a given lag are obtained with max/min reductions over whole arrays.
+
+    :param data: 2-D array with one time series of length n per row
+    :param nblk:
+    :param nlag:
+    :param overlap:
+    :return: 2-D array with one row per series, laid out as the output vector of crs
+    """
+    data = numpy.asarray(data, dtype=float)
+    rows, n = data.shape
+    output = numpy.zeros((rows, 2 * nblk * nlag))
+    # xcum and xsqcum are padded with a leading 0, so xcum[:, i] is the sum of the first i values
+    xcum = numpy.zeros((rows, n + 1))
+    xsqcum = numpy.zeros((rows, n + 1))
+    numpy.cumsum(data, axis=1, out=xcum[:, 1:])
+    numpy.cumsum(data * data, axis=1, out=xsqcum[:, 1:])
+    blksize = int(math.floor(n / nblk))
+    for k, d, nval in crs_lags(n, nblk, nlag, overlap):
+        starts = blksize * numpy.arange(nval)
+        steps = numpy.arange(1, d + 1)
+        base = xcum[:, starts]
+        ave = (1.0 / d) * (xcum[:, starts + d] - base)
+        temp = xcum[:, starts[:, None] + steps] - base[:, :, None] - steps * ave[:, :, None]
+        r = numpy.maximum(temp.max(axis=2), 0.0) - numpy.minimum(temp.min(axis=2), 0.0)
+        secondmom = (1.0 / d) * (xsqcum[:, starts + d] - xsqcum[:, starts])
+        variance = secondmom - ave * ave
+        positive_variance = variance > 0
+        radj = r.copy()
+        radj[positive_variance] = r[positive_variance] / numpy.sqrt(variance[positive_variance])
+        output[:, k * nblk:k * nblk + nval] = r
+        output[:, nblk * nlag + k * nblk:nblk * nlag + k * nblk + nval] = radj
+    return output
+
+
+def crs_numpy(data, n, nblk, nlag, overlap, output):
+    """
+    Drop-in replacement of crs backed by crs_arrays.
+
+    :param data:
+    :param n:
+    :param nblk:
+    :param nlag:
+    :param overlap:
+    :param output:
+    :return:
+    """
+    output[:] = crs_arrays([data[:n]], nblk, nlag, overlap)[0].tolist()
+
+
+RS_ENGINES = {
+    'python': crs,
+    'numpy': crs_numpy
+}
+DEFAULT_RS_ENGINE = 'numpy'
+
+
+def rs(data, engine=DEFAULT_RS_ENGINE):
     logger = logging.getLogger('plotrs')
-    logger.debug("data: {data}".format(data=data))
+    # Formatting the debug messages is far more expensive than the estimation itself
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    if debug_enabled:
+        logger.debug("data: {data}".format(data=data))
     n = len(data)
-    increment = math.log10(n) / NLAG
     output = [0] * (2 * NBLK * NLAG)
-    crs(data, len(data), NBLK, NLAG, OVERLAP, output)
-    range_ = output
-    logger.debug("range: {range}".format(range=str(range_)))
+    RS_ENGINES[engine](data, len(data), NBLK, NLAG, OVERLAP, output)
+    return _rs_fit(output, n)
+
+
+def _rs_fit(range_, n):
+    """
+    Fits the least-squares line over the output vector of crs for a series of length n.
+
+    :param range_: output vector of crs
+    :param n:
+    :return:
+    """
+    logger = logging.getLogger('plotrs')
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    increment = math.log10(n) / NLAG
+    if debug_enabled:
+        logger.debug("range: {range}".format(range=str(range_)))
     x = []
     r = []
     ra = []
@@ -164,7 +276,8 @@ def rs(data):
             x += [math.log10(math.floor(math.pow(10, (i * increment))))] * NBLK
             r += range_[((i - 1) * NBLK):(i * NBLK)]
             ra += range_[(NBLK * NLAG + (i - 1) * NBLK):(NBLK * NLAG + i * NBLK)]
-            logger.debug("x: {x}, r: {r}, ra: {ra}".format(x=x, r=r, ra=ra))
+            if debug_enabled:
+                logger.debug("x: {x}, r: {r}, ra: {ra}".format(x=x, r=r, ra=ra))
         if i * increment > POWER2:
             xc += [math.log10(math.floor(math.pow(10, (i * increment))))] * NBLK
             # Above line changed 2/28/95 to make the plotting consistent
@@ -173,19 +286,22 @@ def rs(data):
             # desde 0 o desde 1?
             rc += range_[((i - 1) * NBLK):(i * NBLK)]
             rac += range_[(NBLK * NLAG + (i - 1) * NBLK):(NBLK * NLAG + i * NBLK)]
-        logger.debug("i: {i}, x: {x}, ra: {ra}".format(i=i, x=x, ra=ra))
+        if debug_enabled:
+            logger.debug("i: {i}, x: {x}, ra: {ra}".format(i=i, x=x, ra=ra))
     if len(list(filter((lambda x1: x1 > 0.0000000001), r))) > 0:
-        ld = [x[i] for i in range(0, len(x)) if i in [j for j in range(0, len(r)) if r[j] > 0.0]]
+        ld = [x_value for x_value, r_value in zip(x, r) if r_value > 0.0]
         # ld contains the values of x which position in the array coincides with the position of the values in r
         # that satisfies the condition
-        rat = [ra[i] for i in range(0, len(ra)) if i in [j for j in range(0, len(r)) if r[j] > 0.0]]
-        logger.debug("rat: {rat}".format(rat=rat))
+        rat = [ra_value for ra_value, r_value in zip(ra, r) if r_value > 0.0]
+        if debug_enabled:
+            logger.debug("rat: {rat}".format(rat=rat))
         lra = list(map(math.log10, rat))
-        logger.debug("ld: {ld} lra: {lra}".format(ld=ld, lra=lra))
+        if debug_enabled:
+            logger.debug("ld: {ld} lra: {lra}".format(ld=ld, lra=lra))
     else:
         raise ValueError("Either the series is constant or no data was entered.")
     if len(list(filter((lambda x1: x1 > 0.0000000001), rc))) > 0:
-        ratc = [rac[i] for i in range(0, len(rac)) if i in [j for j in range(0, len(rc)) if rc[j] > 0.0]]
+        ratc = [rac_value for rac_value, rc_value in zip(rac, rc) if rc_value > 0.0]
         lrac = []
         for i in range(0, len(ratc)):
             if ratc[i] > 0:
@@ -195,7 +311,8 @@ def rs(data):
     # Do the calculations for fitting a least-squares line. For R/S.
     a = numpy.vstack([ld, numpy.ones(len(ld))]).T
     ba, ma = numpy.linalg.lstsq(a, lra)[0]
-    logger.debug("ld: {ld} lra: {lra}".format(ld=ld, lra=lra))
+    if debug_enabled:
+        logger.debug("ld: {ld} lra: {lra}".format(ld=ld, lra=lra))
     return ba
 
 
@@ -286,7 +403,18 @@ def wavelet(data, order=2, octaves_bounds=(2, 8)):
     # R:	beta = fit$coef[[2]]
     # R:	H = (beta+1)/2
 
-    # Fit:
+    return _wavelet_fit(statistic, j1, j2)
+
+
+def _wavelet_fit(statistic, j1, j2):
+    """
+    Fits the least-squares line over the log2 of the mean squared detail coefficients of octaves j1 to j2.
+
+    :param statistic: list with the statistic of each octave, starting from the first one
+    :param j1:
+    :param j2:
+    :return:
+    """
     x = [10 ** i for i in range(j1, j2 + 1)]
     y = [10 ** i for i in statistic[j1 - 1:j2]]
 
@@ -311,3 +439,500 @@ def wavelet(data, order=2, octaves_bounds=(2, 8)):
     beta = fit
     H = (beta + 1) / 2
     return fitH
+
+
+def wavelet_batch(data, order=2, octaves_bounds=(2, 8)):
+    """
+    Batched version of wavelet.
+    The DWT of every row is computed in a single pywt call and the fits of all
+    the rows are solved together as a multiple right hand side least-squares problem.
+
+    :param data: 2-D array with one time series per row
+    :param order:
+    :param octaves_bounds:
+    :return: array with the wavelet estimation of H for each row
+    """
+    data = numpy.asarray(data, dtype=float)
+    N = order
+    j1 = octaves_bounds[0]
+    j2 = octaves_bounds[1]
+    length = int(2 ** math.floor(math.log(data.shape[1], 2)))
+    noctave = int(math.log(length, 2)) - 1
+    bound_effect = int(math.ceil(math.log(2 * N, 2)))
+    if j2 > noctave - bound_effect:
+        j2 = noctave - bound_effect
+    wdec = pywt.wavedec(data[:, :length], 'db2', 'ppd', level=noctave - 1, axis=1)
+    statistic = numpy.zeros((data.shape[0], noctave))
+    for j in range(0, (noctave - bound_effect)):
+        wdec_level = wdec[noctave - 1 - j][:, N - 1:(2 ** (noctave - j) - N)]
+        statistic[:, j] = numpy.log2(numpy.mean(wdec_level ** 2, axis=1))
+    log10_x = numpy.arange(j1, j2 + 1, dtype=float)
+    # log10(10 ** statistic) == statistic, and log10(10 ** statistic * 10 ** j) / 2 == (statistic + j) / 2
+    log10_yx = (statistic[:, j1 - 1:j2] + log10_x) / 2
+    B = numpy.vstack([log10_x, numpy.ones(len(log10_x))]).T
+    fitH = numpy.linalg.lstsq(B, log10_yx.T, rcond=-1)[0][0]
+    return fitH
+
+
+def rs_batch(data):
+    """
+    Batched version of rs.
+    The r and radj statistics of every row are computed in a single crs_arrays call.
+
+    :param data: 2-D array with one time series per row
+    :return: array with the R/S estimation of H for each row
+    """
+    data = numpy.asarray(data, dtype=float)
+    n = data.shape[1]
+    outputs = crs_arrays(data, NBLK, NLAG, OVERLAP)
+    return numpy.array([_rs_fit(output.tolist(), n) for output in outputs])
+
+
+def _block_sizes(n, minimum_blocks):
+    """
+    The block sizes of crs inside the fitted range of _rs_fit, for a series of length n, leaving out the
+    ones that split it in less than minimum_blocks blocks.
+    """
+    increment = math.log10(n) / NLAG
+    sizes = sorted(set(int(math.floor(math.pow(10, i * increment))) for i in range(NLAG)))
+    sizes = [size for size in sizes if POWER1 <= math.log10(size) <= POWER2 and n // size >= minimum_blocks]
+    if len(sizes) < 2:
+        raise ValueError('The series is too short to be split in blocks, got {} values'.format(n))
+    return sizes
+
+
+def _fit_slopes(x, y):
+    """
+    :param x: 1-D array
+    :param y: 2-D array with one column per row of the estimated block, and one row per value of x
+    :return: array with the slope of the least-squares line of each column of y
+    """
+    if not numpy.all(numpy.isfinite(y)):
+        raise ValueError("Either the series is constant or no data was entered.")
+    A = numpy.vstack([x, numpy.ones(len(x))]).T
+    return numpy.linalg.lstsq(A, y, rcond=-1)[0][0]
+
+
+def aggregated_variance_batch(data):
+    """
+    Aggregated variance estimator of H.
+    The series is split in blocks of each size m and the variance of the means of the blocks, which
+    decays as m ** (2H - 2), is fitted against m in a log-log scale.
+
+    :param data: 2-D array with one time series per row
+    :return: array with the aggregated variance estimation of H for each row
+    """
+    data = numpy.asarray(data, dtype=float)
+    rows, n = data.shape
+    sizes = _block_sizes(n, AGGREGATED_VARIANCE_MINIMUM_BLOCKS)
+    log_variances = numpy.zeros((len(sizes), rows))
+    with numpy.errstate(divide='ignore'):
+        for index, size in enumerate(sizes):
+            blocks_qty = n // size
+            means = data[:, :blocks_qty * size].reshape(rows, blocks_qty, size).mean(axis=2)
+            log_variances[index] = numpy.log10(means.var(axis=1, ddof=1))
+    return 1 + _fit_slopes(numpy.log10(sizes), log_variances) / 2
+
+
+def dfa_batch(data):
+    """
+    Detrended fluctuation analysis estimator of H.
+    The cumulative sum of the centered series is split in blocks of each size m, the least-squares line
+    of each block is subtracted, and the root mean square of what is left, which grows as m ** H, is fitted
+    against m in a log-log scale.
+
+    :param data: 2-D array with one time series per row
+    :return: array with the DFA estimation of H for each row
+    """
+    data = numpy.asarray(data, dtype=float)
+    rows, n = data.shape
+    sizes = _block_sizes(n, DFA_MINIMUM_BLOCKS)
+    profile = numpy.cumsum(data - data.mean(axis=1, keepdims=True), axis=1)
+    log_fluctuations = numpy.zeros((len(sizes), rows))
+    with numpy.errstate(divide='ignore'):
+        for index, size in enumerate(sizes):
+            blocks_qty = n // size
+            blocks = profile[:, :blocks_qty * size].reshape(rows, blocks_qty, size)
+            blocks = blocks - blocks.mean(axis=2, keepdims=True)
+            steps = numpy.arange(size) - (size - 1) / 2
+            slopes = (blocks * steps).sum(axis=2, keepdims=True) / (steps * steps).sum()
+            residuals = blocks - slopes * steps
+            log_fluctuations[index] = numpy.log10(numpy.mean(residuals * residuals, axis=(1, 2))) / 2
+    return _fit_slopes(numpy.log10(sizes), log_fluctuations)
+
+
+def periodogram_batch(data, cutoff=PERIODOGRAM_CUTOFF):
+    """
+    Periodogram estimator of H.
+    Near the origin the periodogram of the series behaves as f ** (1 - 2H), so it is fitted against the
+    frequency in a log-log scale over the lowest cutoff fraction of the frequencies.
+
+    :param data: 2-D array with one time series per row
+    :param cutoff: fraction of the frequencies used in the fit
+    :return: array with the periodogram estimation of H for each row
+    """
+    data = numpy.asarray(data, dtype=float)
+    n = data.shape[1]
+    frequencies_qty = int(math.floor(cutoff * (n // 2)))
+    if frequencies_qty < 2:
+        raise ValueError('The series is too short for the periodogram, got {} values'.format(n))
+    spectrum = numpy.fft.rfft(data - data.mean(axis=1, keepdims=True), axis=1)[:, 1:frequencies_qty + 1]
+    periodogram = (spectrum.real ** 2 + spectrum.imag ** 2) / (2 * math.pi * n)
+    frequencies = numpy.arange(1, frequencies_qty + 1) / n
+    with numpy.errstate(divide='ignore'):
+        log_periodogram = numpy.log10(periodogram.T)
+    return (1 - _fit_slopes(numpy.log10(frequencies), log_periodogram)) / 2
+
+
+def aggregated_variance(data):
+    return float(aggregated_variance_batch([data])[0])
+
+
+def dfa(data):
+    return float(dfa_batch([data])[0])
+
+
+def periodogram(data):
+    return float(periodogram_batch([data])[0])
+
+
+def hurst_batch(data, estimators_names=None):
+    """
+    Estimates H for a 2-D block of equal-length series, one series per row.
+    The length of the series must be a power of two.
+
+    :param data: 2-D array with one time series per row
+    :param estimators_names: names of the estimators of ESTIMATORS to use, by default DEFAULT_ESTIMATORS
+    :return: dict with the array of estimations of each estimator, one value per row
+    """
+    data = numpy.asarray(data, dtype=float)
+    if data.ndim != 2:
+        raise ValueError('Expected a 2-D block of series, got {} dimensions'.format(data.ndim))
+    length = data.shape[1]
+    if length < 1 or length & (length - 1) != 0:
+        raise ValueError('The series length must be a power of two, got {}'.format(length))
+    if estimators_names is None:
+        estimators_names = DEFAULT_ESTIMATORS
+    return OrderedDict((estimator_name, ESTIMATORS[estimator_name].batch_function(data))
+                       for estimator_name in estimators_names)
+
+
+class OctaveWaveletVariance:
+    """
+    Running sum of the squared detail coefficients of an octave whose samples are all inside a sliding window.
+    """
+    def __init__(self):
+        self.coefficients = deque()
+        self.squares_sum = 0.0
+        self.expired_qty = 0
+
+    def add(self, first_sample, square):
+        self.coefficients.append((first_sample, square))
+        self.squares_sum += square
+
+    def expire(self, window_start):
+        while len(self.coefficients) > 0 and self.coefficients[0][0] < window_start:
+            self.squares_sum -= self.coefficients.popleft()[1]
+            self.expired_qty += 1
+        if self.expired_qty > len(self.coefficients):
+            # Adding and subtracting drifts, so the sum is taken again from time to time
+            self.squares_sum = math.fsum(square for _, square in self.coefficients)
+            self.expired_qty = 0
+
+    @property
+    def statistic(self):
+        return math.log(self.squares_sum / len(self.coefficients), 2)
+
+
+class OnlineWaveletHurst:
+    """
+    Online version of wavelet over a sliding window of the last window_size samples.
+
+    The db2 pyramid is run over the whole stream with the phase of the 'ppd' decomposition, so each new
+    sample computes at most one detail coefficient per octave, the one of octave j every 2 ** j samples,
+    instead of decomposing the whole window again. The statistic of each octave is the mean of the squared
+    coefficients whose samples are all in the window. Unlike wavelet, the coefficients that wrap around the
+    ends of the window are left out, since they change with every sample. For windows starting at a
+    multiple of 2 ** j2 the coefficients used are the interior ones of the 'ppd' decomposition of the window.
+    Its estimations are therefore not the ones of wavelet over the same window, so it is not the online
+    version of wavelet in ESTIMATORS, whose estimations are posted to the API.
+    """
+    WAVELET = pywt.Wavelet('db2')
+    FILTER_LENGTH = 4
+    BOUND_EFFECT = 2
+
+    def __init__(self, window_size=1024, octaves_bounds=(2, 8)):
+        if window_size < 1 or window_size & (window_size - 1) != 0:
+            raise ValueError('The window size must be a power of two, got {}'.format(window_size))
+        noctave = int(math.log(window_size, 2)) - 1
+        self.window_size = window_size
+        self.j1 = octaves_bounds[0]
+        self.j2 = min(octaves_bounds[1], noctave - self.BOUND_EFFECT)
+        if self.j2 <= self.j1:
+            raise ValueError('The window size {} is too small for octaves {}'.format(window_size, octaves_bounds))
+        self.samples_qty = 0
+        # Reversed, so they are applied to the approximations from the oldest to the newest
+        self.dec_lo = list(reversed(self.WAVELET.dec_lo))
+        self.dec_hi = list(reversed(self.WAVELET.dec_hi))
+        # The last approximations of each level, level 0 being the samples, and the index of the next one
+        self.approximations = [deque(maxlen=self.FILTER_LENGTH) for _ in range(self.j2)]
+        self.next_indexes = [0] * self.j2
+        self.octaves = [OctaveWaveletVariance() for _ in range(self.j2)]
+
+    @property
+    def is_ready(self):
+        return self.samples_qty >= self.window_size
+
+    def append(self, value):
+        sample = self.samples_qty
+        self.samples_qty += 1
+        level = 0
+        while True:
+            approximations = self.approximations[level]
+            approximations.append(value)
+            index = self.next_indexes[level]
+            self.next_indexes[level] = index + 1
+            # The coefficient k of the next level is filtered from the approximations 2k - 2 to 2k + 1
+            if index % 2 == 0 or len(approximations) < self.FILTER_LENGTH:
+                break
+            octave = level + 1
+            coefficient_index = (index - 1) // 2
+            if octave >= self.j1:
+                detail = sum([h * a for h, a in zip(self.dec_hi, approximations)])
+                first_sample = 2 ** octave * (coefficient_index - 2) + 2
+                self.octaves[octave - 1].add(first_sample, detail * detail)
+            if octave == self.j2:
+                break
+            value = sum([h * a for h, a in zip(self.dec_lo, approximations)])
+            if len(self.approximations[octave]) == 0:
+                self.next_indexes[octave] = coefficient_index
+            level = octave
+        window_start = sample - self.window_size + 1
+        for octave in range(self.j1, self.j2 + 1):
+            self.octaves[octave - 1].expire(window_start)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def hurst(self):
+        """
+        :return: the wavelet estimation of H over the last window_size samples
+        """
+        if not self.is_ready:
+            raise ValueError('Expected at least {} samples, got {}'.format(self.window_size, self.samples_qty))
+        statistic = [0.0] * self.j2
+        for octave in range(self.j1, self.j2 + 1):
+            statistic[octave - 1] = self.octaves[octave - 1].statistic
+        return _wavelet_fit(statistic, self.j1, self.j2)
+
+
+def block_statistics(xcum, xsqcum, starts, lengths):
+    """
+    The r and radj statistics of crs for many blocks of a series at once, whatever their lengths.
+
+    :param xcum: cumulative sums of the series, with a leading 0
+    :param xsqcum: cumulative sums of the squares of the series, with a leading 0
+    :param starts: array with the index of the first value of each block
+    :param lengths: array with the amount of values of each block
+    :return: (r, radj) arrays, with one value per block
+    """
+    offsets = numpy.cumsum(lengths) - lengths
+    steps = numpy.arange(lengths.sum()) - numpy.repeat(offsets, lengths) + 1
+    base = xcum[starts]
+    ave = (1.0 / lengths) * (xcum[starts + lengths] - base)
+    temp = xcum[numpy.repeat(starts, lengths) + steps] - numpy.repeat(base, lengths) \
+        - steps * numpy.repeat(ave, lengths)
+    r = numpy.maximum(numpy.maximum.reduceat(temp, offsets), 0.0) \
+        - numpy.minimum(numpy.minimum.reduceat(temp, offsets), 0.0)
+    secondmom = (1.0 / lengths) * (xsqcum[starts + lengths] - xsqcum[starts])
+    variance = secondmom - ave * ave
+    positive_variance = variance > 0
+    radj = r.copy()
+    radj[positive_variance] = r[positive_variance] / numpy.sqrt(variance[positive_variance])
+    return r, radj
+
+
+class RollingRS:
+    """
+    R/S estimation over a sliding window of the last window_size samples.
+
+    The cumulative sums are kept for the samples of the stream and extended as they arrive, instead of
+    being computed for every window. The r and radj statistics of each block are kept by the position of
+    the block in the stream, so an update only computes the blocks that were not in a previous window.
+    The blocks of the window start every window_size // nblk samples, so when the window moves by a
+    multiple of that all of them but the last ones are reused.
+    """
+    def __init__(self, window_size=1024, nblk=NBLK, nlag=NLAG, overlap=OVERLAP):
+        if window_size < nblk:
+            raise ValueError('The window size must be at least {}, got {}'.format(nblk, window_size))
+        self.window_size = window_size
+        self.nblk = nblk
+        self.nlag = nlag
+        self.blksize = int(math.floor(window_size / nblk))
+        self.lags = crs_lags(window_size, nblk, nlag, overlap)
+        self.lengths = sorted(set(d for _, d, _ in self.lags))
+        self.samples_qty = 0
+        # Stream index of the first kept sample. The sums are taken again from it when the buffer is full
+        self.base_index = 0
+        self.samples = numpy.zeros(2 * window_size)
+        self.xcum = numpy.zeros(2 * window_size + 1)
+        self.xsqcum = numpy.zeros(2 * window_size + 1)
+        self.blocks = {}
+
+    @property
+    def is_ready(self):
+        return self.samples_qty >= self.window_size
+
+    def _rebase(self):
+        kept_qty = min(self.window_size, self.samples_qty - self.base_index)
+        kept_samples = self.samples[self.samples_qty - self.base_index - kept_qty:
+                                    self.samples_qty - self.base_index].copy()
+        self.base_index = self.samples_qty - kept_qty
+        self.samples[:kept_qty] = kept_samples
+        numpy.cumsum(kept_samples, out=self.xcum[1:kept_qty + 1])
+        numpy.cumsum(kept_samples * kept_samples, out=self.xsqcum[1:kept_qty + 1])
+
+    def extend(self, values):
+        values = numpy.asarray(values, dtype=float)
+        while len(values) > 0:
+            if self.samples_qty - self.base_index == len(self.samples):
+                self._rebase()
+            position = self.samples_qty - self.base_index
+            chunk = values[:len(self.samples) - position]
+            values = values[len(chunk):]
+            self.samples[position:position + len(chunk)] = chunk
+            numpy.cumsum(chunk, out=self.xcum[position + 1:position + len(chunk) + 1])
+            self.xcum[position + 1:position + len(chunk) + 1] += self.xcum[position]
+            numpy.cumsum(chunk * chunk, out=self.xsqcum[position + 1:position + len(chunk) + 1])
+            self.xsqcum[position + 1:position + len(chunk) + 1] += self.xsqcum[position]
+            self.samples_qty += len(chunk)
+
+    def append(self, value):
+        self.extend([value])
+
+    def statistics(self):
+        """
+        :return: the output vector of crs for the current window
+        """
+        if not self.is_ready:
+            raise ValueError('Expected at least {} samples, got {}'.format(self.window_size, self.samples_qty))
+        window_start = self.samples_qty - self.window_size
+        blocks = {}
+        missing_blocks = []
+        for _, d, nval in self.lags:
+            for i in range(nval):
+                block = (window_start + self.blksize * i, d)
+                if block in blocks:
+                    continue
+                if block in self.blocks:
+                    blocks[block] = self.blocks[block]
+                else:
+                    blocks[block] = None
+                    missing_blocks.append(block)
+        if len(missing_blocks) > 0:
+            starts = numpy.array([start for start, _ in missing_blocks]) - self.base_index
+            lengths = numpy.array([d for _, d in missing_blocks])
+            r, radj = block_statistics(self.xcum, self.xsqcum, starts, lengths)
+            for block, block_r, block_radj in zip(missing_blocks, r.tolist(), radj.tolist()):
+                blocks[block] = (block_r, block_radj)
+        # Only the blocks of the current window are kept, the older ones can't be part of the next ones
+        self.blocks = blocks
+        output = [0] * (2 * self.nblk * self.nlag)
+        for k, d, nval in self.lags:
+            for i in range(nval):
+                output[k * self.nblk + i], output[self.nblk * self.nlag + k * self.nblk + i] = \
+                    blocks[(window_start + self.blksize * i, d)]
+        return output
+
+    def hurst(self):
+        """
+        :return: the R/S estimation of H over the last window_size samples
+        """
+        return _rs_fit(self.statistics(), self.window_size)
+
+
+class WindowedHurst:
+    """
+    Sliding window of the last window_size samples for the estimators without an online version,
+    which estimate H over the whole window each time.
+    """
+    def __init__(self, function, window_size=1024):
+        self.function = function
+        self.window_size = window_size
+        self.samples = deque(maxlen=window_size)
+
+    @property
+    def is_ready(self):
+        return len(self.samples) == self.window_size
+
+    def extend(self, values):
+        self.samples.extend(values)
+
+    def append(self, value):
+        self.samples.append(value)
+
+    def hurst(self):
+        if not self.is_ready:
+            raise ValueError('Expected at least {} samples, got {}'.format(self.window_size, len(self.samples)))
+        return self.function(list(self.samples))
+
+
+class HurstEstimator:
+    """
+    An estimator of H of the registry.
+
+    :param function: estimates H of a single series
+    :param batch_function: estimates H of every row of a 2-D block of series
+    :param cost_class: COST_LOW, COST_MEDIUM or COST_HIGH, the rough CPU cost of an estimation compared to the
+    other estimators, so each deployment can choose what it can afford
+    :param online_class: class of the sliding window version, built with the window size. If None, a
+    WindowedHurst is used
+    """
+    def __init__(self, name, function, batch_function, cost_class, online_class=None):
+        self.name = name
+        self.function = function
+        self.batch_function = batch_function
+        self.cost_class = cost_class
+        self.online_class = online_class
+
+    def create_online(self, window_size):
+        if self.online_class is None:
+            return WindowedHurst(self.function, window_size)
+        return self.online_class(window_size)
+
+
+ESTIMATORS = OrderedDict((estimator.name, estimator) for estimator in [
+    HurstEstimator('wavelet', wavelet, wavelet_batch, COST_MEDIUM),
+    HurstEstimator('rs', rs, rs_batch, COST_HIGH, RollingRS),
+    HurstEstimator('aggregated_variance', aggregated_variance, aggregated_variance_batch, COST_MEDIUM),
+    HurstEstimator('dfa', dfa, dfa_batch, COST_MEDIUM),
+    HurstEstimator('periodogram', periodogram, periodogram_batch, COST_LOW),
+])
+DEFAULT_ESTIMATORS = ('wavelet', 'rs')
+# The API has always received the wavelet and R/S estimations, so they are run even when they are not selected
+REQUIRED_ESTIMATORS = ('wavelet', 'rs')
+
+
+def select_estimators(estimators_names):
+    """
+    :param estimators_names: names of estimators of ESTIMATORS, like the ones of TIX_HURST_ESTIMATORS
+    :return: tuple with the known names, without repetitions, followed by the ones of REQUIRED_ESTIMATORS
+    that are missing, or DEFAULT_ESTIMATORS if none is known
+    """
+    logger = logging.getLogger(__name__).getChild('select_estimators')
+    selected_names = []
+    for estimator_name in estimators_names:
+        if estimator_name not in ESTIMATORS:
+            logger.warning('Ignoring unknown Hurst estimator {}'.format(estimator_name))
+        elif estimator_name not in selected_names:
+            selected_names.append(estimator_name)
+    if len(selected_names) == 0:
+        logger.warning('No known Hurst estimator selected, using {}'.format(', '.join(DEFAULT_ESTIMATORS)))
+        return DEFAULT_ESTIMATORS
+    for estimator_name in REQUIRED_ESTIMATORS:
+        if estimator_name not in selected_names:
+            logger.warning('Adding the Hurst estimator {}, its estimations are posted to the API'.format(
+                estimator_name))
+            selected_names.append(estimator_name)
+    return tuple(selected_names)
@@ -0,0 +1,244 @@
+import cProfile
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from os.path import join, dirname
+
+from processor import METRICS_SINKS, METRICS_STATSD_HOST, METRICS_STATSD_PORT, METRICS_PROMETHEUS_PATH, \
+    PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+LOG_SINK = 'log'
+STATSD_SINK = 'statsd'
+PROMETHEUS_SINK = 'prometheus'
+
+
+class TaskMetrics:
+    """
+    Timers and counters of a single task. Timers accumulate the seconds spent in each stage,
+    so a stage run many times, like the analysis of each window, is reported once.
+    """
+    def __init__(self, task_name, tags=None):
+        self.task_name = task_name
+        self.tags = tags or {}
+        self.timers = {}
+        self.counters = {}
+
+    def increment(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+
+class NullMetrics:
+    """
+    Used outside of a collected task, so the instrumented code costs a method call when metrics are disabled.
+    """
+    NULL_TIMER = NullTimer()
+
+    def increment(self, name, value=1):
+        pass
+
+    def add_time(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return self.NULL_TIMER
+
+
+NULL_METRICS = NullMetrics()
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'metrics', NULL_METRICS)
+
+
+def increment(name, value=1):
+    current().increment(name, value)
+
+
+def timer(name):
+    return current().timer(name)
+
+
+class LogSink:
+    def emit(self, task_metrics):
+        logger.getChild('LogSink').info('{task_name} {tags} timers={timers} counters={counters}'.format(
+            task_name=task_metrics.task_name,
+            tags=task_metrics.tags,
+            timers={name: round(seconds, 6) for name, seconds in sorted(task_metrics.timers.items())},
+            counters=dict(sorted(task_metrics.counters.items()))))
+
+
+class StatsDSink:
+    """
+    Sends the timers, in milliseconds, and the counters of each task to a StatsD server over UDP.
+    """
+    def __init__(self, host=METRICS_STATSD_HOST, port=METRICS_STATSD_PORT, prefix='tix.processor'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def get_lines(self, task_metrics):
+        lines = ['{prefix}.{task_name}.{name}:{value}|ms'.format(prefix=self.prefix, task_name=task_metrics.task_name,
+                                                                 name=name, value=round(seconds * 1000, 3))
+                 for name, seconds in sorted(task_metrics.timers.items())]
+        lines += ['{prefix}.{task_name}.{name}:{value}|c'.format(prefix=self.prefix, task_name=task_metrics.task_name,
+                                                                 name=name, value=value)
+                  for name, value in sorted(task_metrics.counters.items())]
+        return lines
+
+    def emit(self, task_metrics):
+        lines = self.get_lines(task_metrics)
+        if len(lines) > 0:
+            self.socket.sendto('\n'.join(lines).encode(), self.address)
+
+
+class PrometheusTextfileSink:
+    """
+    Keeps the totals of every task of the process and rewrites them after each task in the text file
+    format read by the node exporter textfile collector. Each process writes its own file, since the
+    path is formatted with its pid.
+    """
+    def __init__(self, path=METRICS_PROMETHEUS_PATH, prefix='tix_processor'):
+        self.path = path
+        self.prefix = prefix
+        self.seconds_totals = {}
+        self.counters_totals = {}
+        self.tasks_totals = {}
+
+    def add(self, task_metrics):
+        task_name = task_metrics.task_name
+        self.tasks_totals[task_name] = self.tasks_totals.get(task_name, 0) + 1
+        for name, seconds in task_metrics.timers.items():
+            key = (task_name, name)
+            self.seconds_totals[key] = self.seconds_totals.get(key, 0.0) + seconds
+        for name, value in task_metrics.counters.items():
+            key = (task_name, name)
+            self.counters_totals[key] = self.counters_totals.get(key, 0) + value
+
+    def get_lines(self):
+        lines = ['# TYPE {}_tasks_total counter'.format(self.prefix)]
+        lines += ['{prefix}_tasks_total{{task="{task_name}"}} {value}'.format(prefix=self.prefix,
+                                                                              task_name=task_name, value=value)
+                  for task_name, value in sorted(self.tasks_totals.items())]
+        lines.append('# TYPE {}_stage_seconds_total counter'.format(self.prefix))
+        lines += ['{prefix}_stage_seconds_total{{task="{task_name}",stage="{name}"}} {value}'
+                  .format(prefix=self.prefix, task_name=task_name, name=name, value=value)
+                  for (task_name, name), value in sorted(self.seconds_totals.items())]
+        for (task_name, name), value in sorted(self.counters_totals.items()):
+            lines.append('{prefix}_{name}_total{{task="{task_name}"}} {value}'.format(prefix=self.prefix,
+                                                                                     task_name=task_name,
+                                                                                     name=name, value=value))
+        return lines
+
+    def emit(self, task_metrics):
+        self.add(task_metrics)
+        file_path = self.path.format(pid=os.getpid())
+        temporary_file_path = '{}.tmp'.format(file_path)
+        with open(temporary_file_path, 'w') as textfile:
+            textfile.write('\n'.join(self.get_lines()) + '\n')
+        # The collector must never read a half written file
+        os.replace(temporary_file_path, file_path)
+
+
+SINKS_CLASSES = {
+    LOG_SINK: LogSink,
+    STATSD_SINK: StatsDSink,
+    PROMETHEUS_SINK: PrometheusTextfileSink
+}
+
+
+def create_sinks(sinks_names):
+    sinks = []
+    for sink_name in sinks_names:
+        if sink_name not in SINKS_CLASSES:
+            logger.warning('Ignoring unknown metrics sink {}'.format(sink_name))
+            continue
+        sinks.append(SINKS_CLASSES[sink_name]())
+    return sinks
+
+
+_sinks = None
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        _sinks = create_sinks(METRICS_SINKS)
+    return _sinks
+
+
+def get_profile_file_path(profile_dir, task_name, tags):
+    tags_suffix = ''.join('-{}'.format(value) for _, value in sorted(tags.items()))
+    return join(profile_dir, '{task_name}{tags_suffix}-{pid}-{timestamp}.prof'.format(
+        task_name=task_name, tags_suffix=tags_suffix, pid=os.getpid(), timestamp=int(time.time() * 1000)))
+
+
+@contextmanager
+def collect(task_name, tags=None, sinks=None, profile_dir=PROFILE_DIR):
+    """
+    Collects the metrics of the code run inside it in the current thread, and emits them to the sinks
+    when it ends. When there are no sinks nor profile_dir it does nothing, and the instrumented code
+    keeps using NULL_METRICS.
+
+    :param task_name:
+    :param tags: dict identifying the task run, such as the user and installation ids
+    :param sinks: the sinks to emit to, by default the ones configured with TIX_METRICS_SINKS
+    :param profile_dir: if not None, a cProfile dump of the task is written to this directory
+    """
+    if sinks is None:
+        sinks = get_sinks()
+    if len(sinks) == 0 and profile_dir is None:
+        yield NULL_METRICS
+        return
+    task_metrics = TaskMetrics(task_name, tags)
+    previous_metrics = current()
+    _local.metrics = task_metrics
+    profiler = None
+    if profile_dir is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with task_metrics.timer('total'):
+            yield task_metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _local.metrics = previous_metrics
+        if profiler is not None:
+            profile_file_path = get_profile_file_path(profile_dir, task_name, task_metrics.tags)
+            try:
+                os.makedirs(dirname(profile_file_path), exist_ok=True)
+                profiler.dump_stats(profile_file_path)
+            except OSError as error:
+                logger.warning('Could not write profile {}: {}'.format(profile_file_path, error))
+        for sink in sinks:
+            try:
+                sink.emit(task_metrics)
+            except Exception as error:
+                # Metrics must never break the processing
+                logger.warning('Could not emit metrics to {}: {}'.format(sink.__class__.__name__, error))
@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import listdir, unlink
+from os.path import join, exists, getmtime
+
+from processor import api_communication
+from processor.reports import ReportHandler
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the replay threads. acquire() blocks until a token is available.
+    """
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            self.sleep(wait_time)
+
+
+class ReplayProgress:
+    def __init__(self, total=0):
+        self.total = total
+        self.posted = 0
+        self.failed = 0
+        self.invalid = 0
+        self.lock = threading.Lock()
+
+    def increment(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            return self.done
+
+    @property
+    def done(self):
+        return self.posted + self.failed + self.invalid
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'posted': self.posted,
+            'failed': self.failed,
+            'invalid': self.invalid
+        }
+
+
+class FailedResult:
+    def __init__(self, file_path, user_id, installation_id, timestamp):
+        self.file_path = file_path
+        self.user_id = user_id
+        self.installation_id = installation_id
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return '{0!s}({1!r})'.format(self.__class__, self.__dict__)
+
+
+def find_failed_results(installations):
+    """
+    Lists the failed results of all the installations, oldest first.
+
+    :param installations: iterable of (installation_dir_path, user_id, installation_id) tuples
+    :return: list of FailedResult
+    """
+    failed_results = []
+    for installation_dir_path, user_id, installation_id in installations:
+        failed_results_dir_path = join(installation_dir_path, ReportHandler.FAILED_RESULTS_DIR_NAME)
+        if not exists(failed_results_dir_path):
+            continue
+        for file_name in listdir(failed_results_dir_path):
+            if not file_name.endswith('.json'):
+                continue
+            file_path = join(failed_results_dir_path, file_name)
+            timestamp = ReportHandler.get_failed_result_timestamp(file_name)
+            if timestamp is None:
+                timestamp = getmtime(file_path)
+            failed_results.append(FailedResult(file_path, user_id, installation_id, timestamp))
+    failed_results.sort(key=lambda failed_result: failed_result.timestamp)
+    return failed_results
+
+
+def replay_failed_result(failed_result, rate_limiter, progress, progress_log_interval):
+    log = logger.getChild('replay_failed_result')
+    try:
+        with open(failed_result.file_path) as failed_result_file:
+            failed_result_json = json.load(failed_result_file)
+        results = failed_result_json['results']
+        ip = failed_result_json['ip']
+    except (OSError, ValueError, KeyError) as error:
+        log.error('Could not read failed result {}: {}'.format(failed_result.file_path, error))
+        counter = 'invalid'
+    else:
+        rate_limiter.acquire()
+        if api_communication.post_results(ip, results, failed_result.user_id, failed_result.installation_id):
+            try:
+                unlink(failed_result.file_path)
+            except OSError as error:
+                # It was posted anyway, it is posted again by the next replay if it is still there
+                log.error('Could not delete posted failed result {}: {}'.format(failed_result.file_path, error))
+            counter = 'posted'
+        else:
+            counter = 'failed'
+    done = progress.increment(counter)
+    if done % progress_log_interval == 0 or done == progress.total:
+        log.info('Replayed {done}/{total} failed results: {progress}'.format(done=done,
+                                                                             total=progress.total,
+                                                                             progress=progress.as_dict()))
+
+
+def replay_failed_results(installations, max_workers=4, rate=10, progress_log_interval=100):
+    """
+    Posts the backed up failed results of the installations, oldest first, with at most max_workers posts
+    in flight and at most rate posts per second. Each file is deleted only after it was posted successfully.
+
+    :param installations: iterable of (installation_dir_path, user_id, installation_id) tuples
+    :return: dict with the progress counters
+    """
+    failed_results = find_failed_results(installations)
+    progress = ReplayProgress(len(failed_results))
+    rate_limiter = RateLimiter(rate)
+    log = logger.getChild('replay_failed_results')
+    with ThreadPoolExecutor(max_workers=max_workers) as replay_pool:
+        replay_futures = {replay_pool.submit(replay_failed_result, failed_result, rate_limiter, progress,
+                                             progress_log_interval): failed_result
+                          for failed_result in failed_results}
+        for replay_future in as_completed(replay_futures):
+            try:
+                replay_future.result()
+            except Exception as error:
+                # The file is kept, so it is replayed again the next time
+                log.error('Error while trying to replay failed result {}: {}'.format(
+                    replay_futures[replay_future].file_path, error))
+                progress.increment('failed')
+    return progress.as_dict()
@@ -2,34 +2,43 @@ import base64
 import datetime
 import json
 import os
+import struct
 from os import listdir, unlink, mkdir, rename
 
-from os.path import join, exists, isfile, islink
+from os.path import join, exists, isfile, islink, basename, dirname
 
 import logging
 
-import struct
+from numbers import Integral
 
 import inflection
 import jsonschema
+import numpy
+
+from processor import REPORTS_CACHE
+from processor import metrics
 
 logger = logging.getLogger(__name__)
 
 
 class ReportFieldTypes:
     class ReportFieldType:
-        def __init__(self, name, byte_size, struct_type):
+        def __init__(self, name, byte_size, struct_type, numpy_type):
             self.name = name
             self.byte_size = byte_size
             self.struct_type = struct_type
+            self.numpy_type = numpy_type
 
         def get_struct_representation(self):
             return ReportFieldTypes.endian_type + self.struct_type
 
+        def get_numpy_representation(self):
+            return ReportFieldTypes.endian_type + self.numpy_type
+
     endian_type = '>'
-    Integer = ReportFieldType('int', 4, 'i')
-    Char = ReportFieldType('char', 1, 'c')
-    Long = ReportFieldType('long', 8, 'q')
+    Integer = ReportFieldType('int', 4, 'i', 'i4')
+    Char = ReportFieldType('char', 1, 'c', 'S1')
+    Long = ReportFieldType('long', 8, 'q', 'i8')
 
 
 class FieldTranslation:
@@ -130,34 +139,190 @@ class SerializedObservation:
         SerializedObservationField('final_timestamp', ReportFieldTypes.Long),
     ]
     byte_size = sum([field.type.byte_size for field in fields])
+    dtype = numpy.dtype([(field.name, field.type.numpy_type) for field in fields])
+    # Same layout as the records in the reports' messages, so they can be viewed without copying them
+    serialized_dtype = numpy.dtype([(field.name, field.type.get_numpy_representation()) for field in fields])
+
+
+class ObservationBatch:
+    """
+    Columnar representation of a group of observations, backed by a numpy structured array
+    with the fields of SerializedObservation.
+    Each field is available as a column with the same name as the Observation attribute.
+    Indexing with an integer or iterating over the batch returns Observation objects, for compatibility.
+    is_sorted tells that the records are sorted by day_timestamp, so they don't need to be sorted again.
+    It is kept by slices and boolean masks.
+    """
+    def __init__(self, records=None, is_sorted=False):
+        if records is None:
+            records = numpy.empty(0, dtype=SerializedObservation.dtype)
+        self.records = records
+        self.is_sorted = is_sorted
+
+    @classmethod
+    def from_observations(cls, observations):
+        records = numpy.array([(observation.day_timestamp,
+                                observation.type_identifier,
+                                observation.packet_size,
+                                observation.initial_timestamp,
+                                observation.reception_timestamp,
+                                observation.sent_timestamp,
+                                observation.final_timestamp)
+                               for observation in observations],
+                              dtype=SerializedObservation.dtype)
+        return cls(records)
+
+    @classmethod
+    def merge_sorted_runs(cls, batches):
+        """
+        Merges batches sorted by day_timestamp into one batch without duplicated records, in the same order
+        unique() leaves them: by day_timestamp and then by the rest of the fields.
+
+        :param batches: iterable of ObservationBatch, each one sorted by day_timestamp
+        :return: sorted ObservationBatch
+        """
+        merged_batch = cls.concatenate(batches)
+        if len(merged_batch) == 0:
+            return cls(is_sorted=True)
+        # The stable sort finds the sorted runs and merges them
+        records = merged_batch.records[numpy.argsort(merged_batch.day_timestamp, kind='mergesort')]
+        day_timestamps = records['day_timestamp']
+        same_day_timestamp = day_timestamps[1:] == day_timestamps[:-1]
+        tied = numpy.zeros(len(records), dtype=bool)
+        tied[1:] |= same_day_timestamp
+        tied[:-1] |= same_day_timestamp
+        tied_indexes = numpy.flatnonzero(tied)
+        duplicated = numpy.zeros(len(records), dtype=bool)
+        if len(tied_indexes) > 0:
+            # Only the records that share their day_timestamp need to be sorted by the rest of the fields,
+            # and only those can be duplicated
+            tied_records = records[tied_indexes]
+            tied_records = tied_records[numpy.lexsort([tied_records[name]
+                                                       for name in reversed(SerializedObservation.dtype.names)])]
+            records[tied_indexes] = tied_records
+            duplicated[tied_indexes[1:]] = ((tied_indexes[1:] == tied_indexes[:-1] + 1) &
+                                            (tied_records[1:] == tied_records[:-1]))
+        return cls(records[~duplicated], is_sorted=True)
+
+    @classmethod
+    def concatenate(cls, batches):
+        batches = list(batches)
+        if len(batches) == 0:
+            return cls()
+        return cls(numpy.concatenate([batch.records.astype(SerializedObservation.dtype, copy=False)
+                                      for batch in batches]))
+
+    @property
+    def day_timestamp(self):
+        return self.records['day_timestamp']
+
+    @property
+    def type_identifier(self):
+        return self.records['type_identifier']
+
+    @property
+    def packet_size(self):
+        return self.records['packet_size']
+
+    @property
+    def initial_timestamp(self):
+        return self.records['initial_timestamp']
+
+    @property
+    def reception_timestamp(self):
+        return self.records['reception_timestamp']
+
+    @property
+    def sent_timestamp(self):
+        return self.records['sent_timestamp']
+
+    @property
+    def final_timestamp(self):
+        return self.records['final_timestamp']
+
+    def sorted_by_day_timestamp(self):
+        if self.is_sorted:
+            return self
+        sorted_batch = self[numpy.argsort(self.day_timestamp, kind='mergesort')]
+        sorted_batch.is_sorted = True
+        return sorted_batch
+
+    def unique(self):
+        return ObservationBatch(numpy.unique(self.records.astype(SerializedObservation.dtype, copy=False)),
+                                is_sorted=True)
+
+    def to_observations(self):
+        return list(self)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for observation_values in self.records.tolist():
+            yield Observation(*observation_values)
+
+    def __getitem__(self, index):
+        if isinstance(index, Integral):
+            return Observation(*self.records[index].tolist())
+        keeps_order = isinstance(index, slice) and (index.step is None or index.step > 0) or \
+            (isinstance(index, numpy.ndarray) and index.dtype == bool)
+        return ObservationBatch(self.records[index], is_sorted=self.is_sorted and keeps_order)
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return numpy.array_equal(self.records.astype(SerializedObservation.dtype, copy=False),
+                                     other.records.astype(SerializedObservation.dtype, copy=False))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0!s}({1!r})'.format(self.__class__, self.records)
 
 
 def serialize_observations(observations):
-    bytes_message = bytes()
-    for observation in observations:
-        observation_bytes = bytes()
-        for field in SerializedObservation.fields:
-            field_bytes = struct.pack(field.type.get_struct_representation(), getattr(observation, field.name))
-            observation_bytes = b''.join([observation_bytes, field_bytes])
-        bytes_message = b''.join([bytes_message, observation_bytes])
-    return base64.b64encode(bytes_message).decode()
+    if not isinstance(observations, ObservationBatch):
+        observations = ObservationBatch.from_observations(observations)
+    records = observations.records.astype(SerializedObservation.serialized_dtype, copy=False)
+    return base64.b64encode(records.tobytes()).decode()
+
+
+def message_observations_qty(message):
+    """
+    Amount of observations in a base64 message, computed from its length without decoding it.
+    """
+    padding = len(message) - len(message.rstrip('='))
+    return (len(message) * 3 // 4 - padding) // SerializedObservation.serialized_dtype.itemsize
+
+
+def decode_message_bytes(message, start, end):
+    """
+    Decodes only the bytes from start to end of a base64 message.
+    """
+    first_group = start // 3
+    last_group = (end + 2) // 3
+    decoded_bytes = base64.b64decode(message[first_group * 4:last_group * 4])
+    return decoded_bytes[start - first_group * 3:end - first_group * 3]
+
+
+def deserialize_message_observation(message, index):
+    """
+    Decodes a single observation of a base64 message.
+    """
+    record_size = SerializedObservation.serialized_dtype.itemsize
+    if index < 0:
+        index += message_observations_qty(message)
+    if not 0 <= index < message_observations_qty(message):
+        raise IndexError('observation index out of range')
+    record_bytes = decode_message_bytes(message, index * record_size, (index + 1) * record_size)
+    return ObservationBatch(numpy.frombuffer(record_bytes, dtype=SerializedObservation.serialized_dtype))[0]
 
 
 def deserialize_observations(message):
     bytes_message = base64.b64decode(message)
-    observations = []
-    for message_index in range(0, len(bytes_message), SerializedObservation.byte_size):
-        line = bytes_message[message_index:message_index + SerializedObservation.byte_size]
-        observation_dict = {}
-        line_struct_format = ReportFieldTypes.endian_type
-        for field in SerializedObservation.fields:
-            line_struct_format += field.type.struct_type
-        line_tuple = struct.unpack(line_struct_format, line)
-        for field_index in range(len(SerializedObservation.fields)):
-            field = SerializedObservation.fields[field_index]
-            observation_dict[field.name] = line_tuple[field_index]
-        observations.append(Observation(**observation_dict))
-    return observations
+    records = numpy.frombuffer(bytes_message, dtype=SerializedObservation.serialized_dtype)
+    metrics.increment('observations_decoded', len(records))
+    return ObservationBatch(records)
 
 
 JSON_FIELDS_TRANSLATIONS = [
@@ -207,24 +372,77 @@ JSON_REPORT_SCHEMA = {
 }
 
 
+def get_json_schema_property_type(property_schema):
+    if 'type' in property_schema:
+        return property_schema['type']
+    property_types = set(get_json_schema_property_type(option) for option in property_schema['anyOf'])
+    if len(property_types) != 1:
+        raise ValueError('Unsupported property schema {}'.format(property_schema))
+    return property_types.pop()
+
+
+def build_json_report_keys_translations():
+    keys_translations = {key: inflection.underscore(key) for key in JSON_REPORT_SCHEMA['properties']}
+    for field_translation in JSON_FIELDS_TRANSLATIONS:
+        keys_translations[field_translation.original] = field_translation.translation
+    return keys_translations
+
+
+JSON_REPORT_VALIDATOR = jsonschema.validators.validator_for(JSON_REPORT_SCHEMA)(JSON_REPORT_SCHEMA)
+JSON_REPORT_KEYS_TRANSLATIONS = build_json_report_keys_translations()
+JSON_REPORT_PROPERTIES_TYPES = {key: get_json_schema_property_type(property_schema)
+                                for key, property_schema in JSON_REPORT_SCHEMA['properties'].items()}
+JSON_REPORT_PROPERTIES_ENUMS = {key: property_schema['enum']
+                                for key, property_schema in JSON_REPORT_SCHEMA['properties'].items()
+                                if 'enum' in property_schema}
+
+
+def is_json_integer(value):
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, Integral) or (isinstance(value, float) and value.is_integer())
+
+
+JSON_TYPES_CHECKS = {
+    'string': lambda value: isinstance(value, str),
+    'integer': is_json_integer
+}
+
+
+def is_report_json_dict(json_dict):
+    """
+    Hand-written equivalent of validating a dict against JSON_REPORT_SCHEMA. Just like jsonschema.validate
+    without a format checker, the formats of the addresses are not checked.
+    """
+    for key in JSON_REPORT_SCHEMA['required']:
+        if key not in json_dict:
+            return False
+    for key, value in json_dict.items():
+        property_type = JSON_REPORT_PROPERTIES_TYPES.get(key)
+        if property_type is not None and not JSON_TYPES_CHECKS[property_type](value):
+            return False
+        if key in JSON_REPORT_PROPERTIES_ENUMS and value not in JSON_REPORT_PROPERTIES_ENUMS[key]:
+            return False
+    return True
+
+
 class ReportJSONEncoder(json.JSONEncoder):
     @staticmethod
     def report_to_dict(report_object):
-        report_dict = report_object.__dict__.copy()
+        report_dict = {field: getattr(report_object, field) for field in Report.FIELDS}
         for field_translation in JSON_FIELDS_TRANSLATIONS:
-            field_value = report_dict.pop(field_translation.translation)
-            report_dict[field_translation.original] = field_translation.reverse_translate(field_value)
+            if field_translation.translation in report_dict:
+                field_value = report_dict.pop(field_translation.translation)
+                report_dict[field_translation.original] = field_translation.reverse_translate(field_value)
+        # The message of a report whose observations were never decoded is kept as is
+        if report_object.message is not None:
+            report_dict['message'] = report_object.message
+        else:
+            report_dict['message'] = serialize_observations(report_object.observations)
         report_dict_fields = list(report_dict.keys())
         for field in report_dict_fields:
             inflexed_key = inflection.camelize(field, False)
             report_dict[inflexed_key] = report_dict.pop(field)
-        fields_to_delete = []
-        report_dict_fields = list(report_dict.keys())
-        for field in report_dict_fields:
-            if field not in JSON_REPORT_SCHEMA['required']:
-                fields_to_delete.append(field)
-        for field in fields_to_delete:
-            report_dict.pop(field)
         return report_dict
 
     def default(self, obj):
@@ -249,28 +467,73 @@ class ReportJSONDecoder(json.JSONDecoder):
         return Report(**json_dict)
 
     def dict_to_object(self, d):
-        try:
-            jsonschema.validate(d, JSON_REPORT_SCHEMA)
-            inst = self.dict_to_report(d)
-        except jsonschema.ValidationError:
-            inst = d
-        return inst
+        if JSON_REPORT_VALIDATOR.is_valid(d):
+            return self.dict_to_report(d)
+        return d
 
     def __init__(self):
         json.JSONDecoder.__init__(self, object_hook=self.dict_to_object)
 
 
+class FastReportJSONDecoder(ReportJSONDecoder):
+    """
+    Decodes the same reports as ReportJSONDecoder, but checks them with is_report_json_dict, translates
+    their keys with a static table and leaves the message to be decoded when the observations are used.
+    """
+    @staticmethod
+    def dict_to_report(json_dict):
+        report_fields = {}
+        for key, value in json_dict.items():
+            translated_key = JSON_REPORT_KEYS_TRANSLATIONS.get(key)
+            if translated_key is None:
+                translated_key = inflection.underscore(key)
+            report_fields[translated_key] = value
+        message = report_fields.pop('observations')
+        return Report.from_message(message, **report_fields)
+
+    def dict_to_object(self, d):
+        if is_report_json_dict(d):
+            return self.dict_to_report(d)
+        return d
+
+
 class Report:
+    # Fields of the report besides its observations
+    FIELDS = ['from_dir', 'to_dir', 'packet_type',
+              'initial_timestamp', 'reception_timestamp', 'sent_timestamp', 'final_timestamp',
+              'public_key', 'signature', 'user_id', 'installation_id']
+
     @staticmethod
-    def load(report_file_path):
-        with open(report_file_path) as fp:
-            report = json.load(fp, cls=ReportJSONDecoder)
-        report.file_path = report_file_path
+    def load(report_file_path, use_cache=REPORTS_CACHE, json_decoder=FastReportJSONDecoder):
+        with metrics.timer('load_reports'):
+            metrics.increment('reports_loaded')
+            if use_cache:
+                report_stat = os.stat(report_file_path)
+                report = ReportCache.load(report_file_path, report_stat)
+                if report is not None:
+                    metrics.increment('reports_cache_hits')
+                    return report
+            with open(report_file_path, 'rb') as fp:
+                report_bytes = fp.read()
+            metrics.increment('bytes_read', len(report_bytes))
+            report = json.loads(report_bytes.decode('utf-8'), cls=json_decoder)
+            report.file_path = report_file_path
+            if use_cache and isinstance(report, Report):
+                ReportCache.write(report, report_stat)
+            return report
+
+    @classmethod
+    def from_message(cls, message, **report_fields):
+        """
+        Creates a report whose observations are only decoded from the message when they are used.
+        """
+        report = cls(observations=None, **report_fields)
+        report.message = message
         return report
 
     @staticmethod
     def get_gap_between_reports(second_report, first_report):
-        return second_report.observations[0].day_timestamp - first_report.observations[0].day_timestamp
+        return second_report.first_day_timestamp - first_report.first_day_timestamp
 
     def __init__(self,
                  from_dir, to_dir, packet_type,
@@ -285,18 +548,53 @@ class Report:
         self.sent_timestamp = sent_timestamp
         self.final_timestamp = final_timestamp
         self.public_key = public_key
-        self.observations = observations
+        self.message = None
+        self._observations = observations
         self.signature = signature
         self.user_id = user_id
         self.installation_id = installation_id
         self.file_path = file_path
 
+    @property
+    def observations(self):
+        if self.message is not None:
+            self._observations = deserialize_observations(self.message)
+            self.message = None
+        return self._observations
+
+    @observations.setter
+    def observations(self, observations):
+        self.message = None
+        self._observations = observations
+
+    # While the observations are not decoded, these are read from the length and the records of the message
+
+    @property
+    def observations_qty(self):
+        if self.message is not None:
+            return message_observations_qty(self.message)
+        return len(self.observations)
+
+    @property
+    def first_day_timestamp(self):
+        if self.message is not None:
+            return deserialize_message_observation(self.message, 0).day_timestamp
+        return self.observations[0].day_timestamp
+
+    @property
+    def last_day_timestamp(self):
+        if self.message is not None:
+            return deserialize_message_observation(self.message, -1).day_timestamp
+        return self.observations[-1].day_timestamp
+
     def get_observations_gap(self):
-        return self.observations[-1].day_timestamp - self.observations[0].day_timestamp
+        return self.last_day_timestamp - self.first_day_timestamp
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return ([getattr(self, field) for field in self.FIELDS] == [getattr(other, field) for field in self.FIELDS]
+                    and self.file_path == other.file_path
+                    and self.observations == other.observations)
         return NotImplemented
 
     def __hash__(self):
@@ -317,6 +615,343 @@ class Report:
         return '{0!s}({1!r})'.format(self.__class__, self.__dict__)
 
 
+def unlink_files(file_paths):
+    """
+    Unlinks the files, ignoring the ones that don't exist. The files of each directory are unlinked through
+    a single descriptor of it, instead of resolving the whole path of each one.
+
+    :param file_paths: iterable of file paths
+    :return: the amount of files unlinked
+    """
+    files_names_per_dir = {}
+    for file_path in file_paths:
+        files_names_per_dir.setdefault(dirname(file_path), []).append(basename(file_path))
+    unlinked_qty = 0
+    use_dir_fd = os.unlink in os.supports_dir_fd
+    for dir_path, files_names in files_names_per_dir.items():
+        dir_fd = None
+        if use_dir_fd:
+            try:
+                dir_fd = os.open(dir_path or '.', os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+        try:
+            for file_name in files_names:
+                try:
+                    if dir_fd is None:
+                        unlink(join(dir_path, file_name))
+                    else:
+                        unlink(file_name, dir_fd=dir_fd)
+                    unlinked_qty += 1
+                except FileNotFoundError:
+                    pass
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+    return unlinked_qty
+
+
+class ReportCache:
+    """
+    Binary copy of a report, written beside it the first time it is read. It has a fixed header, the report
+    fields as JSON, and the observation records with the same layout they have in the report message, so
+    they are memory-mapped instead of parsed. It is only used while the report keeps its mtime and size.
+    """
+    FILE_SUFFIX = '.cache'
+    MAGIC = b'TIXRC001'
+    HEADER = struct.Struct('>8sI')
+    FIELDS = Report.FIELDS
+
+    @classmethod
+    def get_file_path(cls, report_file_path):
+        return report_file_path + cls.FILE_SUFFIX
+
+    @classmethod
+    def load(cls, report_file_path, report_stat):
+        """
+        :return: the cached Report, or None if there is no fresh cache for it
+        """
+        cache_file_path = cls.get_file_path(report_file_path)
+        try:
+            with open(cache_file_path, 'rb') as cache_file:
+                magic, metadata_size = cls.HEADER.unpack(cache_file.read(cls.HEADER.size))
+                if magic != cls.MAGIC:
+                    return None
+                metadata = json.loads(cache_file.read(metadata_size).decode())
+            if metadata['mtime_ns'] != report_stat.st_mtime_ns or metadata['size'] != report_stat.st_size:
+                return None
+            records_qty = metadata['observations_qty']
+            if records_qty > 0:
+                records = numpy.memmap(cache_file_path, dtype=SerializedObservation.serialized_dtype, mode='r',
+                                       offset=cls.HEADER.size + metadata_size, shape=(records_qty,))
+            else:
+                records = numpy.empty(0, dtype=SerializedObservation.serialized_dtype)
+            report_fields = {field: metadata[field] for field in cls.FIELDS}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, struct.error) as error:
+            logger.warning('Ignoring unreadable report cache {}: {}'.format(cache_file_path, error))
+            return None
+        return Report(observations=ObservationBatch(records), file_path=report_file_path, **report_fields)
+
+    @classmethod
+    def write(cls, report, report_stat):
+        metadata = {field: getattr(report, field) for field in cls.FIELDS}
+        metadata['mtime_ns'] = report_stat.st_mtime_ns
+        metadata['size'] = report_stat.st_size
+        metadata['observations_qty'] = report.observations_qty
+        encoded_metadata = json.dumps(metadata).encode()
+        records = report.observations.records.astype(SerializedObservation.serialized_dtype, copy=False)
+        cache_file_path = cls.get_file_path(report.file_path)
+        temporary_file_path = cache_file_path + '.tmp'
+        try:
+            with open(temporary_file_path, 'wb') as cache_file:
+                cache_file.write(cls.HEADER.pack(cls.MAGIC, len(encoded_metadata)))
+                cache_file.write(encoded_metadata)
+                cache_file.write(records.tobytes())
+            os.replace(temporary_file_path, cache_file_path)
+        except OSError as error:
+            logger.warning('Could not write report cache {}: {}'.format(cache_file_path, error))
+
+    @classmethod
+    def delete(cls, report_file_path):
+        unlink_files([cls.get_file_path(report_file_path)])
+
+
+class ReportsIndexEntry:
+    """
+    What the window selection needs to know about a report, without its observations.
+    """
+    FIELDS = ['from_dir', 'first_day_timestamp', 'last_day_timestamp', 'observations_qty', 'mtime_ns', 'size']
+
+    @classmethod
+    def from_report(cls, report, report_stat):
+        return cls(file_path=report.file_path,
+                   from_dir=report.from_dir,
+                   first_day_timestamp=int(report.first_day_timestamp),
+                   last_day_timestamp=int(report.last_day_timestamp),
+                   observations_qty=report.observations_qty,
+                   mtime_ns=report_stat.st_mtime_ns,
+                   size=report_stat.st_size)
+
+    def __init__(self, file_path, from_dir, first_day_timestamp, last_day_timestamp, observations_qty,
+                 mtime_ns, size):
+        self.file_path = file_path
+        self.from_dir = from_dir
+        self.first_day_timestamp = first_day_timestamp
+        self.last_day_timestamp = last_day_timestamp
+        self.observations_qty = observations_qty
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    def get_observations_gap(self):
+        return self.last_day_timestamp - self.first_day_timestamp
+
+    def is_fresh(self, report_stat):
+        return self.mtime_ns == report_stat.st_mtime_ns and self.size == report_stat.st_size
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.__dict__ == other.__dict__
+        return NotImplemented
+
+    def __repr__(self):
+        return '{0!s}({1!r})'.format(self.__class__, self.__dict__)
+
+
+class ReportsIndex:
+    """
+    Per-installation index of the reports, stored beside them. A report is only parsed again when its
+    modification time or size change.
+    """
+    FILE_NAME = '.reports-index'
+
+    @classmethod
+    def load(cls, installation_dir_path):
+        index = cls(installation_dir_path)
+        if exists(index.file_path):
+            try:
+                with open(index.file_path) as index_file:
+                    entries = json.load(index_file)
+                for file_name, entry_fields in entries.items():
+                    index.entries[file_name] = ReportsIndexEntry(file_path=join(installation_dir_path, file_name),
+                                                                 **entry_fields)
+            except (OSError, ValueError, TypeError) as error:
+                logger.warning('Discarding unreadable reports index {}: {}'.format(index.file_path, error))
+                index = cls(installation_dir_path)
+        return index
+
+    def __init__(self, installation_dir_path):
+        self.installation_dir_path = installation_dir_path
+        self.file_path = join(installation_dir_path, self.FILE_NAME)
+        self.entries = {}
+        self.changed = False
+
+    def get_entry(self, report_file_path, load_report=None):
+        """
+        Returns the index entry of a report, loading the report with load_report only when the entry
+        is missing or stale.
+        """
+        report_stat = os.stat(report_file_path)
+        file_name = os.path.basename(report_file_path)
+        entry = self.entries.get(file_name)
+        if entry is None or not entry.is_fresh(report_stat):
+            report = (load_report or Report.load)(report_file_path)
+            entry = ReportsIndexEntry.from_report(report, report_stat)
+            self.entries[file_name] = entry
+            self.changed = True
+        return entry
+
+    def save(self):
+        existing_entries = {file_name: entry for file_name, entry in self.entries.items()
+                            if exists(entry.file_path)}
+        if not self.changed and len(existing_entries) == len(self.entries):
+            return
+        self.entries = existing_entries
+        temporary_file_path = self.file_path + '.tmp'
+        with open(temporary_file_path, 'w') as index_file:
+            json.dump({file_name: entry.to_dict() for file_name, entry in sorted(self.entries.items())}, index_file)
+        os.replace(temporary_file_path, self.file_path)
+        self.changed = False
+
+
+class ProcessableWindow:
+    """
+    Processable reports of a single IP of an installation. Windows of different IPs share no reports,
+    so they can be analyzed in parallel and each one deletes its own reports.
+    """
+    def __init__(self, ip, reports):
+        self.ip = ip
+        self.reports = reports
+
+    def collect_observations(self):
+        return ObservationBatch.merge_sorted_runs([report.observations for report in self.reports])
+
+    def get_unneeded_reports(self):
+        """
+        :return: the reports that won't be part of the next window of the IP, the first half of them
+        """
+        return self.reports[:len(self.reports) // 2]
+
+    def delete_unneeded_reports(self):
+        ReportHandler.delete_reports_files(self.get_unneeded_reports())
+
+    def __repr__(self):
+        return '{0!s}({1!r})'.format(self.__class__, self.__dict__)
+
+
+class JournaledWindow:
+    def __init__(self, window_id, ip, results, reports_files_names, state):
+        self.window_id = window_id
+        self.ip = ip
+        self.results = results
+        self.reports_files_names = reports_files_names
+        self.state = state
+
+    def __repr__(self):
+        return '{0!s}({1!r})'.format(self.__class__, self.__dict__)
+
+
+class ReportsJournal:
+    """
+    Per-installation write-ahead journal of the analyzed windows, stored beside the reports.
+    Each window has three records, written in order: analyzed, with its results and the reports it left
+    unneeded, posted, once its results were handed over, and pruned, once those reports were deleted.
+    Every record is on disk before the next step starts, so a window interrupted by a crash is finished
+    from its last record on the next run, without analyzing it again nor posting its results twice
+    once they were recorded as posted.
+    """
+    FILE_NAME = '.reports-journal'
+    ANALYZED = 'analyzed'
+    POSTED = 'posted'
+    PRUNED = 'pruned'
+
+    @classmethod
+    def load(cls, installation_dir_path):
+        journal = cls(installation_dir_path)
+        if not exists(journal.file_path):
+            return journal
+        with open(journal.file_path) as journal_file:
+            lines = journal_file.read().split('\n')
+        for line in lines:
+            if len(line) == 0:
+                continue
+            try:
+                record = json.loads(line)
+                journal.apply(record)
+            except (ValueError, KeyError, TypeError) as error:
+                # Only the record being written when the process died can be incomplete
+                logger.warning('Ignoring unreadable record of reports journal {}: {}'.format(journal.file_path,
+                                                                                             error))
+        return journal
+
+    def __init__(self, installation_dir_path):
+        self.installation_dir_path = installation_dir_path
+        self.file_path = join(installation_dir_path, self.FILE_NAME)
+        self.windows = {}
+        self.last_window_id = 0
+
+    def apply(self, record):
+        window_id = record['window_id']
+        if record['state'] == self.ANALYZED:
+            self.windows[window_id] = JournaledWindow(window_id, record['ip'], record['results'],
+                                                      record['reports'], self.ANALYZED)
+            self.last_window_id = max(self.last_window_id, window_id)
+        elif record['state'] in (self.POSTED, self.PRUNED):
+            self.windows[window_id].state = record['state']
+        else:
+            raise ValueError('Unknown window state {}'.format(record['state']))
+
+    def append(self, record):
+        encoded_record = (json.dumps(record) + '\n').encode()
+        journal_fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(journal_fd, encoded_record)
+            os.fsync(journal_fd)
+        finally:
+            os.close(journal_fd)
+        self.apply(record)
+
+    def record_analyzed(self, ip, results, reports):
+        """
+        :param reports: the reports to delete once the results are posted
+        :return: the id of the new window
+        """
+        window_id = self.last_window_id + 1
+        self.append({
+            'window_id': window_id,
+            'state': self.ANALYZED,
+            'ip': ip,
+            'results': results,
+            'reports': [basename(report.file_path) for report in reports]
+        })
+        return window_id
+
+    def record_posted(self, window_id):
+        self.append({'window_id': window_id, 'state': self.POSTED})
+
+    def record_pruned(self, window_id):
+        self.append({'window_id': window_id, 'state': self.PRUNED})
+
+    def get_window_reports_files_paths(self, window_id):
+        return [join(self.installation_dir_path, file_name)
+                for file_name in self.windows[window_id].reports_files_names]
+
+    def get_unfinished_windows(self):
+        return [window for _, window in sorted(self.windows.items()) if window.state != self.PRUNED]
+
+    def clean_up(self):
+        """
+        Deletes the journal when every window in it was pruned, so it never grows past the windows of a run.
+        """
+        if len(self.get_unfinished_windows()) == 0:
+            unlink_files([self.file_path])
+            self.windows = {}
+
+
 class NotEnoughObservationsError(Exception):
     pass
 
@@ -328,11 +963,34 @@ class ReportHandler:
     GAP_THRESHOLD = int(datetime.timedelta(minutes=5).total_seconds())
 
     FAILED_RESULTS_DIR_NAME = 'failed-results'
+    PENDING_RESULTS_DIR_NAME = 'pending-results'
     FAILED_REPORT_FILE_NAME_TEMPLATE = 'failed-report-{timestamp}.json'
+    PENDING_RESULT_FILE_NAME_TEMPLATE = 'pending-result-{timestamp}-{ip}.json'
+
+    @classmethod
+    def get_failed_result_timestamp(cls, file_name):
+        prefix, suffix = cls.FAILED_REPORT_FILE_NAME_TEMPLATE.split('{timestamp}')
+        if not file_name.startswith(prefix) or not file_name.endswith(suffix):
+            return None
+        try:
+            # The failed results moved from the pending ones may have a -counter after the timestamp
+            return int(file_name[len(prefix):len(file_name) - len(suffix)].split('-')[0])
+        except ValueError:
+            return None
+
+    @classmethod
+    def get_pending_result_timestamp(cls, file_name):
+        prefix = cls.PENDING_RESULT_FILE_NAME_TEMPLATE.split('{timestamp}')[0]
+        if not file_name.startswith(prefix):
+            return None
+        try:
+            return int(file_name[len(prefix):].split('-')[0])
+        except ValueError:
+            return None
 
     @staticmethod
     def reports_sorting_key(report):
-        return report.observations[0].day_timestamp
+        return report.first_day_timestamp
 
     @staticmethod
     def max_gap_in_reports(reports):
@@ -363,13 +1021,22 @@ class ReportHandler:
 
     @staticmethod
     def delete_reports_files(reports):
-        for report in reports:
-            if exists(report.file_path):
-                unlink(report.file_path)
+        ReportHandler.delete_files([report.file_path for report in reports])
+
+    @staticmethod
+    def delete_files(reports_files_paths):
+        """
+        Deletes the reports files and their caches with a single batch of unlinks.
+        """
+        files_paths = []
+        for report_file_path in reports_files_paths:
+            files_paths.append(report_file_path)
+            files_paths.append(ReportCache.get_file_path(report_file_path))
+        unlink_files(files_paths)
 
     @staticmethod
     def calculate_observations_quantity(reports):
-        return sum([len(report.observations) for report in reports])
+        return sum([report.observations_qty for report in reports])
 
     @classmethod
     def fetch_reports(cls, reports_dir_path, last_first=False):
@@ -390,25 +1057,29 @@ class ReportHandler:
             socket_dir = report.from_dir
             ip = socket_dir.split(':')[0]
             if ip not in data_per_ip:
-                data_per_ip[ip] = set()
-            data_per_ip[ip].update(report.observations)
+                data_per_ip[ip] = list()
+            data_per_ip[ip].append(report.observations)
         for ip, observations in data_per_ip.items():
-            return ip, observations
+            return ip, ObservationBatch.merge_sorted_runs(observations)
 
     def __init__(self, installation_dir_path):
         self.logger = logger.getChild('ReportHandler')
         self.installation_dir_path = installation_dir_path
+        self.reports_index = ReportsIndex.load(installation_dir_path)
         self.failed_results_dir_path = join(self.installation_dir_path, self.FAILED_RESULTS_DIR_NAME)
         if not exists(self.failed_results_dir_path):
             mkdir(self.failed_results_dir_path)
+        self.pending_results_dir_path = join(self.installation_dir_path, self.PENDING_RESULTS_DIR_NAME)
         self.reports_files = list()
         self.processable_reports = list()
+        self.processable_windows = list()
         self.__update_reports_files()
 
     def __update_reports_files(self):
-        self.reports_files = [join(self.installation_dir_path, report_file_name)
-                              for report_file_name in sorted(listdir(self.installation_dir_path))
-                              if report_file_name.endswith('.json')]
+        with metrics.timer('list_reports'):
+            self.reports_files = [join(self.installation_dir_path, report_file_name)
+                                  for report_file_name in sorted(listdir(self.installation_dir_path))
+                                  if report_file_name.endswith('.json')]
 
     def __divide_reports_by_gap_threshold(self, reports):
         gap = self.max_gap_in_reports(reports)
@@ -419,32 +1090,59 @@ class ReportHandler:
             reports_after = list()
         return reports_before, reports_after
 
-    def update_processable_reports(self):
-        self.__update_reports_files()
-        processable_reports = list()
-        while (self.calculate_observations_quantity(processable_reports) < self.MINIMUM_OBSERVATIONS_QTY and
-               len(self.reports_files) > 0):
-            new_report = Report.load(self.reports_files.pop(0))
+    def __get_reports_index_entry(self, report_file_path, loaded_reports):
+        def load_report(file_path):
+            # Reports parsed to index them are kept, in case they end up in the window
+            loaded_reports[file_path] = Report.load(file_path)
+            return loaded_reports[file_path]
+        return self.reports_index.get_entry(report_file_path, load_report)
+
+    def __select_processable_entries(self, entries):
+        """
+        Fills a window with the first entries that add up to the minimum observations quantity, deleting
+        the reports that can't be part of any window.
+
+        :param entries: iterable of index entries, in file order. They are only read as long as they are needed
+        :return: list with the entries of the window, empty if there are not enough observations
+        """
+        entries = iter(entries)
+        processable_entries = list()
+        while self.calculate_observations_quantity(processable_entries) < self.MINIMUM_OBSERVATIONS_QTY:
+            new_entry = next(entries, None)
+            if new_entry is None:
+                break
             # Ensure all processable reports are from the same IP
-            if len(processable_reports) > 0:
-                processable_reports_ip = processable_reports[0].from_dir.split(':')[0]
-                new_report_ip = new_report.from_dir.split(':')[0]
-                if new_report_ip != processable_reports_ip:
-                    self.delete_reports_files(processable_reports)
-                    processable_reports.clear()
-            processable_reports.append(new_report)
-            if self.calculate_observations_quantity(processable_reports) > self.MINIMUM_OBSERVATIONS_QTY:
+            if len(processable_entries) > 0:
+                processable_entries_ip = processable_entries[0].from_dir.split(':')[0]
+                new_entry_ip = new_entry.from_dir.split(':')[0]
+                if new_entry_ip != processable_entries_ip:
+                    self.delete_reports_files(processable_entries)
+                    processable_entries.clear()
+            processable_entries.append(new_entry)
+            if self.calculate_observations_quantity(processable_entries) > self.MINIMUM_OBSERVATIONS_QTY:
                 # Ensure that the reports have no irrecoverable gaps
-                reports_before_gap, reports_after_gap = self.__divide_reports_by_gap_threshold(processable_reports)
-                if self.calculate_observations_quantity(reports_before_gap) < self.MINIMUM_OBSERVATIONS_QTY:
-                    self.delete_reports_files(reports_before_gap)
-                    processable_reports = reports_after_gap
+                entries_before_gap, entries_after_gap = self.__divide_reports_by_gap_threshold(processable_entries)
+                if self.calculate_observations_quantity(entries_before_gap) < self.MINIMUM_OBSERVATIONS_QTY:
+                    self.delete_reports_files(entries_before_gap)
+                    processable_entries = entries_after_gap
                 else:
-                    processable_reports = reports_before_gap
-        if self.calculate_observations_quantity(processable_reports) < self.MINIMUM_OBSERVATIONS_QTY:
-            self.processable_reports = list()
-        else:
-            self.processable_reports = processable_reports
+                    processable_entries = entries_before_gap
+        if self.calculate_observations_quantity(processable_entries) < self.MINIMUM_OBSERVATIONS_QTY:
+            return list()
+        return processable_entries
+
+    def __load_entries_reports(self, entries, loaded_reports):
+        return [loaded_reports.get(entry.file_path) or Report.load(entry.file_path) for entry in entries]
+
+    def update_processable_reports(self):
+        # The window is chosen from the reports index, only the reports in it are loaded
+        self.__update_reports_files()
+        loaded_reports = dict()
+        entries = (self.__get_reports_index_entry(report_file_path, loaded_reports)
+                   for report_file_path in self.reports_files)
+        processable_entries = self.__select_processable_entries(entries)
+        self.processable_reports = self.__load_entries_reports(processable_entries, loaded_reports)
+        self.reports_index.save()
 
     def get_ip_and_processable_observations(self):
         self.update_processable_reports()
@@ -454,10 +1152,43 @@ class ReportHandler:
             ip, observations = self.collect_observations(self.processable_reports)
         return ip, observations
 
+    def get_unneeded_reports(self):
+        """
+        :return: the reports that won't be part of the next window, the first half of the processable ones
+        """
+        return self.processable_reports[:len(self.processable_reports) // 2]
+
     def delete_unneeded_reports(self):
-        reports_to_delete_qty = len(self.processable_reports) // 2
-        reports_to_delete = self.processable_reports[:reports_to_delete_qty]
-        self.delete_reports_files(reports_to_delete)
+        self.delete_reports_files(self.get_unneeded_reports())
+
+    def update_processable_windows(self):
+        """
+        Partitions the reports of the installation by IP in a single pass over the index, and selects a
+        processable window for each IP, so reports from the other IPs are kept instead of deleted.
+        The reports of an IP that can't fill a window and are followed by a gap over GAP_THRESHOLD in the
+        installation can't be part of any window anymore, so they are deleted.
+        """
+        self.__update_reports_files()
+        loaded_reports = dict()
+        entries_per_ip = dict()
+        for report_file_path in self.reports_files:
+            entry = self.__get_reports_index_entry(report_file_path, loaded_reports)
+            entries_per_ip.setdefault(entry.from_dir.split(':')[0], list()).append(entry)
+        last_day_timestamp = max([entries[-1].first_day_timestamp for entries in entries_per_ip.values()],
+                                 default=None)
+        self.processable_windows = list()
+        for ip, entries in entries_per_ip.items():
+            processable_entries = self.__select_processable_entries(entries)
+            if len(processable_entries) > 0:
+                self.processable_windows.append(ProcessableWindow(ip, self.__load_entries_reports(processable_entries,
+                                                                                                  loaded_reports)))
+            elif last_day_timestamp - entries[-1].first_day_timestamp > self.GAP_THRESHOLD:
+                self.delete_reports_files(entries)
+        self.reports_index.save()
+
+    def get_processable_windows(self):
+        self.update_processable_windows()
+        return self.processable_windows
 
     def failed_results_dir_is_empty(self):
         return not exists(self.failed_results_dir_path) or len(listdir(self.failed_results_dir_path)) == 0
@@ -471,3 +1202,80 @@ class ReportHandler:
         failed_result_file_path = join(self.failed_results_dir_path, failed_result_file_name)
         with open(failed_result_file_path, 'w') as failed_result_file:
             json.dump(json_failed_results, failed_result_file)
+
+    def back_up_pending_results(self, results, ip):
+        """
+        Writes the results to the pending results directory, where they wait to be posted by another process.
+        The file is on disk when this returns, so the reports of the window can be deleted.
+
+        :return: the path of the pending results file
+        """
+        if not exists(self.pending_results_dir_path):
+            mkdir(self.pending_results_dir_path)
+        # Keyed by IP too, so the windows of different IPs ending at the same timestamp don't overwrite each other
+        pending_result_file_name = self.PENDING_RESULT_FILE_NAME_TEMPLATE.format(timestamp=results['timestamp'], ip=ip)
+        pending_result_file_path = join(self.pending_results_dir_path, pending_result_file_name)
+        temporary_file_path = pending_result_file_path + '.tmp'
+        with open(temporary_file_path, 'w') as pending_result_file:
+            json.dump({'results': results, 'ip': ip}, pending_result_file)
+            pending_result_file.flush()
+            os.fsync(pending_result_file.fileno())
+        os.replace(temporary_file_path, pending_result_file_path)
+        return pending_result_file_path
+
+    def load_pending_results(self):
+        """
+        :return: list of (pending_result_file_path, ip, results) tuples, oldest first
+        """
+        pending_results = []
+        if not exists(self.pending_results_dir_path):
+            return pending_results
+        for file_name in sorted(listdir(self.pending_results_dir_path),
+                                key=lambda file_name: self.get_pending_result_timestamp(file_name) or 0):
+            if not file_name.endswith('.json'):
+                continue
+            pending_result_file_path = join(self.pending_results_dir_path, file_name)
+            try:
+                with open(pending_result_file_path) as pending_result_file:
+                    pending_result = json.load(pending_result_file)
+                pending_results.append((pending_result_file_path, pending_result['ip'], pending_result['results']))
+            except (OSError, ValueError, KeyError) as error:
+                self.logger.error('Could not read pending result {}: {}'.format(pending_result_file_path, error))
+        return pending_results
+
+    def fail_pending_results(self, pending_result_file_path):
+        """
+        Moves the pending results to the failed results directory, so they are replayed later. A failed result
+        with the same timestamp is never overwritten, a -counter is added to the timestamp instead.
+
+        :return: the path of the failed results file
+        """
+        timestamp = self.get_pending_result_timestamp(basename(pending_result_file_path))
+        counter = 0
+        while True:
+            failed_result_file_name = self.FAILED_REPORT_FILE_NAME_TEMPLATE.format(
+                timestamp=timestamp if counter == 0 else '{}-{}'.format(timestamp, counter))
+            failed_result_file_path = join(self.failed_results_dir_path, failed_result_file_name)
+            try:
+                # Unlike a rename, a link fails if the failed result already exists
+                os.link(pending_result_file_path, failed_result_file_path)
+                break
+            except FileExistsError:
+                counter += 1
+        unlink(pending_result_file_path)
+        return failed_result_file_path
+
+    def fail_all_pending_results(self):
+        """
+        Moves every pending result to the failed results directory, for the pending results left behind when
+        the processing mode is switched away from local-batch, since nothing else posts them.
+
+        :return: the amount of pending results moved
+        """
+        if not exists(self.pending_results_dir_path):
+            return 0
+        pending_results_files_names = [file_name for file_name in listdir(self.pending_results_dir_path)
+                                       if file_name.endswith('.json')]
+        for file_name in pending_results_files_names:
+            self.fail_pending_results(join(self.pending_results_dir_path, file_name))
+        return len(pending_results_files_names)
@@ -0,0 +1,121 @@
+import logging
+import time
+import traceback
+from os import listdir
+from os.path import join
+
+from processor import REPORTS_BASE_PATH, STREAMING_STRIDE, WATCHER_POLL_INTERVAL
+from processor import metrics
+from processor.analysis import StreamingAnalyzer
+from processor.reports import Report, ReportHandler
+from processor.tasks import find_installations, post_or_back_up_results
+
+logger = logging.getLogger(__name__)
+
+
+class InstallationStream:
+    """
+    Feeds the reports of an installation to a StreamingAnalyzer as they are written, and deletes the
+    reports whose observations are older than the window being analyzed.
+    As in the batch processing, the analysis starts over whenever the IP of the installation changes.
+    A report that can't be read is retried on the next updates, since it may still be being written, and
+    deleted after MAXIMUM_REPORT_LOAD_ATTEMPTS so it doesn't hold back the following ones forever.
+    """
+    MAXIMUM_REPORT_LOAD_ATTEMPTS = 5
+
+    def __init__(self, installation_dir_path, results_callback, stride=STREAMING_STRIDE):
+        self.installation_dir_path = installation_dir_path
+        self.results_callback = results_callback
+        self.stride = stride
+        self.ip = None
+        self.analyzer = None
+        self.reports = {}
+        self.report_load_attempts = {}
+
+    def read_new_reports(self):
+        log = logger.getChild('InstallationStream.read_new_reports')
+        reports_file_names = sorted(file_name for file_name in listdir(self.installation_dir_path)
+                                    if file_name.endswith('.json'))
+        for report_file_name in reports_file_names:
+            if report_file_name in self.reports:
+                continue
+            report_file_path = join(self.installation_dir_path, report_file_name)
+            try:
+                report = Report.load(report_file_path)
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                load_attempts = self.report_load_attempts.get(report_file_name, 0) + 1
+                if load_attempts < self.MAXIMUM_REPORT_LOAD_ATTEMPTS:
+                    # Most likely it is still being written, it is read again on the next update
+                    log.debug('Could not read report {}: {}'.format(report_file_name, error))
+                    self.report_load_attempts[report_file_name] = load_attempts
+                    break
+                log.warning('Deleting report {}, could not read it after {} attempts: {}'.format(
+                    report_file_path, load_attempts, error))
+                self.report_load_attempts.pop(report_file_name, None)
+                ReportHandler.delete_files([report_file_path])
+                continue
+            self.report_load_attempts.pop(report_file_name, None)
+            ip = report.from_dir.split(':')[0]
+            if ip != self.ip:
+                log.info('Starting the analysis of IP {} in {}'.format(ip, self.installation_dir_path))
+                ReportHandler.delete_reports_files(self.reports.values())
+                self.reports = {}
+                self.ip = ip
+                self.analyzer = StreamingAnalyzer(stride=self.stride)
+            self.reports[report_file_name] = report
+            for results in self.analyzer.add_observations(report.observations):
+                self.results_callback(self.ip, results)
+
+    def delete_analyzed_reports(self):
+        if self.analyzer is None or self.analyzer.window_end is None:
+            return
+        next_window_start = self.analyzer.window_end - self.analyzer.window
+        analyzed_reports_file_names = [report_file_name
+                                       for report_file_name, report in sorted(self.reports.items())
+                                       if report.last_day_timestamp < next_window_start]
+        ReportHandler.delete_reports_files([self.reports.pop(report_file_name)
+                                            for report_file_name in analyzed_reports_file_names])
+
+    def update(self):
+        self.read_new_reports()
+        self.delete_analyzed_reports()
+
+
+def stream_reports(reports_base_path, results_callback=post_or_back_up_results, stride=STREAMING_STRIDE,
+                   poll_interval=WATCHER_POLL_INTERVAL, should_stop=lambda: False):
+    """
+    Analyzes the reports of every installation as they are written, posting the results of each
+    installation every stride seconds of observations. The reports are polled every poll_interval seconds.
+
+    :param results_callback: called as results_callback(installation_dir_path, ip, results, user_id,
+    installation_id) with the results of each window
+    """
+    streams = {}
+    while True:
+        installations_dir_paths = set()
+        for installation_dir_path, user_id, installation_id in find_installations(reports_base_path):
+            installations_dir_paths.add(installation_dir_path)
+            stream = streams.get(installation_dir_path)
+            if stream is None:
+                stream = InstallationStream(
+                    installation_dir_path,
+                    lambda ip, results, installation_dir_path=installation_dir_path, user_id=user_id,
+                    installation_id=installation_id: results_callback(installation_dir_path, ip, results,
+                                                                      user_id, installation_id),
+                    stride=stride)
+                streams[installation_dir_path] = stream
+            try:
+                with metrics.collect('stream_installation', {'user_id': user_id, 'installation_id': installation_id}):
+                    stream.update()
+            except Exception:
+                logger.error('Error while trying to stream installation {}'.format(installation_dir_path))
+                logger.error('Exception caught {}'.format(traceback.format_exc()))
+        for installation_dir_path in set(streams.keys()) - installations_dir_paths:
+            del streams[installation_dir_path]
+        if should_stop():
+            return streams
+        time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    stream_reports(REPORTS_BASE_PATH)
@@ -1,4 +1,5 @@
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from os import listdir, unlink
 
 import logging
@@ -7,48 +8,139 @@ import filelock
 from celery.schedules import crontab
 from os.path import join, isdir, exists
 
-from processor import app, REPORTS_BASE_PATH, PROCESSING_PERIOD
+from processor import app, REPORTS_BASE_PATH, PROCESSING_PERIOD, PROCESSING_MODE, LOCAL_BATCH_PROCESSING_MODE, \
+    WATCHER_PROCESSING_MODE, STREAMING_PROCESSING_MODE, PER_IP_WINDOWS, LOCAL_BATCH_WORKERS, \
+    LOCAL_BATCH_POST_THREADS, REPLAY_CONCURRENCY, REPLAY_RATE
 from processor import reports
 from processor import api_communication
 from processor import analysis
+from processor import metrics
+from processor import replay
 
 tasks_logger = logging.getLogger(__name__)
 
 
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
+    # In watcher mode the installations are dispatched by the reports watcher as their reports arrive,
+    # and in streaming mode they are analyzed by the streaming process
+    if PROCESSING_MODE not in (WATCHER_PROCESSING_MODE, STREAMING_PROCESSING_MODE):
+        sender.add_periodic_task(
+            crontab(minute='*/{}'.format(PROCESSING_PERIOD)),
+            process_users_data.s(REPORTS_BASE_PATH),
+            name='process_users_data')
     sender.add_periodic_task(
         crontab(minute='*/{}'.format(PROCESSING_PERIOD)),
-        process_users_data.s(REPORTS_BASE_PATH),
-        name='process_users_data')
+        replay_failed_results.s(REPORTS_BASE_PATH),
+        name='replay_failed_results')
 
 
-@app.task
-def process_installation(installation_dir_path, user_id, installation_id):
-    logger = tasks_logger.getChild('process_installation')
-    logger.info('installation_dir_path: {installation_dir_path}'.format(installation_dir_path=installation_dir_path))
+def installation_lock(user_id, installation_id):
     lock = filelock.FileLock('.lock-{user_id}-{installation_id}'.format(user_id=user_id,
                                                                         installation_id=installation_id))
     lock.timeout = PROCESSING_PERIOD * 60
+    return lock
+
+
+def analyze_observations(ip, observations, user_id, installation_id):
+    logger = tasks_logger.getChild('analyze_observations')
+    logger.info('Analyzing {} observation for IP {} to user {} in installation {}'.format(len(observations),
+                                                                                          ip,
+                                                                                          user_id,
+                                                                                          installation_id))
+    metrics.increment('windows_analyzed')
+    metrics.increment('observations_analyzed', len(observations))
+    with metrics.timer('analysis'):
+        analyzer = analysis.Analyzer(observations)
+        return analyzer.get_results()
+
+
+def finish_window(reports_journal, window_id, results_callback):
+    """
+    Hands the results of a journaled window to results_callback and deletes the reports it left unneeded,
+    recording each step in the journal. The steps already recorded are skipped, so it also finishes the
+    windows interrupted by a crash.
+
+    The window is recorded as posted, and its reports deleted, as soon as results_callback returns, so it
+    must only return once the results are posted or durably backed up. If the process dies before the
+    record, results_callback is called again with the same results when the window is resumed.
+    """
+    logger = tasks_logger.getChild('finish_window')
+    window = reports_journal.windows[window_id]
+    if window.state == reports.ReportsJournal.ANALYZED:
+        results_callback(window.ip, window.results)
+        reports_journal.record_posted(window_id)
+    if window.state == reports.ReportsJournal.POSTED:
+        logger.info('Cleaning up IP {}'.format(window.ip))
+        with metrics.timer('delete_reports'):
+            reports.ReportHandler.delete_files(reports_journal.get_window_reports_files_paths(window_id))
+        reports_journal.record_pruned(window_id)
+
+
+def analyze_window(reports_journal, ip, observations, unneeded_reports, user_id, installation_id, results_callback):
+    results = analyze_observations(ip, observations, user_id, installation_id)
+    with metrics.timer('journal'):
+        window_id = reports_journal.record_analyzed(ip, results, unneeded_reports)
+    finish_window(reports_journal, window_id, results_callback)
+
+
+def analyze_installation(installation_dir_path, user_id, installation_id, results_callback):
+    """
+    Analyzes every processable window of the installation while holding its lock.
+    results_callback(ip, results) is called with the results of each window before its reports are cleaned up.
+    The windows left unfinished by a previous run are finished first, from the results in the reports journal.
+    With PER_IP_WINDOWS, the reports of each IP are windowed on their own instead of being discarded when
+    the IP changes.
+    """
+    logger = tasks_logger.getChild('analyze_installation')
+    lock = installation_lock(user_id, installation_id)
+    with metrics.timer('wait_lock'):
+        lock.acquire()
     try:
-        with lock:
-            reports_handler = reports.ReportHandler(installation_dir_path)
+        with metrics.timer('journal'):
+            reports_journal = reports.ReportsJournal.load(installation_dir_path)
+        for window in reports_journal.get_unfinished_windows():
+            logger.info('Resuming window {} of IP {} from the reports journal'.format(window.window_id, window.ip))
+            metrics.increment('windows_resumed')
+            finish_window(reports_journal, window.window_id, results_callback)
+        reports_handler = reports.ReportHandler(installation_dir_path)
+        if PER_IP_WINDOWS:
+            windows = reports_handler.get_processable_windows()
+            while len(windows) > 0:
+                for window in windows:
+                    analyze_window(reports_journal, window.ip, window.collect_observations(),
+                                   window.get_unneeded_reports(), user_id, installation_id, results_callback)
+                windows = reports_handler.get_processable_windows()
+        else:
             ip, observations = reports_handler.get_ip_and_processable_observations()
             while ip is not None and observations is not None:
-                logger.info('Analyzing {} observation for IP {} to user {} in installation {}'.format(len(observations),
-                                                                                                      ip,
-                                                                                                      user_id,
-                                                                                                      installation_id))
-                analyzer = analysis.Analyzer(observations)
-                results = analyzer.get_results()
-                if not api_communication.post_results(ip, results, user_id, installation_id):
-                    logger.warn('Could not post results to API. Backing up file for later.')
-                    reports_handler.back_up_failed_results(results, ip)
-                logger.info('Cleaning up')
-                reports_handler.delete_unneeded_reports()
+                analyze_window(reports_journal, ip, observations, reports_handler.get_unneeded_reports(),
+                               user_id, installation_id, results_callback)
                 ip, observations = reports_handler.get_ip_and_processable_observations()
-        if exists(lock.lock_file):
-            unlink(lock.lock_file)
+        with metrics.timer('journal'):
+            reports_journal.clean_up()
+    finally:
+        lock.release()
+    if exists(lock.lock_file):
+        unlink(lock.lock_file)
+
+
+def post_or_back_up_results(installation_dir_path, ip, results, user_id, installation_id):
+    logger = tasks_logger.getChild('post_or_back_up_results')
+    if not api_communication.post_results(ip, results, user_id, installation_id):
+        logger.warn('Could not post results to API. Backing up file for later.')
+        reports.ReportHandler(installation_dir_path).back_up_failed_results(results, ip)
+
+
+@app.task
+def process_installation(installation_dir_path, user_id, installation_id):
+    logger = tasks_logger.getChild('process_installation')
+    logger.info('installation_dir_path: {installation_dir_path}'.format(installation_dir_path=installation_dir_path))
+    try:
+        with metrics.collect('process_installation', {'user_id': user_id, 'installation_id': installation_id}):
+            analyze_installation(installation_dir_path, user_id, installation_id,
+                                 lambda ip, results: post_or_back_up_results(installation_dir_path, ip, results,
+                                                                             user_id, installation_id))
     except filelock.Timeout:
         logger.error('Timeout while processing. The process took too long.')
     except:
@@ -57,11 +149,97 @@ def process_installation(installation_dir_path, user_id, installation_id):
         raise
 
 
-@app.task
-def process_users_data(reports_base_path):
-    logger = tasks_logger.getChild('process_users_data')
-    logger.info('Processing users data')
-    logger.debug('reports_base_path: {reports_base_path}'.format(reports_base_path=reports_base_path))
+def post_pending_results(installation_dir_path, pending_result_file_path, ip, results, user_id, installation_id):
+    """
+    Posts results backed up by analyze_installation_locally. The file is deleted once they are posted, or
+    moved to the failed results to be replayed later.
+    """
+    logger = tasks_logger.getChild('post_pending_results')
+    if api_communication.post_results(ip, results, user_id, installation_id):
+        unlink(pending_result_file_path)
+    else:
+        logger.warn('Could not post results to API. Backing up file for later.')
+        reports.ReportHandler(installation_dir_path).fail_pending_results(pending_result_file_path)
+
+
+def post_or_back_up_user_results(user_id, user_results):
+    """
+    Posts all the pending results of a user to the bulk endpoint, moving them to the failed results if the
+    post fails.
+
+    :param user_id:
+    :param user_results: list of (installation_dir_path, installation_id, pending_result_file_path, ip, results)
+    tuples
+    """
+    logger = tasks_logger.getChild('post_or_back_up_user_results')
+    installations_results = [(installation_id, ip, results)
+                             for installation_dir_path, installation_id, _, ip, results in user_results]
+    if api_communication.post_results_bulk(user_id, installations_results):
+        reports.unlink_files([pending_result_file_path for _, _, pending_result_file_path, _, _ in user_results])
+    else:
+        logger.warn('Could not post results to API. Backing up files for later.')
+        for installation_dir_path, _, pending_result_file_path, _, _ in user_results:
+            reports.ReportHandler(installation_dir_path).fail_pending_results(pending_result_file_path)
+
+
+def analyze_installation_locally(installation_dir_path, user_id, installation_id):
+    """
+    Entry point of the local batch process pool. The results of each window are written to the pending
+    results of the installation before its reports are deleted, while holding its lock, so they are never
+    lost if this or the parent process die. The parent process posts them.
+
+    :return: list of (pending_result_file_path, ip, results) tuples with every pending result of the
+    installation, including the ones left by a previous run
+    """
+    logger = tasks_logger.getChild('analyze_installation_locally')
+    reports_handler = reports.ReportHandler(installation_dir_path)
+    try:
+        with metrics.collect('analyze_installation_locally',
+                             {'user_id': user_id, 'installation_id': installation_id}):
+            analyze_installation(installation_dir_path, user_id, installation_id,
+                                 lambda ip, results: reports_handler.back_up_pending_results(results, ip))
+    except filelock.Timeout:
+        logger.error('Timeout while processing. The process took too long.')
+    except Exception:
+        # The results of the windows analyzed before the error are pending, so they are posted anyway
+        logger.error('Error while trying to process installation {}'.format(installation_dir_path))
+        logger.error('Exception caught {}'.format(traceback.format_exc()))
+    return reports_handler.load_pending_results()
+
+
+def process_installations_locally(installations, max_workers=LOCAL_BATCH_WORKERS):
+    logger = tasks_logger.getChild('process_installations_locally')
+    with ProcessPoolExecutor(max_workers=max_workers) as analysis_pool, \
+            ThreadPoolExecutor(max_workers=LOCAL_BATCH_POST_THREADS) as post_pool:
+        analysis_futures = {analysis_pool.submit(analyze_installation_locally, *installation): installation
+                            for installation in installations}
+        post_futures = []
+        users_results = {}
+        for analysis_future in as_completed(analysis_futures):
+            installation_dir_path, user_id, installation_id = analysis_futures[analysis_future]
+            try:
+                pending_results = analysis_future.result()
+            except Exception:
+                logger.error('Error while trying to process installation {}'.format(installation_dir_path))
+                logger.error('Exception caught {}'.format(traceback.format_exc()))
+                continue
+            for pending_result_file_path, ip, results in pending_results:
+                if api_communication.TIX_API_BULK:
+                    users_results.setdefault(user_id, []).append((installation_dir_path, installation_id,
+                                                                  pending_result_file_path, ip, results))
+                else:
+                    post_futures.append(post_pool.submit(post_pending_results, installation_dir_path,
+                                                         pending_result_file_path, ip, results, user_id,
+                                                         installation_id))
+        for user_id, user_results in users_results.items():
+            post_futures.append(post_pool.submit(post_or_back_up_user_results, user_id, user_results))
+        for post_future in as_completed(post_futures):
+            if post_future.exception() is not None:
+                logger.error('Error while trying to post results: {}'.format(post_future.exception()))
+
+
+def find_installations(reports_base_path):
+    logger = tasks_logger.getChild('find_installations')
     for first_file in listdir(reports_base_path):
         first_file_path = join(reports_base_path, first_file)
         if isdir(first_file_path):
@@ -75,4 +253,47 @@ def process_users_data(reports_base_path):
                     installation_dir_path = second_file_path
                     logger.debug('installation_dir_path: {installation_dir_path}'
                                  .format(installation_dir_path=installation_dir_path))
-                    process_installation.delay(installation_dir_path, user_dir_name, installation_dir_name)
+                    yield installation_dir_path, user_dir_name, installation_dir_name
+
+
+@app.task
+def process_users_data(reports_base_path):
+    logger = tasks_logger.getChild('process_users_data')
+    logger.info('Processing users data')
+    logger.debug('reports_base_path: {reports_base_path}'.format(reports_base_path=reports_base_path))
+    installations = find_installations(reports_base_path)
+    if PROCESSING_MODE == LOCAL_BATCH_PROCESSING_MODE:
+        process_installations_locally(installations)
+    else:
+        for installation_dir_path, user_dir_name, installation_dir_name in installations:
+            process_installation.delay(installation_dir_path, user_dir_name, installation_dir_name)
+
+
+def fail_pending_results(reports_base_path):
+    """
+    Moves the pending results left by the local-batch mode to the failed results, so they are replayed
+    once the processing mode is switched away from it.
+    """
+    logger = tasks_logger.getChild('fail_pending_results')
+    for installation_dir_path, _, _ in find_installations(reports_base_path):
+        if exists(join(installation_dir_path, reports.ReportHandler.PENDING_RESULTS_DIR_NAME)):
+            pending_results_qty = reports.ReportHandler(installation_dir_path).fail_all_pending_results()
+            logger.info('Moved {} pending results of {} to the failed results'.format(pending_results_qty,
+                                                                                      installation_dir_path))
+
+
+@app.task
+def replay_failed_results(reports_base_path):
+    logger = tasks_logger.getChild('replay_failed_results')
+    lock = filelock.FileLock('.lock-replay-failed-results')
+    try:
+        # Only one replay at a time. Results backed up in the meantime are replayed by the next run
+        with lock.acquire(timeout=0):
+            if PROCESSING_MODE != LOCAL_BATCH_PROCESSING_MODE:
+                fail_pending_results(reports_base_path)
+            progress = replay.replay_failed_results(find_installations(reports_base_path),
+                                                    max_workers=REPLAY_CONCURRENCY,
+                                                    rate=REPLAY_RATE)
+            logger.info('Failed results replay finished: {}'.format(progress))
+    except filelock.Timeout:
+        logger.info('Failed results replay already running')
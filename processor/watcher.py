@@ -0,0 +1,316 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import time
+from os import listdir
+from os.path import join, isdir, basename, dirname, relpath
+
+from processor import REPORTS_BASE_PATH, PROCESSING_PERIOD, WATCHER_POLL_INTERVAL
+from processor.reports import ReportHandler, message_observations_qty
+from processor.tasks import find_installations, process_installation
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+BASE_DEPTH = 0
+USER_DEPTH = 1
+INSTALLATION_DEPTH = 2
+
+
+def is_report_file_name(file_name):
+    return file_name.endswith('.json')
+
+
+def count_report_observations(report_file_path):
+    """
+    Counts the observations of a report from the length of its base64 message, without decoding it.
+    """
+    with open(report_file_path) as report_file:
+        return message_observations_qty(json.load(report_file)['message'])
+
+
+class Inotify:
+    """
+    Minimal inotify binding over the libc functions. Only available on Linux.
+    """
+    EVENT_HEADER = struct.Struct('iIII')
+    READ_SIZE = 64 * 1024
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        try:
+            self._inotify_init1 = libc.inotify_init1
+            self._inotify_add_watch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError('inotify is not available')
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        watch_descriptor = self._inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if watch_descriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return watch_descriptor
+
+    def read_events(self, timeout):
+        """
+        Waits up to timeout seconds for events.
+
+        :return: list of (watch_descriptor, mask, name) tuples
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, self.READ_SIZE)
+        events = []
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, name_size = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_size].rstrip(b'\0'))
+            offset += name_size
+            events.append((watch_descriptor, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify():
+    try:
+        return Inotify()
+    except OSError as error:
+        logger.info('inotify not available, falling back to polling: {}'.format(error))
+        return None
+
+
+class InstallationReports:
+    def __init__(self, installation_dir_path, user_id, installation_id):
+        self.installation_dir_path = installation_dir_path
+        self.user_id = user_id
+        self.installation_id = installation_id
+        self.reports = {}
+        self.dispatched_reports = set()
+        self.dispatch_time = None
+
+    @property
+    def observations_qty(self):
+        return sum(self.reports.values())
+
+    def is_in_flight(self, now, dispatch_timeout):
+        """
+        An installation is in flight from its dispatch until one of the reports it had is deleted,
+        which means the task processed it, or until the dispatch times out.
+        """
+        return self.dispatch_time is not None and now - self.dispatch_time < dispatch_timeout
+
+
+class ReportsWatcher:
+    """
+    Keeps the observations quantity of the reports of every installation, updated from the written
+    and deleted report files, and dispatches the installations that reach the minimum observations quantity.
+    """
+    def __init__(self, reports_base_path, dispatch,
+                 minimum_observations_qty=ReportHandler.MINIMUM_OBSERVATIONS_QTY,
+                 dispatch_timeout=PROCESSING_PERIOD * 60,
+                 clock=time.monotonic):
+        self.reports_base_path = reports_base_path
+        self.dispatch = dispatch
+        self.minimum_observations_qty = minimum_observations_qty
+        self.dispatch_timeout = dispatch_timeout
+        self.clock = clock
+        self.installations = {}
+        self.dirty_installations = set()
+
+    def get_installation(self, installation_dir_path):
+        installation = self.installations.get(installation_dir_path)
+        if installation is None:
+            user_id, installation_id = relpath(installation_dir_path, self.reports_base_path).split(os.sep)
+            installation = InstallationReports(installation_dir_path, user_id, installation_id)
+            self.installations[installation_dir_path] = installation
+        return installation
+
+    def remove_installation(self, installation_dir_path):
+        self.installations.pop(installation_dir_path, None)
+        self.dirty_installations.discard(installation_dir_path)
+
+    def report_written(self, report_file_path):
+        installation = self.get_installation(dirname(report_file_path))
+        try:
+            observations_qty = count_report_observations(report_file_path)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            # Most likely it is still being written, it is counted again when it is complete
+            logger.debug('Could not count observations of {}: {}'.format(report_file_path, error))
+            return
+        installation.reports[basename(report_file_path)] = observations_qty
+        self.dirty_installations.add(installation.installation_dir_path)
+
+    def report_deleted(self, report_file_path):
+        installation = self.installations.get(dirname(report_file_path))
+        if installation is None:
+            return
+        report_file_name = basename(report_file_path)
+        installation.reports.pop(report_file_name, None)
+        if report_file_name in installation.dispatched_reports:
+            installation.dispatched_reports = set()
+            installation.dispatch_time = None
+        self.dirty_installations.add(installation.installation_dir_path)
+
+    def scan_installation(self, installation_dir_path):
+        installation = self.get_installation(installation_dir_path)
+        try:
+            report_file_names = set(file_name for file_name in listdir(installation_dir_path)
+                                    if is_report_file_name(file_name))
+        except FileNotFoundError:
+            self.remove_installation(installation_dir_path)
+            return
+        known_report_file_names = set(installation.reports.keys())
+        for report_file_name in sorted(report_file_names - known_report_file_names):
+            self.report_written(join(installation_dir_path, report_file_name))
+        for report_file_name in known_report_file_names - report_file_names:
+            self.report_deleted(join(installation_dir_path, report_file_name))
+
+    def scan(self):
+        """
+        Updates every installation from its directory listing. Only reports not seen before are read.
+        """
+        installations_dir_paths = set()
+        for installation_dir_path, _, _ in find_installations(self.reports_base_path):
+            installations_dir_paths.add(installation_dir_path)
+            self.scan_installation(installation_dir_path)
+        for installation_dir_path in set(self.installations.keys()) - installations_dir_paths:
+            self.remove_installation(installation_dir_path)
+
+    def dispatch_ready_installations(self):
+        log = logger.getChild('dispatch_ready_installations')
+        now = self.clock()
+        dispatched = []
+        for installation_dir_path in sorted(self.dirty_installations):
+            installation = self.installations[installation_dir_path]
+            if installation.observations_qty < self.minimum_observations_qty:
+                self.dirty_installations.discard(installation_dir_path)
+                continue
+            if installation.is_in_flight(now, self.dispatch_timeout):
+                continue
+            log.info('Dispatching installation {} with {} observations'.format(installation_dir_path,
+                                                                               installation.observations_qty))
+            self.dispatch(installation.installation_dir_path, installation.user_id, installation.installation_id)
+            # It stays dirty, so it is dispatched again if the task times out without deleting any report
+            installation.dispatched_reports = set(installation.reports.keys())
+            installation.dispatch_time = now
+            dispatched.append(installation_dir_path)
+        return dispatched
+
+
+class InotifyReportsSource:
+    """
+    Feeds a ReportsWatcher from inotify events. The base directory, the users directories and the
+    installations directories are watched, and new directories are watched as they are created.
+    """
+    def __init__(self, watcher, inotify):
+        self.watcher = watcher
+        self.inotify = inotify
+        self.watches = {}
+
+    def watch(self, path, depth):
+        try:
+            watch_descriptor = self.inotify.add_watch(path)
+        except OSError as error:
+            logger.warning('Could not watch {}: {}'.format(path, error))
+            return
+        self.watches[watch_descriptor] = (path, depth)
+        if depth == INSTALLATION_DEPTH:
+            # Reports written before the watch was added are only found by listing the directory
+            self.watcher.scan_installation(path)
+            return
+        for file_name in listdir(path):
+            file_path = join(path, file_name)
+            if isdir(file_path):
+                self.watch(file_path, depth + 1)
+
+    def start(self):
+        self.watch(self.watcher.reports_base_path, BASE_DEPTH)
+
+    def handle_event(self, watch_descriptor, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            logger.warning('inotify queue overflowed, scanning all the installations')
+            self.start()
+            return
+        if watch_descriptor not in self.watches:
+            return
+        path, depth = self.watches[watch_descriptor]
+        if mask & IN_IGNORED:
+            del self.watches[watch_descriptor]
+            if depth == INSTALLATION_DEPTH:
+                self.watcher.remove_installation(path)
+            return
+        file_path = join(path, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and depth < INSTALLATION_DEPTH:
+                self.watch(file_path, depth + 1)
+        elif depth == INSTALLATION_DEPTH and is_report_file_name(name):
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.watcher.report_written(file_path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.watcher.report_deleted(file_path)
+
+    def process_events(self, timeout):
+        for watch_descriptor, mask, name in self.inotify.read_events(timeout):
+            self.handle_event(watch_descriptor, mask, name)
+
+
+def watch_reports(reports_base_path, dispatch, poll_interval=WATCHER_POLL_INTERVAL, use_inotify=True,
+                  should_stop=lambda: False):
+    """
+    Watches the reports written by the condenser and dispatches each installation as soon as it has
+    enough observations to be processed. Uses inotify when available and polls every poll_interval
+    seconds otherwise.
+    """
+    watcher = ReportsWatcher(reports_base_path, dispatch)
+    inotify = open_inotify() if use_inotify else None
+    try:
+        if inotify is not None:
+            logger.info('Watching {} with inotify'.format(reports_base_path))
+            inotify_source = InotifyReportsSource(watcher, inotify)
+            inotify_source.start()
+        else:
+            logger.info('Polling {} every {} seconds'.format(reports_base_path, poll_interval))
+            watcher.scan()
+        watcher.dispatch_ready_installations()
+        while not should_stop():
+            if inotify is not None:
+                inotify_source.process_events(poll_interval)
+            else:
+                time.sleep(poll_interval)
+                watcher.scan()
+            watcher.dispatch_ready_installations()
+    finally:
+        if inotify is not None:
+            inotify.close()
+    return watcher
+
+
+if __name__ == "__main__":
+    watch_reports(REPORTS_BASE_PATH, process_installation.delay)
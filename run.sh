@@ -1,9 +1,16 @@
 #!/usr/bin/env bash
 
+# In local batch mode the installations are analyzed by a process pool inside the task,
+# which can't be created from the daemonic children of the prefork pool
+if [ "${TIX_PROCESSING_MODE}" == "local-batch" ] ;
+then
+    CELERY_POOL_ARGS="-P solo"
+fi
+
 if [ "${PROCESSOR_TYPE}" == "STANDALONE" ] ;
 then
     echo "Standalone processor started"
-    celery -A processor.tasks worker -B -s ${CELERY_BEAT_SCHEDULE_DIR}/celerybeat-scheduler -l ${CELERY_LOG_LEVEL}
+    celery -A processor.tasks worker -B -s ${CELERY_BEAT_SCHEDULE_DIR}/celerybeat-scheduler -l ${CELERY_LOG_LEVEL} ${CELERY_POOL_ARGS}
 elif [ "${PROCESSOR_TYPE}" == "BEAT" ] ;
 then
     echo "Beat processor started"
@@ -11,7 +18,15 @@ then
 elif [ "${PROCESSOR_TYPE}" == "WORKER" ] ;
 then
     echo "Worker processor started"
-    celery -A processor.tasks worker -l ${CELERY_LOG_LEVEL}
+    celery -A processor.tasks worker -l ${CELERY_LOG_LEVEL} ${CELERY_POOL_ARGS}
+elif [ "${PROCESSOR_TYPE}" == "WATCHER" ] ;
+then
+    echo "Reports watcher started"
+    python -m processor.watcher
+elif [ "${PROCESSOR_TYPE}" == "STREAMING" ] ;
+then
+    echo "Streaming processor started"
+    python -m processor.streaming
 else
     echo "Unknown processor type. Stopping"
 fi
@@ -1,12 +1,15 @@
 import json
 import random
 import socket
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from datetime import datetime, timezone
 
 import jsonschema
 import requests
 import requests_mock
+from requests.packages.urllib3.exceptions import ConnectTimeoutError, MaxRetryError, ReadTimeoutError
 
 from processor import api_communication
 
@@ -141,3 +144,83 @@ class TestApiCommunication(unittest.TestCase):
             result = api_communication.post_results(self.ip, self.results, user_id, installation_id, tix_api_user,
                                                     tix_api_pass)
             self.assertFalse(result)
+
+    def test_client_reuses_session(self):
+        user_id = random.randint(1, 10)
+        installation_id = random.randint(1, 10)
+        tix_api_user = 'test-admin-user'
+        tix_api_pass = 'test-admin-pass'
+        client = api_communication.get_client(tix_api_user, tix_api_pass)
+        self.assertIs(api_communication.get_client(tix_api_user, tix_api_pass), client)
+        self.assertIsNot(api_communication.get_client(tix_api_user, 'other-pass'), client)
+        with requests_mock.mock() as m:
+            expected_url = api_communication.prepare_url(user_id, installation_id)
+            m.register_uri('POST', expected_url, status_code=200)
+            for _ in range(3):
+                result = api_communication.post_results(self.ip, self.results, user_id, installation_id,
+                                                        tix_api_user, tix_api_pass)
+                self.assertTrue(result)
+            self.assertEqual(m.call_count, 3)
+            for request in m.request_history:
+                self.assertTrue(request.headers['Authorization'].startswith('Basic '))
+                self.assertEqual(request.timeout, client.timeout)
+
+    def test_post_results_bulk(self):
+        user_id = random.randint(1, 10)
+        installations_results = [(installation_id, self.ip, self.results) for installation_id in range(1, 4)]
+        result = api_communication.post_results_bulk(user_id, installations_results, None, None)
+        self.assertFalse(result)
+        with requests_mock.mock() as m:
+            tix_api_user = 'test-admin-user'
+            tix_api_pass = 'test-admin-pass'
+            expected_url = api_communication.prepare_bulk_url(user_id)
+            m.register_uri('POST', expected_url, status_code=200)
+            result = api_communication.post_results_bulk(user_id, installations_results, tix_api_user, tix_api_pass)
+            self.assertTrue(result)
+            self.assertEqual(m.call_count, 1)
+            posted_results = m.last_request.json()
+            self.assertEqual([posted_result['installationId'] for posted_result in posted_results], [1, 2, 3])
+            for posted_result in posted_results:
+                posted_result.pop('installationId')
+                jsonschema.validate(posted_result, self.TIX_API_RESULTS_SCHEMA)
+            m.register_uri('POST', expected_url, status_code=500)
+            result = api_communication.post_results_bulk(user_id, installations_results, tix_api_user, tix_api_pass)
+            self.assertFalse(result)
+
+    def test_client_does_not_retry_server_errors(self):
+        statuses = [503]
+        received_requests = []
+
+        class FlakyAPIHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received_requests.append(json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode()))
+                self.send_response(statuses.pop(0))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), FlakyAPIHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.start()
+        try:
+            client = api_communication.APIClient('test-admin-user', 'test-admin-pass', retries=2, backoff_factor=0)
+            url = api_communication.prepare_url(1, 1, tix_api_ssl=False, tix_api_host='127.0.0.1',
+                                                tix_api_port=str(server.server_port))
+            json_data = api_communication.prepare_results_for_api(self.results, self.ip)
+            self.assertFalse(client.post(url, json_data))
+            self.assertEqual(received_requests, [json_data])
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_thread.join()
+
+    def test_retry_only_connection_errors(self):
+        retry = api_communication.build_retry(2, 0)
+        retry = retry.increment(method='POST', url='/', error=ConnectTimeoutError())
+        self.assertEqual(retry.connect, 1)
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertRaises((MaxRetryError, ReadTimeoutError), retry.increment, method='POST', url='/',
+                          error=ReadTimeoutError(None, '/', ''))
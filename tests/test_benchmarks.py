@@ -0,0 +1,67 @@
+import unittest
+
+import numpy
+
+from benchmarks.generators import generate_observations
+from benchmarks.suite import BENCHMARKS, run_benchmarks, compare_results, load_hurst_sequences, run_hurst_estimators
+from processor import analysis, hurst
+
+
+class TestGenerateObservations(unittest.TestCase):
+
+    def test_deterministic(self):
+        self.assertEqual(generate_observations(1000, seed=1), generate_observations(1000, seed=1))
+        self.assertNotEqual(generate_observations(1000, seed=1), generate_observations(1000, seed=2))
+
+    def test_observations(self):
+        observations = generate_observations(5000, congestion=0.2, clock_drift=50, gaps=2)
+        self.assertEqual(len(observations), 5000)
+        self.assertTrue(numpy.all(numpy.diff(observations.day_timestamp) >= 0))
+        self.assertTrue(numpy.all(observations.type_identifier == b'S'))
+        self.assertTrue(numpy.all(observations.final_timestamp > observations.initial_timestamp))
+        self.assertTrue(numpy.all(observations.sent_timestamp > observations.reception_timestamp))
+        self.assertGreaterEqual(numpy.diff(observations.day_timestamp).max(), 360)
+
+    def test_analyzable(self):
+        results = analysis.Analyzer(generate_observations(1200)).get_results()
+        self.assertTrue(len(results) > 0)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        benchmark_results = run_benchmarks([1000], repeat=2, seed=3)
+        self.assertEqual(benchmark_results['metadata']['generator'], {'seed': 3})
+        self.assertEqual([result['benchmark'] for result in benchmark_results['results']], list(BENCHMARKS.keys()))
+        for result in benchmark_results['results']:
+            self.assertEqual(result['size'], 1000)
+            self.assertEqual(len(result['times']), 2)
+            self.assertEqual(result['min'], min(result['times']))
+
+    def test_window_grows_with_size(self):
+        benchmark_results = run_benchmarks([1000, 10000], benchmark_names=['usage_calculator'], repeat=1)
+        window_sizes = [result['window_size'] for result in benchmark_results['results']]
+        self.assertGreater(window_sizes[1], 5 * window_sizes[0])
+
+    def test_unknown_benchmark(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks([1000], benchmark_names=['unknown'])
+
+    def test_compare_results(self):
+        baseline_results = run_benchmarks([1000], benchmark_names=['analyzer'], repeat=1)
+        benchmark_results = run_benchmarks([1000], benchmark_names=['analyzer'], repeat=1)
+        baseline_results['results'][0]['median'] = benchmark_results['results'][0]['median'] * 2
+        result = compare_results(benchmark_results, baseline_results)['results'][0]
+        self.assertAlmostEqual(result['ratio'], 0.5)
+
+    def test_run_hurst_estimators(self):
+        results = run_hurst_estimators(load_hurst_sequences(), lengths=[1024], repeat=1)
+        self.assertEqual([result['estimator'] for result in results], list(hurst.ESTIMATORS.keys()))
+        for result in results:
+            self.assertEqual(result['cost_class'], hurst.ESTIMATORS[result['estimator']].cost_class)
+            self.assertEqual(len(result['estimations']), 2)
+            self.assertLessEqual(result['mean_absolute_difference'], result['max_absolute_difference'])
+        baseline_results = {'metadata': {}, 'results': [], 'hurst_estimators': results}
+        compared_results = compare_results({'metadata': {}, 'results': [], 'hurst_estimators': results},
+                                           baseline_results)
+        self.assertEqual([result['ratio'] for result in compared_results['hurst_estimators']], [1.0] * len(results))
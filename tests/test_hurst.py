@@ -1,6 +1,10 @@
 import json
+import math
 import unittest
 
+import numpy
+import pywt
+
 from processor import hurst
 
 
@@ -24,3 +28,140 @@ class TestHurst(unittest.TestCase):
 
     def testWavelet(self):
         self.estimatorTest(hurst.wavelet, 'wavelet')
+
+    def testRsEngines(self):
+        for engine in hurst.RS_ENGINES:
+            self.estimatorTest(lambda data: hurst.rs(data, engine=engine), 'rs')
+
+    def testCrsNumpy(self):
+        for sequence in self.sequences:
+            data = sequence['values'][:1024]
+            expected_output = [0] * (2 * hurst.NBLK * hurst.NLAG)
+            output = [0] * (2 * hurst.NBLK * hurst.NLAG)
+            hurst.crs(data, len(data), hurst.NBLK, hurst.NLAG, hurst.OVERLAP, expected_output)
+            hurst.crs_numpy(data, len(data), hurst.NBLK, hurst.NLAG, hurst.OVERLAP, output)
+            for expected_value, value in zip(expected_output, output):
+                self.assertAlmostEqual(value, expected_value)
+
+    def testHurstBatch(self):
+        length = 8192
+        data = [sequence['values'][:length] for sequence in self.sequences]
+        batch_values = hurst.hurst_batch(data)
+        for index, sequence in enumerate(data):
+            self.assertAlmostEqual(batch_values['wavelet'][index], hurst.wavelet(sequence))
+            self.assertAlmostEqual(batch_values['rs'][index], hurst.rs(sequence))
+
+    def testHurstBatchRejectsNonPowerOfTwoLength(self):
+        data = [sequence['values'][:1000] for sequence in self.sequences]
+        self.assertRaises(ValueError, hurst.hurst_batch, data)
+
+    def interiorWavelet(self, window, j1=2, j2=7):
+        """
+        wavelet over the coefficients of the window that don't wrap around its ends.
+        """
+        noctave = int(math.log(len(window), 2)) - 1
+        wdec = pywt.wavedec(window, 'db2', 'ppd', level=noctave - 1)
+        statistic = [0.0] * j2
+        for octave in range(j1, j2 + 1):
+            coefficients = wdec[noctave - octave]
+            scale = 2 ** octave
+            interior = [coefficients[k] for k in range(len(coefficients))
+                        if scale * (k - 2) + 2 >= 0 and scale * (k - 2) + 2 + 3 * (scale - 1) < len(window)]
+            statistic[octave - 1] = math.log(numpy.mean(numpy.square(interior)), 2)
+        return hurst._wavelet_fit(statistic, j1, j2)
+
+    def testOnlineWavelet(self):
+        window_size = 1024
+        for sequence in self.sequences:
+            data = sequence['values'][:4096]
+            estimator = hurst.OnlineWaveletHurst(window_size)
+            for sample, value in enumerate(data):
+                estimator.append(value)
+                window_start = sample + 1 - window_size
+                if window_start >= 0 and window_start % 128 == 0:
+                    self.assertAlmostEqual(estimator.hurst(),
+                                           self.interiorWavelet(data[window_start:window_start + window_size]))
+
+    def testOnlineWaveletWindowOnlyDependsOnItsSamples(self):
+        data = self.sequences[0]['values'][:3000]
+        sliding_estimator = hurst.OnlineWaveletHurst(1024)
+        sliding_estimator.extend(data)
+        # Starting at a multiple of 128, the pyramid of the fresh estimator has the phase of the sliding one
+        fresh_estimator = hurst.OnlineWaveletHurst(1024)
+        fresh_estimator.extend(data[15 * 128:])
+        self.assertAlmostEqual(sliding_estimator.hurst(), fresh_estimator.hurst())
+
+    def testOnlineWaveletRequiresAFullWindow(self):
+        estimator = hurst.OnlineWaveletHurst(1024)
+        estimator.extend(self.sequences[0]['values'][:1023])
+        self.assertFalse(estimator.is_ready)
+        self.assertRaises(ValueError, estimator.hurst)
+        self.assertRaises(ValueError, hurst.OnlineWaveletHurst, 1000)
+
+    def testRollingRS(self):
+        window_size = 1024
+        for sequence in self.sequences:
+            data = sequence['values']
+            estimator = hurst.RollingRS(window_size)
+            end = 0
+            # Strides that reuse the blocks of the previous window, that don't, and that skip whole windows
+            for stride in [window_size, 1, 60, 204, 408, 100, 3000, 204]:
+                estimator.extend(data[end:end + stride])
+                end += stride
+                window = data[end - window_size:end]
+                expected_output = [0] * (2 * hurst.NBLK * hurst.NLAG)
+                hurst.crs(window, window_size, hurst.NBLK, hurst.NLAG, hurst.OVERLAP, expected_output)
+                self.assertTrue(numpy.allclose(estimator.statistics(), expected_output))
+                self.assertAlmostEqual(estimator.hurst(), hurst.rs(window))
+
+    def testRollingRSRequiresAFullWindow(self):
+        estimator = hurst.RollingRS(1024)
+        estimator.extend(self.sequences[0]['values'][:1000])
+        self.assertFalse(estimator.is_ready)
+        self.assertRaises(ValueError, estimator.hurst)
+
+    def testEstimatorsBatch(self):
+        data = [sequence['values'][:1024] for sequence in self.sequences]
+        for estimator in hurst.ESTIMATORS.values():
+            batch_values = estimator.batch_function(data)
+            for index, sequence in enumerate(data):
+                self.assertAlmostEqual(batch_values[index], estimator.function(sequence))
+
+    def testEstimatorsAgreeWithReferencePair(self):
+        for sequence in self.sequences:
+            reference = (sequence['expected']['wavelet'] + sequence['expected']['rs']) / 2
+            for estimator_name in ['aggregated_variance', 'dfa', 'periodogram']:
+                estimated_hurst_value = hurst.ESTIMATORS[estimator_name].function(sequence['values'][:8192])
+                self.assertAlmostEqual(estimated_hurst_value, reference, delta=.1)
+
+    def testEstimatorsRejectConstantSeries(self):
+        for estimator_name in ['aggregated_variance', 'dfa', 'periodogram']:
+            self.assertRaises(ValueError, hurst.ESTIMATORS[estimator_name].function, [1.0] * 1024)
+
+    def testHurstBatchEstimators(self):
+        data = [sequence['values'][:1024] for sequence in self.sequences]
+        batch_values = hurst.hurst_batch(data, ['periodogram', 'wavelet'])
+        self.assertEqual(list(batch_values.keys()), ['periodogram', 'wavelet'])
+        for index, sequence in enumerate(data):
+            self.assertAlmostEqual(batch_values['periodogram'][index], hurst.periodogram(sequence))
+
+    def testSelectEstimators(self):
+        self.assertEqual(hurst.select_estimators(['dfa', 'unknown', 'dfa', 'rs']), ('dfa', 'rs', 'wavelet'))
+        self.assertEqual(hurst.select_estimators(['rs', 'periodogram', 'wavelet']), ('rs', 'periodogram', 'wavelet'))
+        self.assertEqual(hurst.select_estimators(['unknown']), hurst.DEFAULT_ESTIMATORS)
+        for estimator in hurst.ESTIMATORS.values():
+            self.assertIn(estimator.cost_class, [hurst.COST_LOW, hurst.COST_MEDIUM, hurst.COST_HIGH])
+
+    def testWindowedHurst(self):
+        data = self.sequences[0]['values'][:3000]
+        estimator = hurst.ESTIMATORS['dfa'].create_online(1024)
+        estimator.extend(data[:1000])
+        self.assertFalse(estimator.is_ready)
+        self.assertRaises(ValueError, estimator.hurst)
+        estimator.extend(data[1000:])
+        self.assertAlmostEqual(estimator.hurst(), hurst.dfa(data[-1024:]))
+        # The wavelet estimations posted to the API are the ones of wavelet over the window
+        estimator = hurst.ESTIMATORS['wavelet'].create_online(1024)
+        estimator.extend(data)
+        self.assertAlmostEqual(estimator.hurst(), hurst.wavelet(data[-1024:]))
+        self.assertIsInstance(hurst.ESTIMATORS['rs'].create_online(1024), hurst.RollingRS)
@@ -0,0 +1,117 @@
+import pstats
+import socket
+import tempfile
+import unittest
+from os import listdir
+from os.path import join, dirname, getsize
+
+from processor import metrics, reports
+
+
+class RecordingSink:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, task_metrics):
+        self.emitted.append(task_metrics)
+
+
+class FailingSink:
+    def emit(self, task_metrics):
+        raise RuntimeError('sink down')
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_disabled_is_a_no_op(self):
+        with metrics.collect('task', sinks=[], profile_dir=None) as task_metrics:
+            self.assertIs(task_metrics, metrics.NULL_METRICS)
+            self.assertIs(metrics.current(), metrics.NULL_METRICS)
+            metrics.increment('reports_loaded')
+            with metrics.timer('analysis'):
+                pass
+
+    def test_collect_emits_timers_and_counters(self):
+        sink = RecordingSink()
+        with metrics.collect('task', {'user_id': '1'}, sinks=[sink], profile_dir=None):
+            metrics.increment('reports_loaded')
+            metrics.increment('bytes_read', 100)
+            metrics.increment('bytes_read', 50)
+            for _ in range(2):
+                with metrics.timer('analysis'):
+                    pass
+        self.assertIs(metrics.current(), metrics.NULL_METRICS)
+        self.assertEqual(len(sink.emitted), 1)
+        task_metrics = sink.emitted[0]
+        self.assertEqual(task_metrics.task_name, 'task')
+        self.assertEqual(task_metrics.tags, {'user_id': '1'})
+        self.assertEqual(task_metrics.counters, {'reports_loaded': 1, 'bytes_read': 150})
+        self.assertEqual(set(task_metrics.timers.keys()), {'analysis', 'total'})
+        self.assertLessEqual(task_metrics.timers['analysis'], task_metrics.timers['total'])
+
+    def test_emits_on_error_and_ignores_failing_sinks(self):
+        sink = RecordingSink()
+        with self.assertRaises(ValueError):
+            with metrics.collect('task', sinks=[FailingSink(), sink], profile_dir=None):
+                metrics.increment('reports_loaded')
+                raise ValueError()
+        self.assertEqual(sink.emitted[0].counters, {'reports_loaded': 1})
+        self.assertIs(metrics.current(), metrics.NULL_METRICS)
+
+    def test_profile_dump(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with metrics.collect('task', {'installation_id': '2'}, sinks=[], profile_dir=profile_dir):
+                sorted(range(1000))
+            profile_files = listdir(profile_dir)
+            self.assertEqual(len(profile_files), 1)
+            self.assertTrue(profile_files[0].startswith('task-2-'))
+            pstats.Stats(join(profile_dir, profile_files[0]))
+
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.task_metrics = metrics.TaskMetrics('process_installation', {'user_id': '1'})
+        self.task_metrics.increment('reports_loaded', 3)
+        self.task_metrics.add_time('analysis', 0.25)
+
+    def test_statsd_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            sink = metrics.StatsDSink('127.0.0.1', server.getsockname()[1])
+            sink.emit(self.task_metrics)
+            data = server.recv(4096).decode()
+        finally:
+            server.close()
+        self.assertEqual(data.split('\n'), ['tix.processor.process_installation.analysis:250.0|ms',
+                                            'tix.processor.process_installation.reports_loaded:3|c'])
+
+    def test_prometheus_textfile_sink_accumulates(self):
+        with tempfile.TemporaryDirectory() as textfile_dir:
+            sink = metrics.PrometheusTextfileSink(join(textfile_dir, 'processor-{pid}.prom'))
+            sink.emit(self.task_metrics)
+            sink.emit(self.task_metrics)
+            textfile_names = listdir(textfile_dir)
+            self.assertEqual(len(textfile_names), 1)
+            with open(join(textfile_dir, textfile_names[0])) as textfile:
+                lines = textfile.read().splitlines()
+        self.assertIn('tix_processor_tasks_total{task="process_installation"} 2', lines)
+        self.assertIn('tix_processor_stage_seconds_total{task="process_installation",stage="analysis"} 0.5', lines)
+        self.assertIn('tix_processor_reports_loaded_total{task="process_installation"} 6', lines)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_report_load_counters(self):
+        report_file_path = join(dirname(__file__), 'test-tix-report.json')
+        sink = RecordingSink()
+        with metrics.collect('task', sinks=[sink], profile_dir=None):
+            report = reports.Report.load(report_file_path, use_cache=False)
+            observations_qty = len(report.observations)
+        counters = sink.emitted[0].counters
+        self.assertEqual(counters['reports_loaded'], 1)
+        self.assertEqual(counters['bytes_read'], getsize(report_file_path))
+        self.assertEqual(counters['observations_decoded'], observations_qty)
+        self.assertIn('load_reports', sink.emitted[0].timers)
@@ -0,0 +1,99 @@
+import json
+import tempfile
+import unittest
+from os import makedirs, listdir
+from os.path import join
+from unittest import mock
+
+from processor import replay, reports
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_acquire_waits_for_tokens(self):
+        current_time = [0.0]
+
+        def sleep(seconds):
+            current_time[0] += seconds
+
+        rate_limiter = replay.RateLimiter(rate=2, burst=2, clock=lambda: current_time[0], sleep=sleep)
+        for _ in range(6):
+            rate_limiter.acquire()
+        # The first two tokens are available right away, the other four arrive every half second
+        self.assertAlmostEqual(current_time[0], 2.0)
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.installations = []
+        self.timestamps = {}
+        timestamp = 1500000000
+        for user_id, installation_id in [('1', '1'), ('1', '2'), ('2', '3')]:
+            installation_dir_path = join(self.working_dir.name, user_id, installation_id)
+            failed_results_dir_path = join(installation_dir_path, reports.ReportHandler.FAILED_RESULTS_DIR_NAME)
+            makedirs(failed_results_dir_path)
+            self.installations.append((installation_dir_path, user_id, installation_id))
+            for _ in range(3):
+                timestamp -= 60
+                file_name = reports.ReportHandler.FAILED_REPORT_FILE_NAME_TEMPLATE.format(timestamp=timestamp)
+                with open(join(failed_results_dir_path, file_name), 'w') as failed_result_file:
+                    json.dump({'results': {'timestamp': timestamp}, 'ip': '10.0.0.1'}, failed_result_file)
+                self.timestamps[timestamp] = (user_id, installation_id)
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def remaining_files(self):
+        return sum([len(listdir(join(installation_dir_path, reports.ReportHandler.FAILED_RESULTS_DIR_NAME)))
+                    for installation_dir_path, user_id, installation_id in self.installations])
+
+    def test_find_failed_results_oldest_first(self):
+        failed_results = replay.find_failed_results(self.installations)
+        self.assertEqual([failed_result.timestamp for failed_result in failed_results], sorted(self.timestamps))
+        for failed_result in failed_results:
+            self.assertEqual((failed_result.user_id, failed_result.installation_id),
+                             self.timestamps[failed_result.timestamp])
+
+    def test_replay_posts_oldest_first_and_deletes_posted(self):
+        posted_timestamps = []
+
+        def post_results(ip, results, user_id, installation_id):
+            posted_timestamps.append(results['timestamp'])
+            return True
+
+        with mock.patch('processor.api_communication.post_results', side_effect=post_results):
+            progress = replay.replay_failed_results(self.installations, max_workers=1, rate=1000)
+        self.assertEqual(posted_timestamps, sorted(self.timestamps))
+        self.assertEqual(progress, {'total': 9, 'posted': 9, 'failed': 0, 'invalid': 0})
+        self.assertEqual(self.remaining_files(), 0)
+
+    def test_replay_keeps_failed_posts(self):
+        with mock.patch('processor.api_communication.post_results',
+                        side_effect=lambda ip, results, user_id, installation_id: results['timestamp'] % 120 == 0):
+            progress = replay.replay_failed_results(self.installations, max_workers=3, rate=1000)
+        expected_posted = len([timestamp for timestamp in self.timestamps if timestamp % 120 == 0])
+        self.assertEqual(progress['posted'], expected_posted)
+        self.assertEqual(progress['failed'], 9 - expected_posted)
+        self.assertEqual(self.remaining_files(), 9 - expected_posted)
+
+    def test_replay_counts_errors_as_failed(self):
+        def post_results(ip, results, user_id, installation_id):
+            if results['timestamp'] % 120 == 0:
+                raise ValueError('unexpected')
+            return True
+
+        with mock.patch('processor.api_communication.post_results', side_effect=post_results):
+            progress = replay.replay_failed_results(self.installations, max_workers=3, rate=1000)
+        expected_failed = len([timestamp for timestamp in self.timestamps if timestamp % 120 == 0])
+        self.assertEqual(progress, {'total': 9, 'posted': 9 - expected_failed, 'failed': expected_failed,
+                                    'invalid': 0})
+        self.assertEqual(self.remaining_files(), expected_failed)
+
+    def test_replay_counts_posted_results_that_cannot_be_deleted(self):
+        with mock.patch('processor.api_communication.post_results', return_value=True), \
+                mock.patch('processor.replay.unlink', side_effect=OSError('read-only')):
+            progress = replay.replay_failed_results(self.installations, max_workers=3, rate=1000)
+        self.assertEqual(progress, {'total': 9, 'posted': 9, 'failed': 0, 'invalid': 0})
+        self.assertEqual(self.remaining_files(), 9)
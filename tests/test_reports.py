@@ -1,12 +1,16 @@
 import json
+import base64
 import random
 import socket
+import struct
 import tempfile
 import unittest
+from unittest import mock
 
 import datetime
 
 import jsonschema
+import numpy
 from os import unlink, getcwd, listdir
 
 from os.path import join, exists
@@ -56,7 +60,8 @@ def generate_report(from_dir, to_dir, user_id, installation_id,
     packet_type = 'LONG'
     initial_timestamp = reception_timestamp = sent_timestamp = final_timestamp = 0
     public_key = signature = 'a'
-    observations = generate_observations(start_time, report_delta, observations_delta)
+    observations = reports.ObservationBatch.from_observations(generate_observations(start_time, report_delta,
+                                                                                    observations_delta))
     return reports.Report(from_dir=from_dir,
                           to_dir=to_dir,
                           packet_type=packet_type,
@@ -86,6 +91,103 @@ class TestReports(unittest.TestCase):
         jsonschema.validate(naive_json_report, reports.JSON_REPORT_SCHEMA)
 
 
+    def test_fast_decoder(self):
+        report = generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID)
+        json_report_string = json.dumps(report, cls=reports.ReportJSONEncoder)
+        fast_report = json.loads(json_report_string, cls=reports.FastReportJSONDecoder)
+        self.assertEqual(fast_report, json.loads(json_report_string, cls=reports.ReportJSONDecoder))
+        self.assertEqual(fast_report, report)
+
+    def test_fast_decoder_decodes_message_lazily(self):
+        report = generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID)
+        json_report_string = json.dumps(report, cls=reports.ReportJSONEncoder)
+        with mock.patch('processor.reports.deserialize_observations',
+                        wraps=reports.deserialize_observations) as deserialize_mock:
+            fast_report = json.loads(json_report_string, cls=reports.FastReportJSONDecoder)
+            self.assertEqual(json.loads(json.dumps(fast_report, cls=reports.ReportJSONEncoder)),
+                             json.loads(json_report_string))
+            self.assertFalse(deserialize_mock.called)
+            self.assertEqual(fast_report.observations, report.observations)
+            fast_report.observations
+            self.assertEqual(deserialize_mock.call_count, 1)
+
+    def test_fast_decoder_checks_report_structure(self):
+        naive_json_report = json.loads(json.dumps(generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID),
+                                                  cls=reports.ReportJSONEncoder))
+        self.assertTrue(reports.is_report_json_dict(naive_json_report))
+        for key, value in [('userId', True), ('userId', 1.5), ('from', 1), ('type', 'SHORT'), ('message', None)]:
+            invalid_json_report = dict(naive_json_report)
+            invalid_json_report[key] = value
+            self.assertFalse(reports.is_report_json_dict(invalid_json_report))
+            self.assertFalse(reports.JSON_REPORT_VALIDATOR.is_valid(invalid_json_report))
+        invalid_json_report = dict(naive_json_report)
+        invalid_json_report.pop('signature')
+        self.assertFalse(reports.is_report_json_dict(invalid_json_report))
+
+
+class TestObservationBatch(unittest.TestCase):
+    def setUp(self):
+        self.observations = generate_observations(datetime.datetime.now(datetime.timezone.utc),
+                                                  DEFAULT_REPORT_DELTA,
+                                                  DEFAULT_OBSERVATIONS_DELTA)
+        self.batch = reports.ObservationBatch.from_observations(self.observations)
+
+    def test_compatibility_view(self):
+        self.assertEqual(len(self.batch), len(self.observations))
+        self.assertEqual(self.batch.to_observations(), self.observations)
+        self.assertEqual(self.batch[0], self.observations[0])
+        self.assertEqual(self.batch[-1], self.observations[-1])
+        self.assertEqual(self.batch[1:3].to_observations(), self.observations[1:3])
+
+    def test_columns(self):
+        for field in reports.SerializedObservation.fields:
+            self.assertEqual(getattr(self.batch, field.name).tolist(),
+                             [getattr(observation, field.name) for observation in self.observations])
+
+    def test_deserialize_observations(self):
+        message = reports.serialize_observations(self.observations)
+        batch = reports.deserialize_observations(message)
+        self.assertTrue(isinstance(batch, reports.ObservationBatch))
+        self.assertEqual(batch, self.batch)
+
+    def test_serialize_observations(self):
+        expected_bytes = b''.join([struct.pack(field.type.get_struct_representation(),
+                                               getattr(observation, field.name))
+                                   for observation in self.observations
+                                   for field in reports.SerializedObservation.fields])
+        self.assertEqual(reports.SerializedObservation.serialized_dtype.itemsize,
+                         reports.SerializedObservation.byte_size)
+        self.assertEqual(reports.serialize_observations(self.observations), base64.b64encode(expected_bytes).decode())
+        self.assertEqual(reports.serialize_observations(self.batch), base64.b64encode(expected_bytes).decode())
+
+    def test_unique(self):
+        duplicated_batch = reports.ObservationBatch.concatenate([self.batch, self.batch[::-1]])
+        self.assertEqual(len(duplicated_batch), 2 * len(self.batch))
+        self.assertEqual(duplicated_batch.unique(), self.batch.sorted_by_day_timestamp())
+
+
+    def test_merge_sorted_runs(self):
+        tied_batch = reports.ObservationBatch(self.batch.records.copy())
+        # Several observations per second, in no particular order within each second
+        tied_batch.records['day_timestamp'] = tied_batch.records['day_timestamp'][::-1] // 3 * 3
+        tied_batch = tied_batch.sorted_by_day_timestamp()
+        runs = [tied_batch[:40], tied_batch[20:], tied_batch[10:30]]
+        merged_batch = reports.ObservationBatch.merge_sorted_runs(runs)
+        self.assertEqual(merged_batch, reports.ObservationBatch.concatenate(runs).unique())
+        self.assertEqual(len(merged_batch), len(tied_batch))
+        self.assertTrue(merged_batch.is_sorted)
+        self.assertEqual(len(reports.ObservationBatch.merge_sorted_runs([])), 0)
+
+    def test_is_sorted(self):
+        sorted_batch = self.batch.sorted_by_day_timestamp()
+        self.assertTrue(sorted_batch.is_sorted)
+        self.assertIs(sorted_batch.sorted_by_day_timestamp(), sorted_batch)
+        self.assertTrue(sorted_batch[1:].is_sorted)
+        self.assertTrue(sorted_batch[sorted_batch.type_identifier == b'S'].is_sorted)
+        self.assertFalse(sorted_batch[::-1].is_sorted)
+        self.assertFalse(sorted_batch[numpy.array([2, 1])].is_sorted)
+        self.assertFalse(reports.ObservationBatch.concatenate([sorted_batch, sorted_batch]).is_sorted)
+
 class TestReport(unittest.TestCase):
     def test_load(self):
         report_file = tempfile.NamedTemporaryFile(mode='w', delete=False)
@@ -100,6 +202,23 @@ class TestReport(unittest.TestCase):
         self.assertEquals(original_report, loaded_report)
         unlink(report_file_path)
 
+    def test_lazy_report_summary(self):
+        for observations_qty in [1, 2, 3, 4, 60]:
+            report = generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID)
+            report.observations = report.observations[:observations_qty]
+            json_report_string = json.dumps(report, cls=reports.ReportJSONEncoder)
+            lazy_report = json.loads(json_report_string, cls=reports.FastReportJSONDecoder)
+            with mock.patch('processor.reports.deserialize_observations') as deserialize_mock:
+                self.assertEqual(lazy_report.observations_qty, observations_qty)
+                self.assertEqual(lazy_report.first_day_timestamp, report.first_day_timestamp)
+                self.assertEqual(lazy_report.last_day_timestamp, report.last_day_timestamp)
+                self.assertEqual(lazy_report.get_observations_gap(), report.get_observations_gap())
+            self.assertFalse(deserialize_mock.called)
+            self.assertEqual(reports.deserialize_message_observation(lazy_report.message, observations_qty - 1),
+                             report.observations[-1])
+            with self.assertRaises(IndexError):
+                reports.deserialize_message_observation(lazy_report.message, observations_qty)
+
     def test_load_file(self):
         report_file_name = 'test-tix-report.json'
         current_working_directory = getcwd()
@@ -124,6 +243,105 @@ class TestReport(unittest.TestCase):
         self.assertEqual(gap, expected_gap)
 
 
+class TestReportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.report = generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID)
+        self.report.file_path = join(self.working_dir.name, 'tix-report.json')
+        self.write_report()
+        self.cache_file_path = reports.ReportCache.get_file_path(self.report.file_path)
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def write_report(self):
+        with open(self.report.file_path, 'w') as report_fp:
+            json.dump(self.report, report_fp, cls=reports.ReportJSONEncoder)
+
+    def test_load_writes_and_uses_cache(self):
+        self.assertEqual(reports.Report.load(self.report.file_path, use_cache=True), self.report)
+        self.assertTrue(exists(self.cache_file_path))
+        with mock.patch('json.load') as json_load_mock:
+            cached_report = reports.Report.load(self.report.file_path, use_cache=True)
+        self.assertFalse(json_load_mock.called)
+        self.assertEqual(cached_report, self.report)
+        self.assertEqual(cached_report.file_path, self.report.file_path)
+
+    def test_stale_cache_is_ignored(self):
+        reports.Report.load(self.report.file_path, use_cache=True)
+        self.report.observations = self.report.observations[:10]
+        self.write_report()
+        self.assertEqual(len(reports.Report.load(self.report.file_path, use_cache=True).observations), 10)
+
+    def test_unreadable_cache_is_ignored(self):
+        with open(self.cache_file_path, 'wb') as cache_file:
+            cache_file.write(b'not a cache')
+        self.assertEqual(reports.Report.load(self.report.file_path, use_cache=True), self.report)
+
+    def test_cache_is_deleted_with_report(self):
+        reports.Report.load(self.report.file_path, use_cache=True)
+        reports.ReportHandler.delete_reports_files([self.report])
+        self.assertFalse(exists(self.report.file_path))
+        self.assertFalse(exists(self.cache_file_path))
+
+
+class TestUnlinkFiles(unittest.TestCase):
+
+    def test_unlink_files(self):
+        with tempfile.TemporaryDirectory() as working_dir:
+            files_paths = [join(working_dir, 'report-{}.json'.format(index)) for index in range(3)]
+            for file_path in files_paths:
+                open(file_path, 'w').close()
+            self.assertEqual(reports.unlink_files(files_paths + [join(working_dir, 'missing.json'),
+                                                                 join(working_dir, 'missing', 'report.json')]), 3)
+            self.assertEqual(listdir(working_dir), [])
+
+
+class TestReportsJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.report = generate_report(FROM_DIR, TO_DIR, USER_ID, INSTALLATION_ID)
+        self.report.file_path = join(self.working_dir.name, 'tix-report.json')
+        self.results = {'timestamp': 1, 'upstream': {'usage': .5}}
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def test_records_are_loaded(self):
+        journal = reports.ReportsJournal.load(self.working_dir.name)
+        first_window_id = journal.record_analyzed('10.0.0.1', self.results, [self.report])
+        journal.record_posted(first_window_id)
+        second_window_id = journal.record_analyzed('10.0.0.1', self.results, [])
+        journal = reports.ReportsJournal.load(self.working_dir.name)
+        self.assertEqual([(window.window_id, window.state) for window in journal.get_unfinished_windows()],
+                         [(first_window_id, reports.ReportsJournal.POSTED),
+                          (second_window_id, reports.ReportsJournal.ANALYZED)])
+        self.assertEqual(journal.windows[first_window_id].results, self.results)
+        self.assertEqual(journal.get_window_reports_files_paths(first_window_id), [self.report.file_path])
+        self.assertEqual(journal.record_analyzed('10.0.0.1', self.results, []), second_window_id + 1)
+
+    def test_incomplete_record_is_ignored(self):
+        journal = reports.ReportsJournal.load(self.working_dir.name)
+        window_id = journal.record_analyzed('10.0.0.1', self.results, [self.report])
+        with open(journal.file_path, 'a') as journal_file:
+            journal_file.write('{"window_id": 1, "sta')
+        journal = reports.ReportsJournal.load(self.working_dir.name)
+        self.assertEqual(journal.windows[window_id].state, reports.ReportsJournal.ANALYZED)
+
+    def test_clean_up(self):
+        journal = reports.ReportsJournal.load(self.working_dir.name)
+        window_id = journal.record_analyzed('10.0.0.1', self.results, [self.report])
+        journal.clean_up()
+        self.assertTrue(exists(journal.file_path))
+        journal.record_posted(window_id)
+        journal.record_pruned(window_id)
+        journal.clean_up()
+        self.assertFalse(exists(journal.file_path))
+        self.assertEqual(reports.ReportsJournal.load(self.working_dir.name).windows, {})
+
+
 class TestReportsHandler(unittest.TestCase):
 
     @staticmethod
@@ -174,6 +392,43 @@ class TestReportsHandler(unittest.TestCase):
         self.assertEquals(processable_observations, expected_processable_observations)
         self.assertEqual(ip, expected_ip)
 
+    def test_reports_index_avoids_reloading_reports(self):
+        created_reports = self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
+                                                   total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY * 2,
+                                                   start_time=datetime.datetime.now(tz=datetime.timezone.utc),
+                                                   reports_delta=DEFAULT_REPORT_DELTA,
+                                                   observations_delta=DEFAULT_OBSERVATIONS_DELTA)
+        self.reports_handler.update_processable_reports()
+        expected_processable_reports = self.reports_handler.processable_reports
+        self.assertTrue(exists(join(self.working_dir.name, reports.ReportsIndex.FILE_NAME)))
+        reports_index = reports.ReportsIndex.load(self.working_dir.name)
+        self.assertEqual(len(reports_index.entries), len(expected_processable_reports))
+        entry = reports_index.entries[sorted(reports_index.entries)[0]]
+        self.assertEqual(entry.first_day_timestamp, created_reports[0].first_day_timestamp)
+        self.assertEqual(entry.last_day_timestamp, created_reports[0].last_day_timestamp)
+        self.assertEqual(entry.observations_qty, created_reports[0].observations_qty)
+        # Only the reports in the window are loaded again
+        with mock.patch('processor.reports.Report.load', wraps=reports.Report.load) as load_mock:
+            reports_handler = reports.ReportHandler(self.working_dir.name)
+            reports_handler.update_processable_reports()
+        self.assertEqual(reports_handler.processable_reports, expected_processable_reports)
+        self.assertEqual(load_mock.call_count, len(expected_processable_reports))
+
+    def test_reports_index_detects_changed_reports(self):
+        created_reports = self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
+                                                   total_observations_qty=120,
+                                                   start_time=datetime.datetime.now(tz=datetime.timezone.utc),
+                                                   reports_delta=DEFAULT_REPORT_DELTA,
+                                                   observations_delta=DEFAULT_OBSERVATIONS_DELTA)
+        reports_index = reports.ReportsIndex(self.working_dir.name)
+        entry = reports_index.get_entry(created_reports[0].file_path)
+        self.assertEqual(entry.observations_qty, 60)
+        report = created_reports[0]
+        report.observations = report.observations[:30]
+        with open(report.file_path, 'w') as report_fp:
+            json.dump(report, report_fp, cls=reports.ReportJSONEncoder)
+        self.assertEqual(reports_index.get_entry(created_reports[0].file_path).observations_qty, 30)
+
     def test_returns_None_if_not_enough_processable_reports(self):
         self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
                                  total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY / 2,
@@ -230,6 +485,49 @@ class TestReportsHandler(unittest.TestCase):
         self.assertIsNone(processable_observations)
         self.assertIsNone(processable_observations)
 
+    def test_processable_windows_per_ip(self):
+        start_time = datetime.datetime.now(tz=datetime.timezone.utc)
+        processable_reports_per_ip = {}
+        # The reports of both IPs alternate, so a single window would never fill up
+        for index, from_dir in enumerate(['10.0.0.1:4500', '10.0.0.2:4500']):
+            processable_reports_per_ip[from_dir.split(':')[0]] = \
+                self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
+                                         total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY,
+                                         start_time=start_time + datetime.timedelta(seconds=index),
+                                         reports_delta=DEFAULT_REPORT_DELTA,
+                                         observations_delta=DEFAULT_OBSERVATIONS_DELTA,
+                                         from_dir=from_dir)
+        windows = self.reports_handler.get_processable_windows()
+        self.assertEqual(sorted([window.ip for window in windows]), sorted(processable_reports_per_ip.keys()))
+        for window in windows:
+            expected_ip, expected_observations = \
+                reports.ReportHandler.collect_observations(processable_reports_per_ip[window.ip])
+            self.assertEqual(window.collect_observations(), expected_observations)
+        windows[0].delete_unneeded_reports()
+        remaining_reports_qty = len(windows[0].reports) - len(windows[0].reports) // 2 + len(windows[1].reports)
+        self.assertEqual(len([file_name for file_name in listdir(self.working_dir.name)
+                              if file_name.endswith('.json')]), remaining_reports_qty)
+
+    def test_processable_windows_delete_stale_ips(self):
+        start_time = datetime.datetime.now(tz=datetime.timezone.utc)
+        self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
+                                 total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY / 2,
+                                 start_time=start_time,
+                                 reports_delta=DEFAULT_REPORT_DELTA,
+                                 observations_delta=DEFAULT_OBSERVATIONS_DELTA,
+                                 from_dir='10.0.0.1:4500')
+        self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
+                                 total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY / 2,
+                                 start_time=start_time + datetime.timedelta(hours=1),
+                                 reports_delta=DEFAULT_REPORT_DELTA,
+                                 observations_delta=DEFAULT_OBSERVATIONS_DELTA,
+                                 from_dir='10.0.0.2:4500')
+        self.assertEqual(self.reports_handler.get_processable_windows(), [])
+        remaining_reports = [reports.Report.load(join(self.working_dir.name, file_name))
+                             for file_name in listdir(self.working_dir.name) if file_name.endswith('.json')]
+        self.assertTrue(len(remaining_reports) > 0)
+        self.assertEqual(set(report.from_dir for report in remaining_reports), {'10.0.0.2:4500'})
+
     def test_collect_observations(self):
         created_reports = self.create_report_files(dir_path=self.reports_handler.installation_dir_path,
                                                    total_observations_qty=reports.ReportHandler.MINIMUM_OBSERVATIONS_QTY,
@@ -241,4 +539,5 @@ class TestReportsHandler(unittest.TestCase):
             expected_observations.update(report.observations)
         ip, observations = self.reports_handler.collect_observations(created_reports)
         self.assertTrue(FROM_DIR.startswith(ip))
-        self.assertEquals(observations, expected_observations)
+        self.assertEquals(set(observations), expected_observations)
+        self.assertEqual(len(observations), len(expected_observations))
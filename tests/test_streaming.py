@@ -0,0 +1,144 @@
+import json
+import tempfile
+import unittest
+from datetime import timedelta
+from os import makedirs, listdir
+from os.path import join, dirname
+
+from benchmarks.generators import generate_observations
+from processor import analysis, reports, streaming
+
+
+class TestStreamingAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        self.observations = generate_observations(3600, congestion=0.2, seed=1)
+
+    def test_emits_every_stride(self):
+        streaming_analyzer = analysis.StreamingAnalyzer(stride=60)
+        windows_results = streaming_analyzer.add_observations(self.observations)
+        # The Hurst estimators are ready after 1024 observations, the first window ending after them ends at 1080
+        first_timestamp = self.observations.day_timestamp[0]
+        self.assertEqual([results['timestamp'] for results in windows_results],
+                         [first_timestamp + end - 1 for end in range(1080, 3600, 60)])
+        for results in windows_results:
+            for direction in ['upstream', 'downstream']:
+                self.assertEqual(set(results[direction].keys()), {'usage', 'quality', 'hurst'})
+                self.assertEqual(set(results[direction]['hurst'].keys()), {'wavelet', 'rs'})
+                self.assertTrue(0 <= results[direction]['quality'] <= 1)
+
+    def test_results_do_not_depend_on_how_observations_arrive(self):
+        expected_results = analysis.StreamingAnalyzer().add_observations(self.observations)
+        streaming_analyzer = analysis.StreamingAnalyzer()
+        windows_results = []
+        for start in range(0, len(self.observations), 45):
+            windows_results += streaming_analyzer.add_observations(self.observations[start:start + 45])
+        self.assertEqual(windows_results, expected_results)
+
+    def test_skips_windows_without_new_observations(self):
+        observations = generate_observations(3600, congestion=0.2, gaps=2, gap_duration=300, seed=1)
+        windows_results = analysis.StreamingAnalyzer(stride=60).add_observations(observations)
+        timestamps = [results['timestamp'] for results in windows_results]
+        self.assertGreater(len(timestamps), 0)
+        # The windows ending during a gap have no new observations, so no results are repeated
+        self.assertEqual(timestamps, sorted(set(timestamps)))
+
+    def test_usage_of_last_window(self):
+        streaming_analyzer = analysis.StreamingAnalyzer(window=timedelta(minutes=10))
+        last_results = streaming_analyzer.add_observations(self.observations)[-1]
+        window_end = self.observations.day_timestamp[-1] - self.observations.day_timestamp[-1] % 60
+        window_observations = self.observations[(self.observations.day_timestamp >= window_end - 600) &
+                                                (self.observations.day_timestamp < window_end)]
+        rtt_histogram = analysis.FixedSizeBinArrayHistogram(window_observations,
+                                                            analysis.observation_rtt_key_function)
+        clock_fixer = analysis.ClockFixer(rtt_histogram.bins[0].data, tau=rtt_histogram.mode)
+        usage_calculator = analysis.UsageCalculator(window_observations, clock_fixer)
+        self.assertEqual(last_results['upstream']['usage'], usage_calculator.upstream_usage)
+        self.assertEqual(last_results['downstream']['usage'], usage_calculator.downstream_usage)
+        self.assertEqual(len(streaming_analyzer.minutes_usages), 10)
+
+    def test_drops_late_observations(self):
+        streaming_analyzer = analysis.StreamingAnalyzer()
+        streaming_analyzer.add_observations(self.observations[1000:2000])
+        self.assertEqual(streaming_analyzer.add_observations(self.observations[:1000]), [])
+        self.assertEqual(streaming_analyzer.late_observations_qty, 1000)
+
+    def test_hurst_estimators(self):
+        streaming_analyzer = analysis.StreamingAnalyzer(hurst_estimators_names=('rs', 'periodogram'))
+        results = streaming_analyzer.add_observations(self.observations)[-1]
+        expected_results = analysis.StreamingAnalyzer().add_observations(self.observations)[-1]
+        self.assertEqual(set(results['upstream']['hurst'].keys()), {'rs', 'periodogram'})
+        self.assertEqual(results['upstream']['hurst']['rs'], expected_results['upstream']['hurst']['rs'])
+
+    def test_rejects_stride_over_window(self):
+        self.assertRaises(ValueError, analysis.StreamingAnalyzer, stride=3600)
+
+
+class TestInstallationStream(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.installation_dir_path = join(self.working_dir.name, '1', '2')
+        makedirs(self.installation_dir_path)
+        with open(join(dirname(__file__), 'test-tix-report.json')) as report_file:
+            self.report_template = json.load(report_file)
+        self.observations = generate_observations(3600, congestion=0.2, seed=1)
+        self.posted = []
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def write_report(self, index, ip='10.0.0.1'):
+        report = dict(self.report_template)
+        report['from'] = '{}:4500'.format(ip)
+        report['message'] = reports.serialize_observations(self.observations[index * 60:(index + 1) * 60])
+        with open(join(self.installation_dir_path, 'report-{:04d}.json'.format(index)), 'w') as report_file:
+            json.dump(report, report_file)
+
+    def test_streams_reports(self):
+        stream = streaming.InstallationStream(self.installation_dir_path,
+                                              lambda ip, results: self.posted.append((ip, results)))
+        for index in range(30):
+            self.write_report(index)
+            stream.update()
+        expected_results = analysis.StreamingAnalyzer().add_observations(self.observations[:1800])
+        self.assertEqual(self.posted, [('10.0.0.1', results) for results in expected_results])
+        # Only the reports of the next window are kept
+        self.assertEqual(sorted(listdir(self.installation_dir_path)),
+                         ['report-{:04d}.json'.format(index) for index in range(20, 30)])
+
+    def test_starts_over_when_ip_changes(self):
+        stream = streaming.InstallationStream(self.installation_dir_path,
+                                              lambda ip, results: self.posted.append((ip, results)))
+        for index in range(5):
+            self.write_report(index)
+        stream.update()
+        self.write_report(5, ip='10.0.0.2')
+        stream.update()
+        self.assertEqual(stream.ip, '10.0.0.2')
+        self.assertEqual(listdir(self.installation_dir_path), ['report-0005.json'])
+
+    def test_deletes_unreadable_reports(self):
+        stream = streaming.InstallationStream(self.installation_dir_path,
+                                              lambda ip, results: self.posted.append((ip, results)))
+        self.write_report(0)
+        with open(join(self.installation_dir_path, 'report-0001.json'), 'w') as report_file:
+            report_file.write('{"truncated": ')
+        self.write_report(2)
+        for _ in range(streaming.InstallationStream.MAXIMUM_REPORT_LOAD_ATTEMPTS - 1):
+            stream.update()
+            self.assertEqual(sorted(stream.reports.keys()), ['report-0000.json'])
+        stream.update()
+        self.assertEqual(sorted(stream.reports.keys()), ['report-0000.json', 'report-0002.json'])
+        self.assertEqual(sorted(listdir(self.installation_dir_path)), ['report-0000.json', 'report-0002.json'])
+
+    def test_stream_reports(self):
+        for index in range(20):
+            self.write_report(index)
+        streams = streaming.stream_reports(self.working_dir.name,
+                                           results_callback=lambda *posted: self.posted.append(posted),
+                                           should_stop=lambda: True)
+        self.assertEqual(list(streams.keys()), [self.installation_dir_path])
+        self.assertEqual([posted[0] for posted in self.posted], [self.installation_dir_path] * len(self.posted))
+        # The windows ending at 1080 and 1140 seconds
+        self.assertEqual(len(self.posted), 2)
@@ -0,0 +1,140 @@
+import json
+import tempfile
+import unittest
+from os import makedirs, listdir
+from os.path import join, dirname, exists, basename
+from unittest import mock
+
+from benchmarks.generators import generate_observations
+from processor import reports, tasks
+
+
+class TestAnalyzeInstallation(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.installation_dir_path = join(self.working_dir.name, '1', '2')
+        makedirs(self.installation_dir_path)
+        with open(join(dirname(__file__), 'test-tix-report.json')) as report_file:
+            report_template = json.load(report_file)
+        observations = generate_observations(1200, congestion=0.2, seed=1)
+        for index in range(20):
+            report = dict(report_template)
+            report['message'] = reports.serialize_observations(observations[index * 60:(index + 1) * 60])
+            with open(join(self.installation_dir_path, 'report-{:04d}.json'.format(index)), 'w') as report_file:
+                json.dump(report, report_file)
+        self.posted = []
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def analyze_installation(self):
+        tasks.analyze_installation(self.installation_dir_path, '1', '2',
+                                   lambda ip, results: self.posted.append((ip, json.loads(json.dumps(results)))))
+
+    def reports_files_names(self):
+        return sorted(file_name for file_name in listdir(self.installation_dir_path) if file_name.endswith('.json'))
+
+    def test_analyze_installation(self):
+        self.analyze_installation()
+        self.assertEqual(len(self.posted), 1)
+        # The first half of the window is deleted, the last report was not part of it
+        self.assertEqual(self.reports_files_names(), ['report-{:04d}.json'.format(index) for index in range(9, 20)])
+        self.assertFalse(exists(join(self.installation_dir_path, reports.ReportsJournal.FILE_NAME)))
+
+    def test_resumes_without_analyzing_again(self):
+        with mock.patch('processor.reports.ReportHandler.delete_files', side_effect=OSError('crash')):
+            self.assertRaises(OSError, self.analyze_installation)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual(len(self.reports_files_names()), 20)
+        with mock.patch('processor.tasks.analyze_observations') as analyze_observations_mock:
+            self.analyze_installation()
+        self.assertFalse(analyze_observations_mock.called)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual(self.reports_files_names(), ['report-{:04d}.json'.format(index) for index in range(9, 20)])
+        self.assertFalse(exists(join(self.installation_dir_path, reports.ReportsJournal.FILE_NAME)))
+
+    def test_resumes_posting_results(self):
+        expected_posted = []
+
+        def crash(ip, results):
+            expected_posted.append((ip, json.loads(json.dumps(results))))
+            raise OSError('crash')
+        with self.assertRaises(OSError):
+            tasks.analyze_installation(self.installation_dir_path, '1', '2', crash)
+        with mock.patch('processor.tasks.analyze_observations') as analyze_observations_mock:
+            self.analyze_installation()
+        self.assertFalse(analyze_observations_mock.called)
+        self.assertEqual(self.posted, expected_posted)
+        self.assertEqual(len(self.reports_files_names()), 11)
+
+    def pending_results_files_names(self):
+        return listdir(join(self.installation_dir_path, reports.ReportHandler.PENDING_RESULTS_DIR_NAME))
+
+    def test_analyze_installation_locally_backs_up_results(self):
+        pending_results = tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')
+        self.assertEqual(len(pending_results), 1)
+        pending_result_file_path, ip, results = pending_results[0]
+        self.assertTrue(exists(pending_result_file_path))
+        self.assertEqual(len(self.reports_files_names()), 11)
+
+    def test_analyze_installation_locally_keeps_results_after_crash(self):
+        with mock.patch('processor.reports.ReportHandler.delete_files', side_effect=OSError('crash')):
+            self.assertEqual(len(tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')), 1)
+        self.assertEqual(len(self.reports_files_names()), 20)
+        with mock.patch('processor.tasks.analyze_observations') as analyze_observations_mock:
+            pending_results = tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')
+        self.assertFalse(analyze_observations_mock.called)
+        self.assertEqual(len(pending_results), 1)
+        self.assertEqual(len(self.reports_files_names()), 11)
+
+    def test_analyze_installation_locally_backs_up_results_once(self):
+        with mock.patch('processor.reports.ReportsJournal.record_posted', side_effect=OSError('crash')):
+            self.assertEqual(len(tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')), 1)
+        self.assertEqual(len(self.reports_files_names()), 20)
+        with mock.patch('processor.tasks.analyze_observations') as analyze_observations_mock:
+            pending_results = tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')
+        self.assertFalse(analyze_observations_mock.called)
+        # Backing up the results again when resuming the window overwrites the same file
+        self.assertEqual(len(pending_results), 1)
+        self.assertEqual(len(self.pending_results_files_names()), 1)
+        self.assertEqual(len(self.reports_files_names()), 11)
+
+    def test_post_pending_results(self):
+        (pending_result_file_path, ip, results), = tasks.analyze_installation_locally(self.installation_dir_path,
+                                                                                      '1', '2')
+        with mock.patch('processor.api_communication.post_results', return_value=True):
+            tasks.post_pending_results(self.installation_dir_path, pending_result_file_path, ip, results, '1', '2')
+        self.assertEqual(self.pending_results_files_names(), [])
+        self.assertTrue(reports.ReportHandler(self.installation_dir_path).failed_results_dir_is_empty())
+
+    def test_post_pending_results_fails(self):
+        (pending_result_file_path, ip, results), = tasks.analyze_installation_locally(self.installation_dir_path,
+                                                                                      '1', '2')
+        with mock.patch('processor.api_communication.post_results', return_value=False):
+            tasks.post_pending_results(self.installation_dir_path, pending_result_file_path, ip, results, '1', '2')
+        self.assertEqual(self.pending_results_files_names(), [])
+        failed_results_dir_path = join(self.installation_dir_path, reports.ReportHandler.FAILED_RESULTS_DIR_NAME)
+        self.assertEqual(listdir(failed_results_dir_path),
+                         [reports.ReportHandler.FAILED_REPORT_FILE_NAME_TEMPLATE.format(timestamp=results['timestamp'])])
+
+    def test_pending_results_are_never_overwritten(self):
+        reports_handler = reports.ReportHandler(self.installation_dir_path)
+        results = {'timestamp': 1500000000}
+        reports_handler.back_up_failed_results(results, '10.0.0.1')
+        for ip in ['10.0.0.1', '10.0.0.2']:
+            reports_handler.back_up_pending_results(results, ip)
+        self.assertEqual(len(self.pending_results_files_names()), 2)
+        failed_results_files_names = [basename(reports_handler.fail_pending_results(pending_result_file_path))
+                                      for pending_result_file_path, _, _ in reports_handler.load_pending_results()]
+        self.assertEqual(failed_results_files_names, ['failed-report-1500000000-1.json',
+                                                      'failed-report-1500000000-2.json'])
+        self.assertEqual(len(listdir(reports_handler.failed_results_dir_path)), 3)
+        for file_name in failed_results_files_names:
+            self.assertEqual(reports.ReportHandler.get_failed_result_timestamp(file_name), 1500000000)
+
+    def test_fail_pending_results(self):
+        tasks.analyze_installation_locally(self.installation_dir_path, '1', '2')
+        tasks.fail_pending_results(self.working_dir.name)
+        self.assertEqual(self.pending_results_files_names(), [])
+        self.assertFalse(reports.ReportHandler(self.installation_dir_path).failed_results_dir_is_empty())
@@ -0,0 +1,122 @@
+import json
+import tempfile
+import unittest
+from os import makedirs, unlink, rename
+from os.path import join
+
+from benchmarks.generators import generate_observations
+from processor import reports, watcher
+
+
+def write_report(report_file_path, observations_qty):
+    report = {
+        'from': '10.0.0.1:4500',
+        'message': reports.serialize_observations(generate_observations(observations_qty))
+    }
+    with open(report_file_path, 'w') as report_file:
+        json.dump(report, report_file)
+
+
+class TestReportsWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.installation_dir_path = join(self.working_dir.name, '1', '2')
+        makedirs(self.installation_dir_path)
+        self.current_time = [0]
+        self.dispatched = []
+        self.watcher = watcher.ReportsWatcher(self.working_dir.name,
+                                              lambda *installation: self.dispatched.append(installation),
+                                              minimum_observations_qty=100,
+                                              dispatch_timeout=60,
+                                              clock=lambda: self.current_time[0])
+
+    def tearDown(self):
+        self.working_dir.cleanup()
+
+    def report_file_path(self, index):
+        return join(self.installation_dir_path, 'report-{}.json'.format(index))
+
+    def test_count_report_observations(self):
+        for observations_qty in [0, 1, 2, 3, 60]:
+            write_report(self.report_file_path(0), observations_qty)
+            self.assertEqual(watcher.count_report_observations(self.report_file_path(0)), observations_qty)
+
+    def test_dispatches_installations_over_minimum(self):
+        write_report(self.report_file_path(0), 60)
+        self.watcher.scan()
+        self.assertEqual(self.watcher.dispatch_ready_installations(), [])
+        self.assertEqual(self.watcher.dirty_installations, set())
+        write_report(self.report_file_path(1), 60)
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(self.dispatched, [(self.installation_dir_path, '1', '2')])
+
+    def test_waits_for_dispatched_installation(self):
+        write_report(self.report_file_path(0), 60)
+        write_report(self.report_file_path(1), 60)
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        write_report(self.report_file_path(2), 60)
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(len(self.dispatched), 1)
+        # Once the task deletes a report the installation can be dispatched again
+        unlink(self.report_file_path(0))
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(len(self.dispatched), 2)
+        # Also when the dispatch times out
+        self.current_time[0] = 61
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(len(self.dispatched), 3)
+
+    def test_skips_incomplete_reports(self):
+        with open(self.report_file_path(0), 'w') as report_file:
+            report_file.write('{"message": "AAAA')
+        self.watcher.scan()
+        self.assertEqual(self.watcher.installations[self.installation_dir_path].reports, {})
+        write_report(self.report_file_path(0), 120)
+        self.watcher.scan()
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(len(self.dispatched), 1)
+
+
+@unittest.skipIf(watcher.open_inotify() is None, 'inotify not available')
+class TestInotifyReportsSource(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.dispatched = []
+        self.watcher = watcher.ReportsWatcher(self.working_dir.name,
+                                              lambda *installation: self.dispatched.append(installation),
+                                              minimum_observations_qty=100)
+        self.inotify = watcher.open_inotify()
+        self.source = watcher.InotifyReportsSource(self.watcher, self.inotify)
+
+    def tearDown(self):
+        self.inotify.close()
+        self.working_dir.cleanup()
+
+    def test_tracks_new_directories_and_reports(self):
+        existing_installation_dir_path = join(self.working_dir.name, '1', '1')
+        makedirs(existing_installation_dir_path)
+        write_report(join(existing_installation_dir_path, 'report-0.json'), 60)
+        self.source.start()
+        installation_dir_path = join(self.working_dir.name, '2', '3')
+        makedirs(installation_dir_path)
+        for _ in range(2):
+            self.source.process_events(0.1)
+        temporary_file_path = join(self.working_dir.name, 'report.tmp')
+        write_report(temporary_file_path, 60)
+        rename(temporary_file_path, join(installation_dir_path, 'report-0.json'))
+        write_report(join(installation_dir_path, 'report-1.json'), 60)
+        write_report(join(existing_installation_dir_path, 'report-1.json'), 30)
+        self.source.process_events(0.1)
+        self.watcher.dispatch_ready_installations()
+        self.assertEqual(self.dispatched, [(installation_dir_path, '2', '3')])
+        self.assertEqual(self.watcher.installations[existing_installation_dir_path].observations_qty, 90)
+        unlink(join(installation_dir_path, 'report-0.json'))
+        self.source.process_events(0.1)
+        self.assertEqual(self.watcher.installations[installation_dir_path].observations_qty, 60)